@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+# GGUF file for the in-process backend: a small quantized instruct model,
+# e.g. Qwen2.5-1.5B-Instruct or Phi-3-mini-4k-instruct at Q4_K_M
+LLAMA_MODEL_PATH = os.getenv("LLAMA_MODEL_PATH")
+# Context window of each context (tokens); must hold the prompt and the response
+LLAMA_N_CTX = int(os.getenv("LLAMA_N_CTX", "4096"))
+# CPU threads per context; 0 splits the cores evenly between the contexts
+LLAMA_THREADS = int(os.getenv("LLAMA_THREADS", "0"))
+# Independent llama.cpp contexts, each generating one response at a time. Each
+# has its own KV cache; the weights are memory-mapped, so they're loaded once
+# and shared.
+LLAMA_CONTEXTS = int(os.getenv("LLAMA_CONTEXTS", "2"))
+# KV states of earlier prompt prefixes kept per context, so switching back to
+# a question doesn't re-evaluate its reference answer (bytes; 0 disables)
+LLAMA_PREFIX_CACHE_BYTES = int(os.getenv("LLAMA_PREFIX_CACHE_BYTES", str(512 * 1024 * 1024)))
+# A prompt waiting longer than this is taken next even if another one shares
+# the free context's cached prefix (milliseconds)
+LLAMA_AFFINITY_MAX_WAIT_MS = int(os.getenv("LLAMA_AFFINITY_MAX_WAIT_MS", "2000"))
+
+
+class _Request:
+    __slots__ = ("prompt", "prefix", "future", "queued_at")
+
+    def __init__(self, prompt: str, prefix: str):
+        self.prompt = prompt
+        self.prefix = prefix
+        self.future: Future = Future()
+        self.queued_at = time.monotonic()
+
+
+class LlamaCppContextPool:
+    """Grades on this machine's CPU with llama.cpp instead of a remote endpoint.
+
+    Like HuggingFaceEndpoint it has invoke(prompt) -> str, and it can be called
+    from many threads at once. LLAMA_CONTEXTS worker threads each own a
+    llama.cpp context and take the next queued prompt as soon as they finish
+    one, so a class-sized batch keeps every context busy.
+
+    This is a pool of contexts, not continuous batching. llama-cpp-python's
+    high-level API decodes one sequence per context, so prompts in flight
+    don't share forward passes the way llama-server's --cont-batching does,
+    and every context costs its own KV cache and share of the cores.
+
+    Prompts for the same question share everything before the student's
+    answer. llama.cpp keeps the KV cache for the longest prefix a prompt shares
+    with the previous one, so each worker prefers prompts with the prefix it
+    just evaluated and only has to process the new answer. prefix_of() says
+    where that shared part ends.
+    """
+
+    def __init__(self, model_path: Optional[str] = LLAMA_MODEL_PATH, temperature: float = 0.0,
+                 max_new_tokens: int = 512, prefix_of: Callable[[str], str] = lambda prompt: "",
+                 contexts: int = LLAMA_CONTEXTS, n_ctx: int = LLAMA_N_CTX, threads: int = LLAMA_THREADS,
+                 prefix_cache_bytes: int = LLAMA_PREFIX_CACHE_BYTES,
+                 affinity_max_wait_ms: int = LLAMA_AFFINITY_MAX_WAIT_MS):
+        try:
+            from llama_cpp import Llama, LlamaRAMCache
+        except ImportError as e:
+            raise RuntimeError("GRADING_BACKEND=llama_cpp requires llama-cpp-python (pip install llama-cpp-python)") from e
+        if not model_path:
+            raise ValueError("GRADING_BACKEND=llama_cpp requires LLAMA_MODEL_PATH")
+
+        self.temperature = temperature
+        self.max_new_tokens = max_new_tokens
+        self._prefix_of = prefix_of
+        self._affinity_max_wait = affinity_max_wait_ms / 1000
+        self._pending: List[_Request] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self.completed = 0
+        self.prefix_reuses = 0
+
+        # Load every context up front so warm-up covers it. Each one gets its
+        # share of the cores; llama.cpp's default would give every context
+        # all of them and the contexts would fight over the CPU.
+        contexts = max(1, contexts)
+        threads = threads or max(1, (os.cpu_count() or 1) // contexts)
+        self._models = []
+        for _ in range(contexts):
+            model = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=threads, n_threads_batch=threads,
+                          use_mmap=True, verbose=False)
+            if prefix_cache_bytes:
+                model.set_cache(LlamaRAMCache(capacity_bytes=prefix_cache_bytes))
+            self._models.append(model)
+        self._threads = [
+            threading.Thread(target=self._work, args=(model,), name=f"llama-{i}", daemon=True)
+            for i, model in enumerate(self._models)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def invoke(self, prompt: str) -> str:
+        return self.submit(prompt).result()
+
+    def submit(self, prompt: str) -> Future:
+        request = _Request(prompt, self._prefix_of(prompt))
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The llama.cpp backend has been shut down")
+            self._pending.append(request)
+            self._cond.notify()
+        return request.future
+
+    def stats(self):
+        with self._cond:
+            return {
+                "contexts": len(self._models),
+                "pending": len(self._pending),
+                "completed": self.completed,
+                "prefix_reuses": self.prefix_reuses,
+            }
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            pending, self._pending = self._pending, []
+            self._cond.notify_all()
+        for request in pending:
+            request.future.set_exception(RuntimeError("The llama.cpp backend was shut down"))
+        for thread in self._threads:
+            thread.join()
+
+    def _next(self, last_prefix: Optional[str]) -> Optional[_Request]:
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            oldest = self._pending[0]
+            if last_prefix is not None and time.monotonic() - oldest.queued_at < self._affinity_max_wait:
+                for i, request in enumerate(self._pending):
+                    if request.prefix == last_prefix:
+                        self.prefix_reuses += 1
+                        return self._pending.pop(i)
+            return self._pending.pop(0)
+
+    def _work(self, model):
+        last_prefix = None
+        while True:
+            request = self._next(last_prefix)
+            if request is None:
+                return
+            try:
+                response = model.create_chat_completion(
+                    messages=[{"role": "user", "content": request.prompt}],
+                    temperature=self.temperature,
+                    max_tokens=self.max_new_tokens
+                )
+                text = response["choices"][0]["message"]["content"]
+            except Exception as e:
+                request.future.set_exception(e)
+            else:
+                request.future.set_result(text)
+            last_prefix = request.prefix
+            with self._cond:
+                self.completed += 1
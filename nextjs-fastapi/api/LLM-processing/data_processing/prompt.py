@@ -1,34 +1,131 @@
 import os
+import re
+import json
+import hashlib
+import logging
+import threading
 from dotenv import load_dotenv
 from langchain_huggingface import HuggingFaceEndpoint
 from langchain.prompts import PromptTemplate
 from langchain.evaluation import load_evaluator, EvaluatorType
+from llm_backends import LLAMA_MODEL_PATH
+
+try:
+    from api.metrics import CHARS_PER_TOKEN, count_tokens, span
+except ImportError:
+    # Run on its own (the __main__ block), outside the API package
+    from contextlib import nullcontext as span
+
+    CHARS_PER_TOKEN = 4
+
+    def count_tokens(stage, prompt, completion):
+        pass
 
 load_dotenv(".env")
 
-llm = HuggingFaceEndpoint(
-    repo_id="mistralai/Mistral-7B-Instruct-v0.2",
-    huggingfacehub_api_token=os.getenv('HUGGINGFACE_API_TOKEN'),
-    temperature=0.01,
-    max_length=512
-)
+logger = logging.getLogger(__name__)
 
-def mark_answer(question, max_score, correct_answer, student_answer):
-    try:
-        # Updated Criteria Definitions
-        criteria = {
-            "accuracy": "Provide a numeric score between 0 and 4 for factual correctness and completeness based on the reference answer. Consider whether the student included all key points and explanations.",
-            "clarity": "Provide a numeric score between 0 and 4 for writing clarity, organization, and coherence.",
-            "concepts": "Provide a numeric score between 0 and 4 for the depth of understanding demonstrated. Assess whether the student provides detailed explanations showing insight into the concepts."
+# Model parameters that affect grading output
+MODEL_SETTINGS = {
+    "repo_id": "mistralai/Mistral-7B-Instruct-v0.2",
+    "temperature": 0.01,
+    "max_new_tokens": 512
+}
+
+# Text-generation endpoint to call instead of the hosted repo_id: a dedicated
+# inference endpoint, or the benchmark's stand-in (api/benchmarks/fake_llm.py)
+HF_ENDPOINT_URL = os.getenv("HF_ENDPOINT_URL")
+
+# 'endpoint' calls the HuggingFace endpoint; 'llama_cpp' grades in this
+# process on the CPU with the model at LLAMA_MODEL_PATH (llm_backends.py)
+GRADING_BACKEND = os.getenv("GRADING_BACKEND", "endpoint")
+if GRADING_BACKEND not in ("endpoint", "llama_cpp"):
+    raise ValueError(f"Unknown GRADING_BACKEND: {GRADING_BACKEND}")
+
+# Everything in the evaluation prompt before this label is the same for every
+# student answering a question, so a local backend can reuse its KV cache
+STUDENT_ANSWER_LABEL = "Student's Answer:"
+
+# Send the reference answer as a list of its sentences and clauses instead of
+# the text as written. Off by default: a clause split off from its sentence,
+# or a sentence split at an abbreviation, can change how answers are scored.
+REFERENCE_KEY_POINTS = os.getenv("REFERENCE_KEY_POINTS", "false").lower() == "true"
+
+# Student answers longer than this (estimated tokens) are cut before grading;
+# OCR of a whole exam page can run far past the answer itself. 0 disables.
+ANSWER_TOKEN_BUDGET = int(os.getenv("ANSWER_TOKEN_BUDGET", "1500"))
+
+_llm = None
+_llm_lock = threading.Lock()
+
+def model_settings():
+    """The settings of the model that actually grades, with overrides applied."""
+    if GRADING_BACKEND == "llama_cpp":
+        return {
+            "backend": "llama_cpp",
+            "model": os.path.basename(LLAMA_MODEL_PATH or ""),
+            "temperature": MODEL_SETTINGS["temperature"],
+            "max_new_tokens": MODEL_SETTINGS["max_new_tokens"]
         }
+    if not HF_ENDPOINT_URL:
+        return MODEL_SETTINGS
+    settings = {key: value for key, value in MODEL_SETTINGS.items() if key != "repo_id"}
+    settings["endpoint_url"] = HF_ENDPOINT_URL
+    return settings
 
-        # Step 1: Get evaluation in JSON format
-        evaluation_prompt = PromptTemplate.from_template("""
-You are to evaluate a student's answer to an exam question based on the reference answer provided. Your evaluation should focus on three criteria: accuracy, clarity, and understanding of concepts. For each criterion, provide a numeric score between 0 and 4, and a brief comment explaining the score. Pay close attention to the completeness and depth of the student's answer. If the student misses important details or explanations present in the reference answer, deduct points accordingly.
+def shared_prompt_prefix(prompt_text):
+    """The part of a prompt shared by every answer to the same question."""
+    return prompt_text.partition(STUDENT_ANSWER_LABEL)[0]
 
-Question: {question}
-Reference Answer: {correct_answer}
-Student's Answer: {student_answer}
+def get_llm():
+    """Create the grading backend on first use rather than at import."""
+    global _llm
+    with _llm_lock:
+        if _llm is None:
+            if GRADING_BACKEND == "llama_cpp":
+                from llm_backends import LlamaCppContextPool
+                _llm = LlamaCppContextPool(
+                    temperature=MODEL_SETTINGS["temperature"],
+                    max_new_tokens=MODEL_SETTINGS["max_new_tokens"],
+                    prefix_of=shared_prompt_prefix
+                )
+            else:
+                _llm = HuggingFaceEndpoint(
+                    huggingfacehub_api_token=os.getenv('HUGGINGFACE_API_TOKEN'),
+                    **model_settings()
+                )
+    return _llm
+
+def llm_loaded():
+    return _llm is not None
+
+def shutdown_llm():
+    """Stop a local backend's worker threads; the endpoint client has none."""
+    if hasattr(_llm, "shutdown"):
+        _llm.shutdown()
+
+def invoke_llm(stage, prompt_text):
+    """One LLM call, timed and token-counted under `stage`."""
+    with span(stage):
+        response = get_llm().invoke(prompt_text)
+    count_tokens(stage, prompt_text, response)
+    return response
+
+# 'single' asks for scores and the overall summary in one call and renders the
+# response locally; 'two_stage' keeps the original second formatting call
+GRADING_MODE = os.getenv("GRADING_MODE", "single")
+
+# Updated Criteria Definitions
+criteria = {
+    "accuracy": "Provide a numeric score between 0 and 4 for factual correctness and completeness based on the reference answer. Consider whether the student included all key points and explanations.",
+    "clarity": "Provide a numeric score between 0 and 4 for writing clarity, organization, and coherence.",
+    "concepts": "Provide a numeric score between 0 and 4 for the depth of understanding demonstrated. Assess whether the student provides detailed explanations showing insight into the concepts."
+}
+
+# Instructions come first and the student's answer last, so every answer to a
+# question shares the prompt up to STUDENT_ANSWER_LABEL (see question_prompt)
+evaluation_prompt = PromptTemplate.from_template("""
+You are to evaluate a student's answer to an exam question based on the reference answer provided. Your evaluation should focus on three criteria: accuracy, clarity, and understanding of concepts. For each criterion, provide a numeric score between 0 and 4, and a brief comment explaining the score. Pay close attention to the completeness and depth of the student's answer. If the student misses important details or explanations present in the reference answer, deduct points accordingly.
 
 Please provide your evaluation in the following JSON format:
 {{
@@ -39,43 +136,20 @@ Please provide your evaluation in the following JSON format:
         "accuracy": "<one sentence explaining the accuracy score, focusing on correctness and completeness>",
         "clarity": "<one sentence explaining the clarity score>",
         "concepts": "<one sentence explaining the concepts score, focusing on depth of understanding>"
-    }}
+    }}{overall_field}
 }}
 
 Do not include any additional text outside this JSON format.
+
+Question: {question}
+{reference}
+Student's Answer: {student_answer}
 """)
-        evaluation_response = llm.invoke(evaluation_prompt.format(
-            question=question,
-            correct_answer=correct_answer,
-            student_answer=student_answer
-        ))
 
-        # Step 2: Parse the JSON response
-        import json
+# Extra JSON field requested in single-call mode
+overall_field = ',\n    "overall": "<one sentence overall summary that reflects the scores and comments>"'
 
-        try:
-            eval_result = json.loads(evaluation_response)
-        except json.JSONDecodeError:
-            print("Error parsing JSON response from evaluator.")
-            eval_result = {}
-
-        # Step 3: Extract scores and comments
-        accuracy_score = int(eval_result.get('accuracy', 0))
-        clarity_score = int(eval_result.get('clarity', 0))
-        concepts_score = int(eval_result.get('concepts', 0))
-
-        accuracy_comment = eval_result.get('comments', {}).get('accuracy', '')
-        clarity_comment = eval_result.get('comments', {}).get('clarity', '')
-        concepts_comment = eval_result.get('comments', {}).get('concepts', '')
-
-        # Step 4: Calculate total and scaled scores
-        total_score = accuracy_score + clarity_score + concepts_score
-        max_total_score = 4 * 3  # Each criterion is out of 4
-        scaled_total_score = (total_score / max_total_score) * max_score
-        scaled_total_score = round(scaled_total_score, 2)
-
-        # Step 5: Generate the final grading response
-        prompt = PromptTemplate.from_template("""
+grading_prompt = PromptTemplate.from_template("""
 Based on the evaluation results below, provide a grading response for the student's answer to the question.
 
 Evaluation Results:
@@ -89,36 +163,283 @@ Evaluation Results:
 Your response should follow this format exactly:
 
 Score: {scaled_total_score} out of {max_score}
-Accuracy: {accuracy_comment}
-Clarity: {clarity_comment}
-Understanding: {concepts_comment}
+Accuracy ({accuracy_score}/4): {accuracy_comment}
+Clarity ({clarity_score}/4): {clarity_comment}
+Understanding ({concepts_score}/4): {concepts_comment}
 Overall: [Your overall summary in one sentence that reflects the scores and comments.]
 
 Do not include any other text besides what is specified in this format.
 """)
 
-        grading_response = llm.invoke(prompt.format(
-            accuracy_score=accuracy_score,
-            clarity_score=clarity_score,
-            concepts_score=concepts_score,
-            accuracy_comment=accuracy_comment,
-            clarity_comment=clarity_comment,
-            concepts_comment=concepts_comment,
-            scaled_total_score=scaled_total_score,
-            max_score=max_score
-        ))
+def rubric_hash():
+    """Fingerprint of the criteria and prompt templates; changes when the rubric does."""
+    rubric = json.dumps({
+        "criteria": criteria,
+        "evaluation_prompt": evaluation_prompt.template,
+        "overall_field": overall_field,
+        "grading_prompt": grading_prompt.template,
+        "reference_key_points": REFERENCE_KEY_POINTS
+    }, sort_keys=True)
+    return hashlib.sha256(rubric.encode()).hexdigest()
+
+def grading_settings(mode=None):
+    """Everything besides the answer inputs that determines a grading response."""
+    return {
+        "mode": mode or GRADING_MODE,
+        "model": model_settings(),
+        "rubric": rubric_hash(),
+        "answer_token_budget": ANSWER_TOKEN_BUDGET
+    }
+
+def estimate_tokens(text):
+    """Token count estimate; the same ratio as the LLM token metrics."""
+    return -(-len(text or "") // CHARS_PER_TOKEN)
+
+# Sentence and clause ends, and line breaks, separate reference key points
+_key_point_break = re.compile(r"(?<=[.!?;])\s+|\s*\n\s*")
+# Bullets and numbering teachers already put in front of their points
+_key_point_marker = re.compile(r"^(?:[-*\u2022]|\d+[.)])\s*")
+
+def reference_key_points(correct_answer):
+    """The reference answer split into the points a complete answer covers.
+
+    Nothing is summarized away: the points are the reference's own sentences
+    and clauses, with repeats dropped. Only used with REFERENCE_KEY_POINTS.
+    """
+    points, seen = [], set()
+    for part in _key_point_break.split(correct_answer or ""):
+        point = _key_point_marker.sub("", " ".join(part.split())).rstrip(";").strip()
+        if point and point.lower() not in seen:
+            seen.add(point.lower())
+            points.append(point)
+    return points
 
-        return grading_response
+def prompt_fingerprint(question, correct_answer, mode=None):
+    """Changes whenever the stored prompt for a question would come out different."""
+    inputs = json.dumps({
+        "rubric": rubric_hash(),
+        "mode": mode or GRADING_MODE,
+        "question": question or "",
+        "correct_answer": correct_answer or ""
+    }, sort_keys=True)
+    return hashlib.sha256(inputs.encode()).hexdigest()
 
+def question_prompt(question, correct_answer, mode=None):
+    """The part of grading that only depends on the question, computed once per question.
+
+    prompt_prefix is the evaluation prompt up to the student's answer; grading
+    appends the answer to it, so every answer to the question sends the same
+    leading text and a backend can reuse its cached prefix.
+    """
+    mode = mode or GRADING_MODE
+    key_points = reference_key_points(correct_answer) if REFERENCE_KEY_POINTS else None
+    if key_points is not None:
+        reference = "Reference Answer (key points):\n" + (
+            "\n".join(f"- {point}" for point in key_points) or "- (no reference answer)"
+        )
+    else:
+        reference = f"Reference Answer: {correct_answer or ''}"
+    prompt_prefix = shared_prompt_prefix(evaluation_prompt.format(
+        question=question or "",
+        reference=reference,
+        student_answer="",
+        overall_field=overall_field if mode == "single" else ""
+    ))
+    return {
+        "prompt_prefix": prompt_prefix,
+        "key_points": key_points,
+        "prefix_tokens": estimate_tokens(prompt_prefix),
+        "reference_tokens": estimate_tokens(correct_answer),
+        "prompt_fingerprint": prompt_fingerprint(question, correct_answer, mode)
+    }
+
+def trim_to_token_budget(text, budget=ANSWER_TOKEN_BUDGET):
+    """Cut text to about `budget` tokens at a word boundary, keeping the start."""
+    limit = budget * CHARS_PER_TOKEN
+    if not budget or len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > 0 else limit].rstrip() + " [answer truncated]"
+
+def evaluation_prompt_text(prompt_prefix, student_answer):
+    """A question's stored prefix followed by one student's (trimmed) answer."""
+    return f"{prompt_prefix}{STUDENT_ANSWER_LABEL} {trim_to_token_budget(student_answer or '')}\n"
+
+def mark_answer(question, max_score, correct_answer, student_answer):
+    try:
+        return grade_answer(question, max_score, correct_answer, student_answer)
     except Exception as e:
-        return f"Error during grading: {str(e)}"
+        return f"Error during grading: {type(e).__name__}: {str(e)}"
 
-if __name__ == "__main__":
-    result = mark_answer(
-        question="Why did the Roman Empire fall?",
-        max_score=4,
-        correct_answer="The fall of the Roman Empire was a result of various internal and external factors. Internally, the empire dealt with significant economic challenges, such as heavy taxation and a heavy dependence on slave labor, which hindered technological progress. Politically, weak leadership, ongoing civil wars, and the division of the empire into Eastern and Western halves led to increased instability. Externally, the empire faced growing threats from migrating barbarian groups, including the Visigoths, who sacked Rome in 410 CE, and the Vandals in 455 CE. These combined pressures, along with a weakening military and the rise of the Byzantine Empire in the East, ultimately led to the fall of the Western Roman Empire in 476 CE.",
-        student_answer="The Roman Empire collapsed because of economic issues like taxation and slave labor, political problems including weak leaders and civil wars, and barbarian attacks in 410 CE and 455 CE, ending in 476 CE."
+def grade_answer(question, max_score, correct_answer, student_answer, mode=None, prompt_prefix=None):
+    """Grade an answer, raising on LLM errors so callers can retry.
+
+    prompt_prefix is the question's stored question_prompt() prefix for this
+    mode; without it the prefix is built here.
+    """
+    mode = mode or GRADING_MODE
+    if mode not in ("single", "two_stage"):
+        raise ValueError(f"Unknown grading mode: {mode}")
+    if prompt_prefix is None:
+        prompt_prefix = question_prompt(question, correct_answer, mode)["prompt_prefix"]
+
+    # Step 1: Get evaluation in JSON format
+    evaluation_response = invoke_llm("llm.evaluate", evaluation_prompt_text(prompt_prefix, student_answer))
+
+    # Step 2: Parse the JSON response and score it. An unparseable or truncated
+    # response raises rather than scoring zero, so it's retried, not cached.
+    eval_result = parse_evaluation(evaluation_response)
+    if not isinstance(eval_result, dict):
+        eval_result = {}
+    # An out-of-range or non-numeric score counts as missing
+    missing = [criterion for criterion in criteria if criterion_score(eval_result.get(criterion)) is None]
+    if missing:
+        raise ValueError(f"Evaluator response has no valid score for: {', '.join(missing)}")
+    evaluation = score_evaluation(eval_result, max_score)
+
+    # Step 3: Render the final grading response
+    if mode == "single":
+        return format_grading_response(evaluation)
+
+    return invoke_llm("llm.format", grading_prompt.format(
+        accuracy_score=evaluation["accuracy_score"],
+        clarity_score=evaluation["clarity_score"],
+        concepts_score=evaluation["concepts_score"],
+        accuracy_comment=evaluation["accuracy_comment"],
+        clarity_comment=evaluation["clarity_comment"],
+        concepts_comment=evaluation["concepts_comment"],
+        scaled_total_score=evaluation["scaled_total_score"],
+        max_score=max_score
+    ))
+
+def parse_evaluation(evaluation_response):
+    """Parse the evaluator's JSON, tolerating text around the object."""
+    try:
+        return json.loads(evaluation_response)
+    except json.JSONDecodeError:
+        pass
+
+    start = evaluation_response.find("{")
+    end = evaluation_response.rfind("}")
+    if start != -1 and end > start:
+        try:
+            return json.loads(evaluation_response[start:end + 1])
+        except json.JSONDecodeError:
+            pass
+
+    logger.warning("Could not parse JSON from evaluator response: %.200r", evaluation_response)
+    return {}
+
+def criterion_score(value):
+    """A criterion score as a number from 0 to 4, or None if it isn't one.
+
+    Numeric strings such as "3.5" are accepted; whole numbers come back as int.
+    """
+    if isinstance(value, bool):
+        return None
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not 0 <= score <= 4:  # Also rejects NaN
+        return None
+    return int(score) if score.is_integer() else score
+
+def score_evaluation(eval_result, max_score):
+    """Extract scores and comments and compute the scaled total.
+
+    Missing or invalid criterion scores count as zero; grade_answer() rejects
+    them before they get here.
+    """
+    comments = eval_result.get('comments', {})
+    accuracy_score = criterion_score(eval_result.get('accuracy')) or 0
+    clarity_score = criterion_score(eval_result.get('clarity')) or 0
+    concepts_score = criterion_score(eval_result.get('concepts')) or 0
+
+    # Calculate total and scaled scores
+    total_score = accuracy_score + clarity_score + concepts_score
+    max_total_score = 4 * len(criteria)  # Each criterion is out of 4
+    scaled_total_score = round((total_score / max_total_score) * max_score, 2)
+
+    return {
+        "accuracy_score": accuracy_score,
+        "clarity_score": clarity_score,
+        "concepts_score": concepts_score,
+        "accuracy_comment": comments.get('accuracy', ''),
+        "clarity_comment": comments.get('clarity', ''),
+        "concepts_comment": comments.get('concepts', ''),
+        "overall": eval_result.get('overall', ''),
+        "scaled_total_score": scaled_total_score,
+        "max_score": max_score,
+    }
+
+def format_grading_response(evaluation):
+    """Render the fixed grading template from a scored evaluation."""
+    return (
+        f"Score: {evaluation['scaled_total_score']} out of {evaluation['max_score']}\n"
+        f"Accuracy ({evaluation['accuracy_score']}/4): {evaluation['accuracy_comment']}\n"
+        f"Clarity ({evaluation['clarity_score']}/4): {evaluation['clarity_comment']}\n"
+        f"Understanding ({evaluation['concepts_score']}/4): {evaluation['concepts_comment']}\n"
+        f"Overall: {evaluation['overall']}"
     )
-    print("\nGrading Result:")
-    print(result)
+
+def blank_grading_response(max_score):
+    """The grading response for a submission with no answer in it, made without an LLM call."""
+    comment = "No answer was found in the submission."
+    return format_grading_response(score_evaluation({
+        "comments": {criterion: comment for criterion in criteria},
+        "overall": f"{comment} No points were awarded."
+    }, max_score))
+
+# "Accuracy (3/4): comment" -> criterion label, score, comment
+_criterion_line = re.compile(r"^\s*(accuracy|clarity|understanding)\s*(?:\(\s*([\d.]+)\s*/\s*[\d.]+\s*\))?\s*:\s*(.*)$", re.I)
+# Response labels for the criteria keys
+criterion_labels = {"accuracy": "accuracy", "clarity": "clarity", "understanding": "concepts"}
+
+def parse_grading_response(response):
+    """Read the score, criterion scores and comments back out of a grading response.
+
+    Both modes produce the format_grading_response() layout. Lines that are
+    missing come back as None, so callers can tell an unparseable response
+    from a zero score. criteria maps the criteria keys to their 0-4 scores.
+    """
+    parsed = {"score": None, "max_score": None, "accuracy": None, "clarity": None,
+              "understanding": None, "overall": None, "criteria": {}}
+    for line in response.splitlines():
+        criterion = _criterion_line.match(line)
+        if criterion:
+            label = criterion.group(1).lower()
+            if parsed[label] is None:
+                parsed[label] = criterion.group(3).strip()
+                if criterion.group(2):
+                    try:
+                        parsed["criteria"][criterion_labels[label]] = float(criterion.group(2))
+                    except ValueError:
+                        pass
+            continue
+        label, _, value = line.partition(":")
+        label = label.strip().lower()
+        value = value.strip()
+        if label == "score":
+            score, _, max_score = value.partition(" out of ")
+            try:
+                parsed["score"] = float(score)
+                parsed["max_score"] = float(max_score) if max_score else None
+            except ValueError:
+                pass
+        elif label == "overall" and parsed["overall"] is None:
+            parsed["overall"] = value
+    return parsed
+
+if __name__ == "__main__":
+    # Grade the same answer in both modes so they can be compared
+    for mode in ("single", "two_stage"):
+        result = grade_answer(
+            question="Why did the Roman Empire fall?",
+            max_score=4,
+            correct_answer="The fall of the Roman Empire was a result of various internal and external factors. Internally, the empire dealt with significant economic challenges, such as heavy taxation and a heavy dependence on slave labor, which hindered technological progress. Politically, weak leadership, ongoing civil wars, and the division of the empire into Eastern and Western halves led to increased instability. Externally, the empire faced growing threats from migrating barbarian groups, including the Visigoths, who sacked Rome in 410 CE, and the Vandals in 455 CE. These combined pressures, along with a weakening military and the rise of the Byzantine Empire in the East, ultimately led to the fall of the Western Roman Empire in 476 CE.",
+            student_answer="The Roman Empire collapsed because of economic issues like taxation and slave labor, political problems including weak leaders and civil wars, and barbarian attacks in 410 CE and 455 CE, ending in 476 CE.",
+            mode=mode
+        )
+        print(f"\nGrading Result ({mode}):")
+        print(result)
@@ -0,0 +1,40 @@
+"""Add pdf submission links and listing indexes
+
+Revision ID: 0b7d3e52a4c8
+Revises: f28b6d41c0e5
+Create Date: 2026-10-18 15:48:12.370651
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b7d3e52a4c8'
+down_revision: Union[str, None] = 'f28b6d41c0e5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('pdfs', sa.Column('test_id', sa.Integer(), nullable=True))
+    op.add_column('pdfs', sa.Column('student_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('fk_pdfs_test_id_tests', 'pdfs', 'tests', ['test_id'], ['id'])
+    op.create_foreign_key('fk_pdfs_student_id_students', 'pdfs', 'students', ['student_id'], ['id'])
+    op.create_index(op.f('ix_pdfs_test_id'), 'pdfs', ['test_id'], unique=False)
+    op.create_index(op.f('ix_pdfs_student_id'), 'pdfs', ['student_id'], unique=False)
+    op.create_index('ix_pdfs_upload_date_id', 'pdfs', ['upload_date', 'id'], unique=False)
+    op.create_index('ix_pdfs_test_upload_date_id', 'pdfs', ['test_id', 'upload_date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_pdfs_test_upload_date_id', table_name='pdfs')
+    op.drop_index('ix_pdfs_upload_date_id', table_name='pdfs')
+    op.drop_index(op.f('ix_pdfs_student_id'), table_name='pdfs')
+    op.drop_index(op.f('ix_pdfs_test_id'), table_name='pdfs')
+    op.drop_constraint('fk_pdfs_student_id_students', 'pdfs', type_='foreignkey')
+    op.drop_constraint('fk_pdfs_test_id_tests', 'pdfs', type_='foreignkey')
+    op.drop_column('pdfs', 'student_id')
+    op.drop_column('pdfs', 'test_id')
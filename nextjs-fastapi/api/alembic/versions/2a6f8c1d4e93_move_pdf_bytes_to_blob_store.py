@@ -0,0 +1,85 @@
+"""Move PDF bytes to the blob store
+
+Revision ID: 2a6f8c1d4e93
+Revises: 9d4a7c2e8b15
+Create Date: 2026-10-18 18:03:27.514062
+
+"""
+from typing import Sequence, Union
+import asyncio
+import hashlib
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+
+# api/ is on sys.path (env.py), so the migration writes through the same
+# blob store the app reads from
+from storage import blob_key, get_blob_store
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2a6f8c1d4e93'
+down_revision: Union[str, None] = '9d4a7c2e8b15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+pdfs = sa.table(
+    'pdfs',
+    sa.column('id', sa.String()),
+    sa.column('content', sa.LargeBinary()),
+    sa.column('storage_key', sa.String()),
+    sa.column('content_hash', sa.String()),
+    sa.column('file_size', sa.Integer()),
+)
+
+
+def _store_content(store, content: bytes) -> str:
+    content_hash = hashlib.sha256(content).hexdigest()
+    key = blob_key(content_hash)
+    if not asyncio.run(store.exists(key)):
+        staged = store.staging_dir / f".{uuid.uuid4()}.part"
+        staged.write_bytes(content)
+        asyncio.run(store.put_file(key, staged))
+    return content_hash
+
+
+def upgrade() -> None:
+    if op.get_context().as_sql:
+        raise RuntimeError("Moving PDF bytes to the blob store needs a live database; run this revision online")
+    op.add_column('pdfs', sa.Column('storage_key', sa.String(), nullable=True))
+    op.create_index(op.f('ix_pdfs_storage_key'), 'pdfs', ['storage_key'], unique=False)
+
+    # Copy every stored PDF into the blob store before its column goes; one
+    # row's bytes are held in memory at a time
+    bind = op.get_bind()
+    store = get_blob_store()
+    ids = bind.execute(sa.select(pdfs.c.id).where(pdfs.c.content.isnot(None))).scalars().all()
+    for pdf_id in ids:
+        content = bind.execute(sa.select(pdfs.c.content).where(pdfs.c.id == pdf_id)).scalar()
+        content_hash = _store_content(store, content)
+        bind.execute(pdfs.update().where(pdfs.c.id == pdf_id).values(
+            storage_key=blob_key(content_hash),
+            content_hash=content_hash,
+            file_size=len(content),
+        ))
+
+    # Bytes live in the blob store (or uploads/ for older rows), never in the row
+    op.drop_column('pdfs', 'content')
+
+
+def downgrade() -> None:
+    if op.get_context().as_sql:
+        raise RuntimeError("Moving PDF bytes out of the blob store needs a live database; run this revision online")
+    op.add_column('pdfs', sa.Column('content', sa.LargeBinary(), nullable=True))
+
+    # Put the bytes back in the rows; the blobs are left in the store
+    bind = op.get_bind()
+    store = get_blob_store()
+    rows = bind.execute(sa.select(pdfs.c.id, pdfs.c.storage_key).where(pdfs.c.storage_key.isnot(None))).all()
+    for pdf_id, storage_key in rows:
+        with open(store.local_path(storage_key), "rb") as f:
+            bind.execute(pdfs.update().where(pdfs.c.id == pdf_id).values(content=f.read()))
+
+    op.drop_index(op.f('ix_pdfs_storage_key'), table_name='pdfs')
+    op.drop_column('pdfs', 'storage_key')
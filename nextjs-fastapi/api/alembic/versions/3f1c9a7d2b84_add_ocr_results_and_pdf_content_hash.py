@@ -0,0 +1,37 @@
+"""Add OCR results table and content hash to pdfs
+
+Revision ID: 3f1c9a7d2b84
+Revises: 7e96e067b410
+Create Date: 2026-10-18 09:12:40.118233
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a7d2b84'
+down_revision: Union[str, None] = '7e96e067b410'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('pdfs', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_pdfs_content_hash'), 'pdfs', ['content_hash'], unique=False)
+    op.create_table('ocr_results',
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('text', sa.Text(), nullable=True),
+    sa.Column('words', sa.JSON(), nullable=True),
+    sa.Column('page_count', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('content_hash')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('ocr_results')
+    op.drop_index(op.f('ix_pdfs_content_hash'), table_name='pdfs')
+    op.drop_column('pdfs', 'content_hash')
@@ -0,0 +1,47 @@
+"""Store analytics running sums
+
+Revision ID: 4e7b2c9d1a58
+Revises: b83e5a1f6d27
+Create Date: 2026-10-18 21:02:47.318264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e7b2c9d1a58'
+down_revision: Union[str, None] = 'b83e5a1f6d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rollups have no sums yet; the next save for their test rebuilds them
+    op.add_column('test_stats', sa.Column('score_sum', sa.Float(), nullable=True))
+    op.add_column('test_stats', sa.Column('score_sum_squares', sa.Float(), nullable=True))
+    op.add_column('question_stats', sa.Column('points_sum', sa.Float(), nullable=True))
+    op.add_column('question_stats', sa.Column('correct_count', sa.Integer(), nullable=True))
+    op.add_column('question_stats', sa.Column('accuracy_sum', sa.Float(), nullable=True))
+    op.add_column('question_stats', sa.Column('accuracy_count', sa.Integer(), nullable=True))
+    op.add_column('question_stats', sa.Column('clarity_sum', sa.Float(), nullable=True))
+    op.add_column('question_stats', sa.Column('clarity_count', sa.Integer(), nullable=True))
+    op.add_column('question_stats', sa.Column('concepts_sum', sa.Float(), nullable=True))
+    op.add_column('question_stats', sa.Column('concepts_count', sa.Integer(), nullable=True))
+    op.create_index('ix_test_results_test_score', 'test_results', ['test_id', 'score'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_test_results_test_score', table_name='test_results')
+    op.drop_column('question_stats', 'concepts_count')
+    op.drop_column('question_stats', 'concepts_sum')
+    op.drop_column('question_stats', 'clarity_count')
+    op.drop_column('question_stats', 'clarity_sum')
+    op.drop_column('question_stats', 'accuracy_count')
+    op.drop_column('question_stats', 'accuracy_sum')
+    op.drop_column('question_stats', 'correct_count')
+    op.drop_column('question_stats', 'points_sum')
+    op.drop_column('test_stats', 'score_sum_squares')
+    op.drop_column('test_stats', 'score_sum')
@@ -0,0 +1,42 @@
+"""Make graded answers upsertable
+
+Revision ID: 5c9e1b7a3f60
+Revises: 0b7d3e52a4c8
+Create Date: 2026-10-18 16:31:44.602187
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c9e1b7a3f60'
+down_revision: Union[str, None] = '0b7d3e52a4c8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Grading produces fractional scores
+    op.alter_column('test_results', 'score', type_=sa.Float(), existing_type=sa.Integer())
+    op.alter_column('answers', 'points_earned', type_=sa.Float(), existing_type=sa.Integer())
+    op.add_column('answers', sa.Column('feedback', sa.Text(), nullable=True))
+
+    # The composite lookups become the unique upsert targets
+    op.drop_index('ix_test_results_test_student', table_name='test_results')
+    op.create_index('ix_test_results_test_student', 'test_results', ['test_id', 'student_id'], unique=True)
+    op.drop_index('ix_answers_test_result_question', table_name='answers')
+    op.create_index('ix_answers_test_result_question', 'answers', ['test_result_id', 'question_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_answers_test_result_question', table_name='answers')
+    op.create_index('ix_answers_test_result_question', 'answers', ['test_result_id', 'question_id'], unique=False)
+    op.drop_index('ix_test_results_test_student', table_name='test_results')
+    op.create_index('ix_test_results_test_student', 'test_results', ['test_id', 'student_id'], unique=False)
+
+    op.drop_column('answers', 'feedback')
+    op.alter_column('answers', 'points_earned', type_=sa.Integer(), existing_type=sa.Float())
+    op.alter_column('test_results', 'score', type_=sa.Integer(), existing_type=sa.Float())
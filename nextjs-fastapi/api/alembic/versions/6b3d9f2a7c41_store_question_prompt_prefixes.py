@@ -0,0 +1,36 @@
+"""Store question prompt prefixes
+
+Revision ID: 6b3d9f2a7c41
+Revises: 2a6f8c1d4e93
+Create Date: 2026-10-18 19:02:44.207318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6b3d9f2a7c41'
+down_revision: Union[str, None] = '2a6f8c1d4e93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing questions get these on their next save; until then grading
+    # builds the prefix on the fly
+    op.add_column('questions', sa.Column('prompt_prefix', sa.Text(), nullable=True))
+    op.add_column('questions', sa.Column('key_points', sa.JSON(), nullable=True))
+    op.add_column('questions', sa.Column('prefix_tokens', sa.Integer(), nullable=True))
+    op.add_column('questions', sa.Column('reference_tokens', sa.Integer(), nullable=True))
+    op.add_column('questions', sa.Column('prompt_fingerprint', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('questions', 'prompt_fingerprint')
+    op.drop_column('questions', 'reference_tokens')
+    op.drop_column('questions', 'prefix_tokens')
+    op.drop_column('questions', 'key_points')
+    op.drop_column('questions', 'prompt_prefix')
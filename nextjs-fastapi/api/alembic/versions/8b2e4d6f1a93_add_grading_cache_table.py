@@ -0,0 +1,34 @@
+"""Add grading cache table
+
+Revision ID: 8b2e4d6f1a93
+Revises: 3f1c9a7d2b84
+Create Date: 2026-10-18 11:02:17.530914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2e4d6f1a93'
+down_revision: Union[str, None] = '3f1c9a7d2b84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('grading_cache',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('rubric_hash', sa.String(length=64), nullable=True),
+    sa.Column('response', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_grading_cache_rubric_hash'), 'grading_cache', ['rubric_hash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_grading_cache_rubric_hash'), table_name='grading_cache')
+    op.drop_table('grading_cache')
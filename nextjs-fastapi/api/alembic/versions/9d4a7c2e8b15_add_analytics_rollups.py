@@ -0,0 +1,63 @@
+"""Add analytics rollups
+
+Revision ID: 9d4a7c2e8b15
+Revises: 5c9e1b7a3f60
+Create Date: 2026-10-18 17:12:05.841930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4a7c2e8b15'
+down_revision: Union[str, None] = '5c9e1b7a3f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('answers', sa.Column('accuracy_score', sa.Float(), nullable=True))
+    op.add_column('answers', sa.Column('clarity_score', sa.Float(), nullable=True))
+    op.add_column('answers', sa.Column('concepts_score', sa.Float(), nullable=True))
+    op.create_table('test_stats',
+    sa.Column('test_id', sa.Integer(), nullable=False),
+    sa.Column('result_count', sa.Integer(), nullable=True),
+    sa.Column('max_possible', sa.Float(), nullable=True),
+    sa.Column('mean_score', sa.Float(), nullable=True),
+    sa.Column('min_score', sa.Float(), nullable=True),
+    sa.Column('max_score', sa.Float(), nullable=True),
+    sa.Column('stddev_score', sa.Float(), nullable=True),
+    sa.Column('score_histogram', sa.JSON(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['test_id'], ['tests.id'], ),
+    sa.PrimaryKeyConstraint('test_id')
+    )
+    op.create_table('question_stats',
+    sa.Column('question_id', sa.Integer(), nullable=False),
+    sa.Column('test_id', sa.Integer(), nullable=True),
+    sa.Column('answer_count', sa.Integer(), nullable=True),
+    sa.Column('mean_points', sa.Float(), nullable=True),
+    sa.Column('max_points', sa.Float(), nullable=True),
+    sa.Column('difficulty', sa.Float(), nullable=True),
+    sa.Column('correct_rate', sa.Float(), nullable=True),
+    sa.Column('mean_accuracy', sa.Float(), nullable=True),
+    sa.Column('mean_clarity', sa.Float(), nullable=True),
+    sa.Column('mean_concepts', sa.Float(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['question_id'], ['questions.id'], ),
+    sa.ForeignKeyConstraint(['test_id'], ['tests.id'], ),
+    sa.PrimaryKeyConstraint('question_id')
+    )
+    op.create_index(op.f('ix_question_stats_test_id'), 'question_stats', ['test_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_question_stats_test_id'), table_name='question_stats')
+    op.drop_table('question_stats')
+    op.drop_table('test_stats')
+    op.drop_column('answers', 'concepts_score')
+    op.drop_column('answers', 'clarity_score')
+    op.drop_column('answers', 'accuracy_score')
@@ -0,0 +1,41 @@
+"""Add answer regions table
+
+Revision ID: a61f0c3e9d27
+Revises: e5d83a0c7f16
+Create Date: 2026-10-18 14:22:51.208374
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a61f0c3e9d27'
+down_revision: Union[str, None] = 'e5d83a0c7f16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('answer_regions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('question_id', sa.Integer(), nullable=True),
+    sa.Column('page', sa.Integer(), nullable=True),
+    sa.Column('x0', sa.Float(), nullable=True),
+    sa.Column('y0', sa.Float(), nullable=True),
+    sa.Column('x1', sa.Float(), nullable=True),
+    sa.Column('y1', sa.Float(), nullable=True),
+    sa.Column('single_line', sa.Boolean(), nullable=True),
+    sa.ForeignKeyConstraint(['question_id'], ['questions.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_answer_regions_id'), 'answer_regions', ['id'], unique=False)
+    op.create_index(op.f('ix_answer_regions_question_id'), 'answer_regions', ['question_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_answer_regions_question_id'), table_name='answer_regions')
+    op.drop_index(op.f('ix_answer_regions_id'), table_name='answer_regions')
+    op.drop_table('answer_regions')
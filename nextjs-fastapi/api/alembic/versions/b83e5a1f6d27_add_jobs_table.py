@@ -0,0 +1,42 @@
+"""Add jobs table
+
+Revision ID: b83e5a1f6d27
+Revises: 6b3d9f2a7c41
+Create Date: 2026-10-18 20:14:09.613852
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b83e5a1f6d27'
+down_revision: Union[str, None] = '6b3d9f2a7c41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('jobs',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('stage', sa.String(), nullable=True),
+    sa.Column('result', sa.Text(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('error_type', sa.String(), nullable=True),
+    sa.Column('timings', sa.JSON(), nullable=True),
+    sa.Column('worker', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_jobs_finished_at'), 'jobs', ['finished_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_jobs_finished_at'), table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,28 @@
+"""Add file size and page count to pdfs
+
+Revision ID: c47a19e5d3b2
+Revises: 8b2e4d6f1a93
+Create Date: 2026-10-18 12:26:51.904177
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c47a19e5d3b2'
+down_revision: Union[str, None] = '8b2e4d6f1a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('pdfs', sa.Column('file_size', sa.Integer(), nullable=True))
+    op.add_column('pdfs', sa.Column('page_count', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('pdfs', 'page_count')
+    op.drop_column('pdfs', 'file_size')
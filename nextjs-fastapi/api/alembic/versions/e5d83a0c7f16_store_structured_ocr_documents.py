@@ -0,0 +1,29 @@
+"""Store structured OCR documents
+
+Revision ID: e5d83a0c7f16
+Revises: c47a19e5d3b2
+Create Date: 2026-10-18 13:40:08.662015
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5d83a0c7f16'
+down_revision: Union[str, None] = 'c47a19e5d3b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rows have no document and are re-OCR'd on next use
+    op.add_column('ocr_results', sa.Column('document', sa.JSON(), nullable=True))
+    op.drop_column('ocr_results', 'words')
+
+
+def downgrade() -> None:
+    op.add_column('ocr_results', sa.Column('words', sa.JSON(), nullable=True))
+    op.drop_column('ocr_results', 'document')
@@ -0,0 +1,43 @@
+"""Add grading foreign key indexes
+
+Revision ID: f28b6d41c0e5
+Revises: a61f0c3e9d27
+Create Date: 2026-10-18 15:07:36.914522
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f28b6d41c0e5'
+down_revision: Union[str, None] = 'a61f0c3e9d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_classes_teacher_id'), 'classes', ['teacher_id'], unique=False)
+    op.create_index(op.f('ix_tests_class_id'), 'tests', ['class_id'], unique=False)
+    op.create_index(op.f('ix_questions_test_id'), 'questions', ['test_id'], unique=False)
+    op.create_index(op.f('ix_test_results_test_id'), 'test_results', ['test_id'], unique=False)
+    op.create_index(op.f('ix_test_results_student_id'), 'test_results', ['student_id'], unique=False)
+    op.create_index('ix_test_results_test_student', 'test_results', ['test_id', 'student_id'], unique=False)
+    op.create_index(op.f('ix_answers_test_result_id'), 'answers', ['test_result_id'], unique=False)
+    op.create_index(op.f('ix_answers_question_id'), 'answers', ['question_id'], unique=False)
+    op.create_index('ix_answers_test_result_question', 'answers', ['test_result_id', 'question_id'], unique=False)
+    op.create_index('ix_student_class_association_class_student', 'student_class_association', ['class_id', 'student_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_student_class_association_class_student', table_name='student_class_association')
+    op.drop_index('ix_answers_test_result_question', table_name='answers')
+    op.drop_index(op.f('ix_answers_question_id'), table_name='answers')
+    op.drop_index(op.f('ix_answers_test_result_id'), table_name='answers')
+    op.drop_index('ix_test_results_test_student', table_name='test_results')
+    op.drop_index(op.f('ix_test_results_student_id'), table_name='test_results')
+    op.drop_index(op.f('ix_test_results_test_id'), table_name='test_results')
+    op.drop_index(op.f('ix_questions_test_id'), table_name='questions')
+    op.drop_index(op.f('ix_tests_class_id'), table_name='tests')
+    op.drop_index(op.f('ix_classes_teacher_id'), table_name='classes')
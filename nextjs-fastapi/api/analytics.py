@@ -0,0 +1,295 @@
+# analytics.py
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .database import lock_for_transaction, upsert_insert
+
+# Score histogram buckets, each a tenth of the test's possible score
+HISTOGRAM_BUCKETS = 10
+
+# Criteria averaged per question, from Answer.<criterion>_score
+CRITERIA = ("accuracy", "clarity", "concepts")
+
+# QuestionStats running sums, from which its averages are derived
+QUESTION_SUMS = ("answer_count", "points_sum", "correct_count") + tuple(
+    f"{criterion}_{part}" for criterion in CRITERIA for part in ("sum", "count")
+)
+
+# (old, new) values of a changed row; old is None for a new row
+Change = Tuple[Optional[Any], Any]
+
+
+def score_bucket(score: float, max_possible: float, buckets: int = HISTOGRAM_BUCKETS) -> int:
+    """Histogram bucket of a score: how many bucket thresholds it reaches.
+
+    Written as comparisons so the SQL rebuild, which compares against the
+    same thresholds, puts scores on a boundary in the same bucket.
+    """
+    return sum(score >= threshold for threshold in _bucket_thresholds(max_possible, buckets))
+
+
+def _bucket_thresholds(max_possible: float, buckets: int = HISTOGRAM_BUCKETS) -> List[float]:
+    return [max_possible * i / buckets for i in range(1, buckets)]
+
+
+async def lock_test_stats(db: AsyncSession, test_id: int):
+    """Serialize changes to a test's results and rollups until this transaction ends.
+
+    Saving results takes it before reading the values it replaces, so two
+    concurrent saves apply their changes one after the other.
+    """
+    await lock_for_transaction(db, f"test_stats:{test_id}")
+
+
+async def _question_points(db: AsyncSession, test_id: int) -> Dict[int, Any]:
+    return dict((await db.execute(
+        select(models.Question.id, models.Question.points).where(models.Question.test_id == test_id)
+    )).all())
+
+
+def _test_row(test_id: int, max_possible: float, count: int, total: float, squares: float,
+              low: Optional[float], high: Optional[float], histogram: List[int]) -> Dict[str, Any]:
+    mean = total / count if count else None
+    return {
+        "test_id": test_id,
+        "result_count": count,
+        "max_possible": max_possible,
+        "score_sum": total,
+        "score_sum_squares": squares,
+        "mean_score": mean,
+        "min_score": low if count else None,
+        "max_score": high if count else None,
+        # Sums accumulate rounding error, so a tiny negative variance means zero
+        "stddev_score": math.sqrt(max(squares / count - mean * mean, 0)) if count else None,
+        "score_histogram": histogram,
+        "updated_at": func.now(),
+    }
+
+
+def _question_row(question_id: int, test_id: int, points: Any, sums: Dict[str, float]) -> Dict[str, Any]:
+    count = sums["answer_count"]
+    mean_points = sums["points_sum"] / count if count else None
+    row = {
+        "question_id": question_id,
+        "test_id": test_id,
+        **sums,
+        "mean_points": mean_points,
+        "max_points": points,
+        "difficulty": 1 - mean_points / points if mean_points is not None and points else None,
+        "correct_rate": sums["correct_count"] / count if count else None,
+        "updated_at": func.now(),
+    }
+    for criterion in CRITERIA:
+        scored = sums[f"{criterion}_count"]
+        row[f"mean_{criterion}"] = sums[f"{criterion}_sum"] / scored if scored else None
+    return row
+
+
+async def _store_rollups(db: AsyncSession, test_row: Dict[str, Any], question_rows: List[Dict[str, Any]]):
+    insert = upsert_insert(db, models.TestStats.__table__).values(test_row)
+    await db.execute(insert.on_conflict_do_update(
+        index_elements=["test_id"],
+        set_={name: insert.excluded[name] for name in test_row if name != "test_id"}
+    ))
+    if not question_rows:
+        return
+    insert = upsert_insert(db, models.QuestionStats.__table__).values(question_rows)
+    await db.execute(insert.on_conflict_do_update(
+        index_elements=["question_id"],
+        set_={name: insert.excluded[name] for name in question_rows[0] if name != "question_id"}
+    ))
+
+
+async def refresh_test_stats(db: AsyncSession, test_id: int):
+    """Rebuild a test's rollups from its stored results; runs in the caller's transaction.
+
+    The database aggregates the results, and only the sums come back. Saving
+    results doesn't need this; update_test_stats() applies their changes to
+    the sums. It's for rollups that are missing or out of date, e.g. after
+    question points changed or results were edited by hand.
+    """
+    await lock_test_stats(db, test_id)
+    question_points = await _question_points(db, test_id)
+    max_possible = float(sum(points or 0 for points in question_points.values()))
+
+    score = models.TestResult.score
+    scored = (models.TestResult.test_id == test_id, score.is_not(None))
+    thresholds = _bucket_thresholds(max_possible) if max_possible else []
+    row = (await db.execute(
+        select(
+            func.count(score), func.coalesce(func.sum(score), 0), func.coalesce(func.sum(score * score), 0),
+            func.min(score), func.max(score),
+            # Scores reaching each bucket threshold; differences give the bucket counts
+            *(func.coalesce(func.sum(case((score >= threshold, 1), else_=0)), 0) for threshold in thresholds)
+        ).where(*scored)
+    )).one()
+    count, total, squares, low, high = row[:5]
+    histogram = [0] * HISTOGRAM_BUCKETS
+    if max_possible:
+        reached = [count, *row[5:], 0]
+        histogram = [reached[i] - reached[i + 1] for i in range(HISTOGRAM_BUCKETS)]
+    test_row = _test_row(test_id, max_possible, count, float(total), float(squares), low, high, histogram)
+
+    answer = models.Answer
+    sums = {
+        row.question_id: row._asdict()
+        for row in (await db.execute(
+            select(
+                answer.question_id,
+                func.count(answer.id).label("answer_count"),
+                func.coalesce(func.sum(answer.points_earned), 0).label("points_sum"),
+                func.coalesce(func.sum(case((answer.is_correct.is_(True), 1), else_=0)), 0).label("correct_count"),
+                *(
+                    column
+                    for criterion in CRITERIA
+                    for column in (
+                        func.coalesce(func.sum(getattr(answer, f"{criterion}_score")), 0).label(f"{criterion}_sum"),
+                        func.count(getattr(answer, f"{criterion}_score")).label(f"{criterion}_count"),
+                    )
+                )
+            )
+            .join(models.TestResult, models.TestResult.id == answer.test_result_id)
+            .where(models.TestResult.test_id == test_id)
+            .group_by(answer.question_id)
+        )).all()
+    }
+    question_rows = [
+        _question_row(question_id, test_id, points, {
+            name: float(value) if name.endswith("_sum") else int(value)
+            for name, value in sums.get(question_id, dict.fromkeys(QUESTION_SUMS, 0)).items()
+            if name in QUESTION_SUMS
+        })
+        for question_id, points in question_points.items()
+    ]
+    await _store_rollups(db, test_row, question_rows)
+
+
+def _add_answer(sums: Dict[str, float], answer: Dict[str, Any], sign: int):
+    sums["answer_count"] += sign
+    sums["points_sum"] += sign * (answer["points_earned"] or 0)
+    sums["correct_count"] += sign * bool(answer["is_correct"])
+    for criterion in CRITERIA:
+        score = answer[f"{criterion}_score"]
+        if score is not None:
+            sums[f"{criterion}_sum"] += sign * score
+            sums[f"{criterion}_count"] += sign
+
+
+async def update_test_stats(db: AsyncSession, test_id: int, score_changes: List[Change],
+                            answer_changes: List[Change]):
+    """Apply saved results to a test's rollups; runs in the caller's transaction.
+
+    score_changes are (old, new) TestResult scores and answer_changes
+    (old, new) Answer columns, including question_id. The running sums and
+    histogram counts get the differences, so the work depends on the
+    changes rather than on how many results the test has. The caller must
+    hold lock_test_stats() from before it read the old values.
+
+    Rollups that don't exist yet, predate the running sums or were built
+    for different question points are rebuilt with refresh_test_stats().
+    """
+    question_points = await _question_points(db, test_id)
+    max_possible = float(sum(points or 0 for points in question_points.values()))
+    stats = (await db.execute(
+        select(models.TestStats.__table__).where(models.TestStats.test_id == test_id)
+    )).first()
+    question_ids = {new["question_id"] for _, new in answer_changes} & question_points.keys()
+    question_stats = {
+        row.question_id: row
+        for row in (await db.execute(
+            select(models.QuestionStats.__table__).where(models.QuestionStats.question_id.in_(question_ids))
+        )).all()
+    } if question_ids else {}
+    if (
+        stats is None or stats.score_sum is None or stats.max_possible != max_possible
+        or any(
+            question_id not in question_stats or question_stats[question_id].points_sum is None
+            or question_stats[question_id].max_points != question_points[question_id]
+            for question_id in question_ids
+        )
+    ):
+        await refresh_test_stats(db, test_id)
+        return
+
+    count, total, squares = stats.result_count, stats.score_sum, stats.score_sum_squares
+    low, high = stats.min_score, stats.max_score
+    histogram = list(stats.score_histogram)
+    extreme_removed = False
+    for old, new in score_changes:
+        if old == new:
+            continue
+        if old is not None:
+            count, total, squares = count - 1, total - old, squares - old * old
+            if max_possible:
+                histogram[score_bucket(old, max_possible)] -= 1
+            extreme_removed = extreme_removed or old in (low, high)
+        if new is not None:
+            count, total, squares = count + 1, total + new, squares + new * new
+            if max_possible:
+                histogram[score_bucket(new, max_possible)] += 1
+            low = new if low is None else min(low, new)
+            high = new if high is None else max(high, new)
+    if not count:
+        total = squares = 0.0
+    if extreme_removed:
+        # The next lowest or highest score isn't in the sums; the score index finds it
+        score = models.TestResult.score
+        low, high = (await db.execute(
+            select(func.min(score), func.max(score)).where(models.TestResult.test_id == test_id)
+        )).one()
+    test_row = _test_row(test_id, max_possible, count, total, squares, low, high, histogram)
+
+    sums = {
+        question_id: {name: getattr(row, name) for name in QUESTION_SUMS}
+        for question_id, row in question_stats.items()
+    }
+    for old, new in answer_changes:
+        if new["question_id"] not in sums:
+            continue
+        if old is not None:
+            _add_answer(sums[old["question_id"]], old, -1)
+        _add_answer(sums[new["question_id"]], new, 1)
+    question_rows = [
+        _question_row(question_id, test_id, question_points[question_id], question_sums)
+        for question_id, question_sums in sums.items()
+    ]
+    await _store_rollups(db, test_row, question_rows)
+
+
+# Bookkeeping the read endpoints leave out; answer_count is reported
+_RUNNING_SUMS = {"score_sum", "score_sum_squares", *QUESTION_SUMS} - {"answer_count"}
+
+
+def _columns(row, exclude=()) -> Dict[str, Any]:
+    return {
+        column.name: getattr(row, column.name) for column in row.__table__.columns
+        if column.name not in exclude and column.name not in _RUNNING_SUMS
+    }
+
+
+async def get_test_analytics(db: AsyncSession, test_id: int) -> Optional[Dict[str, Any]]:
+    """A test's stored rollups: two primary-key/index lookups, however many answers exist."""
+    stats = await db.get(models.TestStats, test_id)
+    if stats is None:
+        return None
+    questions = (await db.execute(
+        select(models.QuestionStats)
+        .where(models.QuestionStats.test_id == test_id)
+        .order_by(models.QuestionStats.question_id)
+    )).scalars().all()
+    return {**_columns(stats), "questions": [_columns(question, exclude=("test_id",)) for question in questions]}
+
+
+async def get_class_analytics(db: AsyncSession, class_id: int) -> List[Dict[str, Any]]:
+    """Rollups for every test in a class that has any."""
+    rows = (await db.execute(
+        select(models.TestStats, models.Test.title)
+        .join(models.Test, models.Test.id == models.TestStats.test_id)
+        .where(models.Test.class_id == class_id)
+        .order_by(models.Test.id)
+    )).all()
+    return [{**_columns(stats), "title": title} for stats, title in rows]
@@ -0,0 +1,234 @@
+# corpus.py
+"""Synthetic exam submissions for the benchmarks.
+
+Typed submissions are PDFs with a real text layer; scanned-style ones are the
+same pages rasterized with skew, noise and uneven lighting, saved as
+image-only PDFs so they have to go through OCR. Everything is derived from a
+seed, so a corpus can be regenerated byte for byte.
+"""
+import json
+import random
+from pathlib import Path
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+import pypdfium2 as pdfium
+
+QUESTIONS = [
+    {
+        "question": "Why did the Roman Empire fall?",
+        "teacher_answer": "Economic decline, heavy taxation and reliance on slave labor, weak leadership and "
+                          "civil wars, the split into East and West, and invasions by the Visigoths and Vandals "
+                          "ended the Western Empire in 476 CE.",
+    },
+    {
+        "question": "Explain how photosynthesis converts light into chemical energy.",
+        "teacher_answer": "Chlorophyll absorbs light, which splits water and drives the light reactions that make "
+                          "ATP and NADPH; the Calvin cycle uses them to fix carbon dioxide into glucose.",
+    },
+    {
+        "question": "What is the difference between a stack and a queue?",
+        "teacher_answer": "A stack is last in, first out with push and pop at one end; a queue is first in, "
+                          "first out, adding at the back and removing from the front.",
+    },
+    {
+        "question": "Describe the causes of the First World War.",
+        "teacher_answer": "Militarism, alliances, imperial rivalry and nationalism created tension that the "
+                          "assassination of Archduke Franz Ferdinand in 1914 turned into war.",
+    },
+]
+
+# Filler for student answers, so answers vary in length and wording
+WORDS = (
+    "because the empire economy taxes leaders war army trade light energy water carbon glucose cycle "
+    "stack queue order first last alliance nation conflict therefore however also which result cause "
+    "effect important process reaction structure element example between during after before"
+).split()
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US Letter, in points
+FONT_SIZE = 12
+LINE_HEIGHT = 18
+MARGIN = 72
+CHARS_PER_LINE = 80
+# Scanned-style pages are rasterized at this resolution
+SCAN_DPI = 150
+# JPEG quality of scanned-style pages; scanners and phone apps store pages as JPEG too
+SCAN_JPEG_QUALITY = 80
+
+
+def _escape(text: str) -> bytes:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode("latin-1", "replace")
+
+
+def _wrap(text: str, width: int = CHARS_PER_LINE) -> List[str]:
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def student_answer(rng: random.Random, item: Dict[str, str], words: int) -> str:
+    """Part of the reference answer followed by filler, like a partly right answer."""
+    reference = item["teacher_answer"].split()
+    kept = reference[:rng.randint(len(reference) // 3, len(reference))]
+    return " ".join(kept + [rng.choice(WORDS) for _ in range(words)])
+
+
+def typed_pdf(pages: List[List[str]]) -> bytes:
+    """A PDF with one Helvetica text line per entry, written out directly."""
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")  # Filled in once the page ids are known
+    page_ids = []
+    for lines in pages:
+        ops = [b"BT /F1 %d Tf" % FONT_SIZE]
+        for i, line in enumerate(lines):
+            ops.append(b"1 0 0 1 %d %d Tm (%s) Tj" % (MARGIN, PAGE_HEIGHT - MARGIN - LINE_HEIGHT * i, _escape(line)))
+        ops.append(b"ET")
+        content = b"\n".join(ops)
+        stream = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 %d 0 R >> >> "
+            b"/Contents %d 0 R >>" % (pages_id, PAGE_WIDTH, PAGE_HEIGHT, font, stream)
+        ))
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % page_id for page_id in page_ids), len(page_ids)
+    )
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    return _write_pdf(objects, catalog)
+
+
+def _write_pdf(objects: List[bytes], catalog: int) -> bytes:
+    """Serialize numbered objects (1-based, in order) with their xref table."""
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+def image_pdf(images: List[np.ndarray], dpi: float) -> bytes:
+    """An image-only PDF with one grayscale page image per page, JPEG-compressed like a scan."""
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    pages_id = add(b"")  # Filled in once the page ids are known
+    page_ids = []
+    for image in images:
+        height, width = image.shape
+        ok, jpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, SCAN_JPEG_QUALITY])
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+        data = jpeg.tobytes()
+        xobject = add(
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+            b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n%s\nendstream"
+            % (width, height, len(data), data)
+        )
+        # Page size in points, so the image comes back at `dpi` when rendered
+        page_width, page_height = width * 72 / dpi, height * 72 / dpi
+        content = b"q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q" % (page_width, page_height)
+        stream = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Resources << /XObject << /Im0 %d 0 R >> >> "
+            b"/Contents %d 0 R >>" % (pages_id, page_width, page_height, xobject, stream)
+        ))
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % page_id for page_id in page_ids), len(page_ids)
+    )
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    return _write_pdf(objects, catalog)
+
+
+def scanned_pdf(typed: bytes, rng: random.Random) -> bytes:
+    """Rasterize a typed PDF and degrade it like a phone or copier scan."""
+    pdf = pdfium.PdfDocument(typed)
+    images = []
+    try:
+        for index in range(len(pdf)):
+            page = pdf[index]
+            gray = page.render(scale=SCAN_DPI / 72, grayscale=True).to_numpy()
+            # Older pypdfium2 versions keep a channel axis on grayscale bitmaps
+            gray = (gray[:, :, 0] if gray.ndim == 3 else gray).astype(np.float32)
+            page.close()
+            height, width = gray.shape
+            # Uneven lighting across the page, sensor noise, then a slight skew
+            shading = np.linspace(rng.uniform(-30, 0), rng.uniform(-30, 0), width, dtype=np.float32)
+            gray = gray + shading[None, :]
+            gray += np.random.default_rng(rng.getrandbits(32)).normal(0, 12, gray.shape).astype(np.float32)
+            skew = cv2.getRotationMatrix2D((width / 2, height / 2), rng.uniform(-2.5, 2.5), 1.0)
+            images.append(cv2.warpAffine(np.clip(gray, 0, 255).astype(np.uint8), skew, (width, height),
+                                         flags=cv2.INTER_LINEAR, borderValue=235))
+    finally:
+        pdf.close()
+    return image_pdf(images, SCAN_DPI)
+
+
+def generate_corpus(directory: Path, size: int, pages: int = 2, scanned_ratio: float = 0.5,
+                    seed: int = 0) -> List[Dict[str, Any]]:
+    """Write `size` submissions to `directory` and return their manifest entries."""
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    manifest = []
+    for index in range(size):
+        item = QUESTIONS[index % len(QUESTIONS)]
+        answer = student_answer(rng, item, words=rng.randint(40, 120))
+        lines = [f"Student {index:04d}", f"Q: {item['question']}", ""] + _wrap(answer)
+        # Pad with the kind of working students leave on later pages
+        per_page = (PAGE_HEIGHT - 2 * MARGIN) // LINE_HEIGHT
+        while len(lines) < pages * per_page - per_page // 2:
+            lines.extend(_wrap(" ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 40)))))
+        page_lines = [lines[i * per_page:(i + 1) * per_page] for i in range(pages)]
+
+        kind = "scanned" if rng.random() < scanned_ratio else "typed"
+        data = typed_pdf(page_lines)
+        if kind == "scanned":
+            data = scanned_pdf(data, rng)
+        name = f"submission-{index:04d}-{kind}.pdf"
+        (directory / name).write_bytes(data)
+        manifest.append({
+            "file": name,
+            "kind": kind,
+            "pages": pages,
+            "bytes": len(data),
+            "question": item["question"],
+            "teacher_answer": item["teacher_answer"],
+        })
+    (directory / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+if __name__ == "__main__":
+    # Write a corpus without running the benchmark:
+    #   python -m api.benchmarks.corpus out_dir [size] [pages] [scanned_ratio]
+    import sys
+
+    out = Path(sys.argv[1])
+    entries = generate_corpus(
+        out,
+        size=int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+        pages=int(sys.argv[3]) if len(sys.argv) > 3 else 2,
+        scanned_ratio=float(sys.argv[4]) if len(sys.argv) > 4 else 0.5,
+    )
+    print(f"Wrote {len(entries)} submissions to {out}")
@@ -0,0 +1,121 @@
+# fake_llm.py
+"""A deterministic stand-in for the HuggingFace text-generation endpoint.
+
+Point the API at it with HF_ENDPOINT_URL. It answers the evaluation prompt
+with JSON scores and the two-stage formatting prompt with the filled-in
+template, both derived from a hash of the prompt, so the same submission
+always gets the same grade. Latency is simulated per request.
+
+    python -m api.benchmarks.fake_llm --port 8900 --latency-ms 300 --jitter-ms 100
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+# Marks prompt.grading_prompt, whose response is the template it already contains
+FORMAT_PROMPT_MARKER = "Your response should follow this format exactly:"
+
+
+def _prompt_of(body: bytes) -> str:
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return body.decode("utf-8", "replace")
+    if isinstance(payload, dict):
+        return str(payload.get("inputs") or payload.get("prompt") or "")
+    return str(payload)
+
+
+def generate(prompt: str) -> str:
+    """The completion for `prompt`; identical prompts get identical completions."""
+    rng = random.Random(hashlib.sha256(prompt.encode()).digest())
+    if FORMAT_PROMPT_MARKER in prompt:
+        template = prompt.split(FORMAT_PROMPT_MARKER, 1)[1].split("Do not include", 1)[0].strip()
+        return template.replace(
+            "[Your overall summary in one sentence that reflects the scores and comments.]",
+            "The answer covers the main points with some gaps."
+        )
+    scores = {criterion: rng.randint(1, 4) for criterion in ("accuracy", "clarity", "concepts")}
+    evaluation = {
+        **scores,
+        "comments": {
+            "accuracy": f"Covers {scores['accuracy']} of the 4 key points in the reference.",
+            "clarity": "Organized, with minor lapses." if scores["clarity"] > 2 else "Hard to follow.",
+            "concepts": "Shows reasonable understanding." if scores["concepts"] > 2 else "Mostly restates facts.",
+        },
+    }
+    if '"overall"' in prompt:
+        evaluation["overall"] = "A reasonable answer with room to develop the explanation."
+    return json.dumps(evaluation)
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency_ms: float = 0, jitter_ms: float = 0,
+                 seed: Optional[int] = 0):
+        super().__init__(address, FakeLLMHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.requests = 0
+
+    def delay(self) -> float:
+        with self._rng_lock:
+            self.requests += 1
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+        return max(self.latency_ms + jitter, 0) / 1000
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    server: FakeLLMServer
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(self.server.delay())
+        self._send(200, [{"generated_text": generate(_prompt_of(body))}])
+
+    def do_GET(self):
+        # Health checks from load balancers and the benchmark runner
+        self._send(200, {"status": "ok", "requests": self.server.requests})
+
+    def _send(self, status: int, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_llm(port: int = 0, latency_ms: float = 0, jitter_ms: float = 0,
+                   seed: Optional[int] = 0) -> FakeLLMServer:
+    """Serve on a background thread; port 0 picks a free port (see .url)."""
+    server = FakeLLMServer(("127.0.0.1", port), latency_ms, jitter_ms, seed)
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    args = parser.parse_args()
+    server = FakeLLMServer(("127.0.0.1", args.port), args.latency_ms, args.jitter_ms)
+    print(f"Fake LLM listening on {server.url}")
+    server.serve_forever()
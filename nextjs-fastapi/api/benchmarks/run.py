@@ -0,0 +1,353 @@
+# run.py
+"""End-to-end benchmark: upload -> OCR -> grading against a local API server.
+
+Generates a synthetic corpus, starts the fake LLM and a uvicorn server with a
+throwaway SQLite database and blob store, then drives the server over HTTP:
+
+  upload   POST /api/upload-pdf for every submission
+  ocr      GET /api/pdfs/{id}/ocr/stream, which fills the OCR cache
+  grade    POST /api/process-answer, polling the job until it finishes
+
+Each stage reports latency percentiles, throughput and the server's peak RSS.
+With --baseline the run fails when a stage is slower than the baseline by more
+than --max-regression, so it can gate changes offline.
+
+    cd nextjs-fastapi && python -m api.benchmarks.run --size 40 --output bench.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from .corpus import generate_corpus
+from .fake_llm import start_fake_llm
+
+# Directory uvicorn runs from, so `api.index:app` imports
+PROJECT_DIR = Path(__file__).resolve().parents[2]
+# Seconds between job status polls; bounds the resolution of grading latency
+POLL_INTERVAL = 0.02
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linear-interpolated percentile, q in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class RSSSampler:
+    """Polls a process's resident set size and keeps the peak per stage."""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peaks: Dict[str, int] = {}
+        self.stage = "startup"
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _rss(self) -> Optional[int]:
+        # /proc is Linux only; elsewhere RSS is reported as unknown
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+        return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = self._rss()
+            if rss is not None:
+                self.peaks[self.stage] = max(self.peaks.get(self.stage, 0), rss)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self.pid is not None:
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def request(method: str, url: str, body: Optional[bytes] = None, headers: Optional[Dict[str, str]] = None,
+            timeout: float = 600) -> Tuple[int, bytes]:
+    req = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def post_json(url: str, payload: Dict[str, Any]) -> Tuple[int, Any]:
+    status, body = request("POST", url, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+    return status, json.loads(body or b"null")
+
+
+def run_stage(name: str, items: List[Any], work: Callable[[Any], Dict[str, Any]], concurrency: int,
+              sampler: RSSSampler) -> Dict[str, Any]:
+    """Run work(item) over items with `concurrency` client threads and summarize it."""
+    sampler.stage = name
+    latencies: List[float] = []
+    outcomes: List[Dict[str, Any]] = []
+    errors: List[str] = []
+
+    def timed(item):
+        start = time.perf_counter()
+        try:
+            outcome = work(item)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+            return
+        latencies.append(time.perf_counter() - start)
+        outcomes.append(outcome)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, items))
+    wall = time.perf_counter() - start
+
+    summary = {
+        "count": len(outcomes),
+        "errors": len(errors),
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(outcomes) / wall, 3) if wall else None,
+        "latency_ms": {
+            label: round(value * 1000, 1) if value is not None else None
+            for label, value in (
+                ("p50", percentile(latencies, 50)),
+                ("p90", percentile(latencies, 90)),
+                ("p99", percentile(latencies, 99)),
+                ("max", max(latencies) if latencies else None),
+            )
+        },
+        "peak_rss_mb": round(sampler.peaks[name] / 2 ** 20, 1) if name in sampler.peaks else None,
+        "outcomes": outcomes,
+    }
+    if errors:
+        summary["first_error"] = errors[0]
+    return summary
+
+
+def upload(base_url: str, corpus_dir: Path):
+    def work(entry):
+        data = (corpus_dir / entry["file"]).read_bytes()
+        status, body = request(
+            "POST", f"{base_url}/api/upload-pdf?filename={quote(entry['file'])}", data,
+            {"Content-Type": "application/pdf"}
+        )
+        if status != 200:
+            raise RuntimeError(f"upload returned {status}: {body[:200]!r}")
+        return {"entry": entry, "pdf_id": json.loads(body)["id"], "bytes": len(data)}
+    return work
+
+
+def ocr(base_url: str):
+    def work(uploaded):
+        status, body = request("GET", f"{base_url}/api/pdfs/{uploaded['pdf_id']}/ocr/stream")
+        if status != 200 or b"event: error" in body:
+            raise RuntimeError(f"OCR stream failed ({status}): {body[-200:]!r}")
+        sources: Dict[str, int] = {}
+        for line in body.decode().splitlines():
+            if line.startswith("data: ") and '"page"' in line:
+                page = json.loads(line[len("data: "):])
+                sources[page.get("source", "ocr")] = sources.get(page.get("source", "ocr"), 0) + 1
+        return {"pages": sum(sources.values()), "sources": sources}
+    return work
+
+
+def grade(base_url: str):
+    def work(uploaded):
+        entry = uploaded["entry"]
+        status, job = post_json(f"{base_url}/api/process-answer", {
+            "pdf_id": uploaded["pdf_id"],
+            "question": entry["question"],
+            "teacher_answer": entry["teacher_answer"],
+        })
+        if status != 202:
+            raise RuntimeError(f"process-answer returned {status}: {job}")
+        while True:
+            status, body = request("GET", f"{base_url}/api/jobs/{job['job_id']}")
+            job = json.loads(body)
+            if job["status"] in ("completed", "failed"):
+                break
+            time.sleep(POLL_INTERVAL)
+        if job["status"] == "failed":
+            raise RuntimeError(f"grading job failed: {job['error']}")
+        return {"kind": entry["kind"]}
+    return work
+
+
+def start_server(port: int, workdir: Path, llm_url: str, env_overrides: Dict[str, str]) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{workdir / 'bench.db'}",
+        "STORAGE_BACKEND": "local",
+        "STORAGE_LOCAL_DIR": str(workdir / "blobs"),
+        "HF_ENDPOINT_URL": llm_url,
+        **env_overrides,
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.index:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=PROJECT_DIR, env=env
+    )
+
+
+def wait_until_ready(base_url: str, server: Optional[subprocess.Popen], timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"API server exited with code {server.returncode}")
+        try:
+            status, _ = request("GET", f"{base_url}/api/ready", timeout=5)
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"API server not ready after {timeout:.0f}s")
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Regressions beyond the tolerance, as readable lines."""
+    regressions = []
+    for name, stage in results["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            continue
+        for metric in ("p50", "p99"):
+            now, before = stage["latency_ms"].get(metric), base["latency_ms"].get(metric)
+            if now is not None and before and now > before * (1 + max_regression):
+                regressions.append(f"{name} {metric} latency {before} -> {now} ms")
+        now, before = stage.get("throughput_per_s"), base.get("throughput_per_s")
+        if now is not None and before and now < before * (1 - max_regression):
+            regressions.append(f"{name} throughput {before} -> {now}/s")
+    return regressions
+
+
+def print_report(results: Dict[str, Any]):
+    print(f"\n{'stage':<8} {'n':>5} {'err':>4} {'wall s':>8} {'/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'RSS MB':>8}")
+    for name, stage in results["stages"].items():
+        latency = stage["latency_ms"]
+        print(f"{name:<8} {stage['count']:>5} {stage['errors']:>4} {stage['wall_s']:>8} "
+              f"{stage['throughput_per_s'] or '-':>8} {latency['p50'] or '-':>9} {latency['p99'] or '-':>9} "
+              f"{stage['peak_rss_mb'] or '-':>8}")
+        for key in ("upload_mb_per_s", "pages_per_s", "ocr_pages_per_s"):
+            if key in stage:
+                print(f"{'':<8} {key}: {stage[key]}")
+        if "first_error" in stage:
+            print(f"{'':<8} first error: {stage['first_error']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark upload, OCR and grading end to end.")
+    parser.add_argument("--size", type=int, default=20, help="submissions in the corpus")
+    parser.add_argument("--pages", type=int, default=2, help="pages per submission")
+    parser.add_argument("--scanned-ratio", type=float, default=0.5, help="share of image-only submissions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=4, help="client threads per stage")
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--llm-jitter-ms", type=float, default=50)
+    parser.add_argument("--skip-ocr-stage", action="store_true",
+                        help="leave OCR to the grading jobs, so 'grade' measures the whole pipeline")
+    parser.add_argument("--server-url", help="benchmark a running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="PID of --server-url's process, for RSS")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the started server, e.g. GRADING_WORKERS=4")
+    parser.add_argument("--workdir", type=Path, help="keep the corpus, database and blobs here")
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--baseline", type=Path, help="results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="a-plus-i-bench-"))
+    corpus_dir = workdir / "corpus"
+    manifest = generate_corpus(corpus_dir, args.size, args.pages, args.scanned_ratio, args.seed)
+    print(f"Corpus: {len(manifest)} submissions x {args.pages} pages in {corpus_dir}")
+
+    llm = start_fake_llm(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms, seed=args.seed)
+    server = None
+    if args.server_url:
+        base_url, pid = args.server_url.rstrip("/"), args.server_pid
+    else:
+        overrides = dict(item.split("=", 1) for item in args.env)
+        server = start_server(args.port, workdir, llm.url, overrides)
+        base_url, pid = f"http://127.0.0.1:{args.port}", server.pid
+
+    sampler = RSSSampler(pid)
+    sampler.start()
+    try:
+        started = time.perf_counter()
+        wait_until_ready(base_url, server, args.ready_timeout)
+        startup_s = time.perf_counter() - started
+
+        stages: Dict[str, Any] = {}
+        stages["upload"] = run_stage("upload", manifest, upload(base_url, corpus_dir), args.concurrency, sampler)
+        uploaded = stages["upload"]["outcomes"]
+        stages["upload"]["upload_mb_per_s"] = round(
+            sum(item["bytes"] for item in uploaded) / 2 ** 20 / stages["upload"]["wall_s"], 2
+        ) if stages["upload"]["wall_s"] else None
+
+        if not args.skip_ocr_stage:
+            stages["ocr"] = run_stage("ocr", uploaded, ocr(base_url), args.concurrency, sampler)
+            outcomes = stages["ocr"]["outcomes"]
+            wall = stages["ocr"]["wall_s"]
+            stages["ocr"]["pages_per_s"] = round(sum(o["pages"] for o in outcomes) / wall, 2) if wall else None
+            # Pages that needed the model, as opposed to the PDF's own text layer
+            ocr_pages = sum(o["sources"].get("ocr", 0) for o in outcomes)
+            stages["ocr"]["ocr_pages_per_s"] = round(ocr_pages / wall, 2) if wall else None
+
+        stages["grade"] = run_stage("grade", uploaded, grade(base_url), args.concurrency, sampler)
+    finally:
+        sampler.stop()
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        llm.shutdown()
+
+    for stage in stages.values():
+        stage.pop("outcomes")
+    results = {
+        "config": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "startup_s": round(startup_s, 2),
+        "startup_peak_rss_mb": round(sampler.peaks["startup"] / 2 ** 20, 1) if "startup" in sampler.peaks else None,
+        "llm_requests": llm.requests,
+        "stages": stages,
+    }
+    print(f"Server ready in {results['startup_s']}s (peak RSS {results['startup_peak_rss_mb']} MB), "
+          f"{llm.requests} LLM calls")
+    print_report(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+    failed = any(stage["errors"] for stage in stages.values())
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION: {line}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+# bulk_grading.py
+import asyncio
+import json
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from .metrics import PREGRADE_ANSWERS
+from .pregrade import PreGrader
+
+# Maximum number of LLM calls in flight for one bulk grading run
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+# Maximum number of submissions being OCR'd at once in one bulk grading run;
+# each one holds rendered pages and model activations in memory
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "4"))
+# Retries per answer after the first failed LLM call
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+# Base delay for exponential backoff between retries (seconds)
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "60"))
+# Seconds shutdown waits for detached runs to finish grading and saving
+BULK_SHUTDOWN_TIMEOUT = float(os.getenv("BULK_SHUTDOWN_TIMEOUT", "30"))
+
+# Marks the end of a detached run's results
+_END = object()
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """Whether an LLM client error looks like an HTTP 429 / rate limit."""
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "too many requests" in message
+
+
+def retry_delay(error: Exception, attempt: int, base_delay: float = LLM_RETRY_BASE_DELAY) -> float:
+    """Seconds to wait before retrying after the given failed attempt (1-based)."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    retry_after = headers.get("Retry-After") if hasattr(headers, "get") else None
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+
+    delay = base_delay * (2 ** (attempt - 1))
+    if is_rate_limited(error):
+        # Back off harder when the endpoint is telling us to slow down
+        delay *= 4
+    delay = min(delay, LLM_RETRY_MAX_DELAY)
+    return delay + random.uniform(0, delay / 2)
+
+
+async def to_ndjson(results: AsyncIterator[dict]) -> AsyncIterator[str]:
+    """Encode a stream of result dicts as newline-delimited JSON."""
+    async for result in results:
+        yield json.dumps(result, default=str) + "\n"
+
+
+class BulkGrader:
+    """Grades many submissions with a bounded number of concurrent LLM calls."""
+
+    def __init__(self, concurrency: int = LLM_CONCURRENCY, max_retries: int = LLM_MAX_RETRIES,
+                 base_delay: float = LLM_RETRY_BASE_DELAY, ocr_concurrency: int = OCR_CONCURRENCY):
+        self.concurrency = concurrency
+        self.ocr_concurrency = ocr_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        # LLM clients block, so they get their own threads sized to the concurrency limit
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="llm")
+        # Detached runs still in progress; referenced so they aren't garbage collected
+        self._runs: Set[asyncio.Task] = set()
+
+    async def call_with_retries(self, fn: Callable[..., Any], *args) -> Tuple[Any, int]:
+        """Run a blocking LLM call with retries; return (result, attempts)."""
+        loop = asyncio.get_running_loop()
+        attempt = 1
+        while True:
+            try:
+                return await loop.run_in_executor(self._executor, partial(fn, *args)), attempt
+            except Exception as e:
+                if attempt > self.max_retries:
+                    raise
+                await asyncio.sleep(retry_delay(e, attempt, self.base_delay))
+                attempt += 1
+
+    async def grade(self, submissions: Iterable[Any], load_answer: Callable[[Any], Any],
+                    grade_answer: Callable[[Any], Any],
+                    pregrader: Optional[PreGrader] = None) -> AsyncIterator[dict]:
+        """Grade submissions concurrently, yielding each result as it finishes.
+
+        load_answer(submission) runs in a worker thread (OCR), at most
+        `ocr_concurrency` at a time; grade_answer is the blocking LLM call and
+        is limited to `concurrency` calls at a time.
+
+        With a pregrader, blank answers get its blank_result without an LLM
+        call, and answers identical to one already being graded reuse that
+        grade; their results carry "blank" or "duplicate_of".
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        ocr_semaphore = asyncio.Semaphore(self.ocr_concurrency)
+        loop = asyncio.get_running_loop()
+        # Dedupe key -> (submission id, future of (result, attempts, error)) of the answer graded for it
+        graded: Dict[str, Tuple[Any, asyncio.Future]] = {}
+
+        async def call_llm(answer) -> Tuple[Any, int]:
+            async with semaphore:
+                return await self.call_with_retries(grade_answer, answer)
+
+        async def grade_distinct(submission, answer) -> dict:
+            key = await run_in_threadpool(pregrader.check, submission.id, answer)
+            if key is None:
+                PREGRADE_ANSWERS.labels(outcome="blank").inc()
+                return {"pdf_id": submission.id, "status": "graded", "result": pregrader.blank_result,
+                        "attempts": 0, "blank": True}
+            if key in graded:
+                PREGRADE_ANSWERS.labels(outcome="duplicate").inc()
+                owner, future = graded[key]
+                result, _, error = await asyncio.shield(future)
+                if error is not None:
+                    raise error
+                return {"pdf_id": submission.id, "status": "graded", "result": result, "attempts": 0,
+                        "duplicate_of": owner}
+            PREGRADE_ANSWERS.labels(outcome="distinct").inc()
+            future = loop.create_future()
+            graded[key] = (submission.id, future)
+            try:
+                result, attempts = await call_llm(answer)
+            except Exception as e:
+                future.set_result((None, 0, e))
+                raise
+            future.set_result((result, attempts, None))
+            return {"pdf_id": submission.id, "status": "graded", "result": result, "attempts": attempts}
+
+        async def grade_one(submission) -> dict:
+            try:
+                async with ocr_semaphore:
+                    answer = await run_in_threadpool(load_answer, submission)
+                if pregrader is not None:
+                    return await grade_distinct(submission, answer)
+                result, attempts = await call_llm(answer)
+                return {"pdf_id": submission.id, "status": "graded", "result": result, "attempts": attempts}
+            except Exception as e:
+                return {"pdf_id": submission.id, "status": "failed", "error": str(getattr(e, "detail", None) or e)}
+
+        tasks = [asyncio.create_task(grade_one(submission)) for submission in submissions]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Client went away or the generator was closed early
+            for task in tasks:
+                task.cancel()
+
+    def detach(self, results: AsyncIterator[dict]) -> AsyncIterator[dict]:
+        """Run `results` to the end on its own task and stream what it yields.
+
+        If the reader stops early, for example because the client
+        disconnected, only the stream ends. The run keeps going, so grading
+        that was already paid for still gets saved.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def run():
+            try:
+                async for result in results:
+                    queue.put_nowait(result)
+            except Exception as e:
+                queue.put_nowait(e)
+            finally:
+                queue.put_nowait(_END)
+
+        task = asyncio.create_task(run())
+        self._runs.add(task)
+        task.add_done_callback(self._runs.discard)
+
+        async def stream() -> AsyncIterator[dict]:
+            while True:
+                result = await queue.get()
+                if result is _END:
+                    return
+                if isinstance(result, Exception):
+                    raise result
+                yield result
+
+        return stream()
+
+    async def wait_for_runs(self, timeout: float = BULK_SHUTDOWN_TIMEOUT):
+        """Give detached runs up to `timeout` seconds to finish, then cancel them."""
+        if not self._runs:
+            return
+        _, unfinished = await asyncio.wait(set(self._runs), timeout=timeout)
+        for task in unfinished:
+            task.cancel()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
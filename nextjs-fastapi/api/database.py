@@ -1,5 +1,9 @@
 # database.py
-from sqlalchemy import create_engine
+import hashlib
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -9,9 +13,70 @@ database_url = os.getenv('DATABASE_URL')
 if database_url is None:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-engine = create_engine(database_url)
+# Connections kept open per engine (each worker process has a sync and an async engine)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+# Extra connections allowed under burst load, closed again when returned
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds to wait for a free connection before failing the request
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Recycle connections older than this (seconds) so idle-killed ones aren't reused
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test each connection on checkout; costs a round trip, saves a failed query after restarts
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Server-side limit per statement (milliseconds); 0 disables it. On SQLite it
+# becomes the lock wait timeout instead.
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+# INSERT constructs with ON CONFLICT support, by dialect
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+# Async drivers for the sync URLs DATABASE_URL is written with
+_ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL with its driver swapped for the backend's asyncio driver."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}; set ASYNC_DATABASE_URL")
+    return parsed.set(drivername=f"{backend}+{_ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def _engine_options(url: str, is_async: bool) -> dict:
+    parsed = make_url(url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if parsed.get_backend_name() == "sqlite":
+        if DB_STATEMENT_TIMEOUT_MS:
+            options["connect_args"] = {"timeout": DB_STATEMENT_TIMEOUT_MS / 1000}
+        if parsed.database in (None, "", ":memory:"):
+            # In-memory databases live in one connection; pool settings don't apply
+            return options
+    elif parsed.get_backend_name() == "postgresql" and DB_STATEMENT_TIMEOUT_MS:
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    return options
+
+
+# Sync engine: Alembic, create_all and the OCR/grading worker threads
+engine = create_engine(database_url, **_engine_options(database_url, is_async=False))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine: route handlers, so queries don't block the event loop
+async_url = os.getenv("ASYNC_DATABASE_URL") or async_database_url(database_url)
+async_engine = create_async_engine(async_url, **_engine_options(async_url, is_async=True))
+# Objects stay readable after commit instead of triggering a lazy refresh,
+# which an AsyncSession can't do implicitly
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 # Dependency
@@ -21,3 +86,25 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def upsert_insert(db, table):
+    """Dialect INSERT for `table` that supports on_conflict_do_update/do_nothing."""
+    dialect = db.get_bind().dialect.name
+    if dialect not in _UPSERT_INSERTS:
+        raise RuntimeError(f"Upserts are not supported on {dialect}")
+    return _UPSERT_INSERTS[dialect](table)
+
+async def lock_for_transaction(db: AsyncSession, name: str):
+    """Serialize transactions that lock the same `name` until this one ends.
+
+    PostgreSQL takes a transaction-scoped advisory lock. SQLite allows one
+    writer at a time, so a transaction that writes before it checks is
+    already serialized against other writers and nothing is taken there.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        lock_id = int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], "big", signed=True)
+        await db.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": lock_id})
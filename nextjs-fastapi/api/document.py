@@ -0,0 +1,246 @@
+# document.py
+import base64
+import sys
+from array import array
+from typing import Any, Dict, Iterator, List, Optional
+
+# Separators used when joining recognized words into document text
+WORD_SEPARATOR = " "
+LINE_SEPARATOR = "\n"
+PAGE_SEPARATOR = "\n\n"
+
+DOCUMENT_FORMAT_VERSION = 2
+
+# How a page's text was obtained; stored per page as an index into this tuple
+PAGE_SOURCES = ("ocr", "text")
+
+# Array fields and their typecodes: I = offsets/indexes, f = coordinates/confidences,
+# B = page source
+_WORD_ARRAYS = {"word_start": "I", "word_end": "I", "word_line": "I", "word_conf": "f", "word_box": "f"}
+_LINE_ARRAYS = {"line_first_word": "I", "line_page": "I"}
+_PAGE_ARRAYS = {"page_first_line": "I", "page_start": "I", "page_end": "I", "page_size": "I", "page_source": "B"}
+_ARRAYS = {**_WORD_ARRAYS, **_LINE_ARRAYS, **_PAGE_ARRAYS}
+
+
+def _encode_array(values: array) -> str:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return base64.b64encode(values.tobytes()).decode("ascii")
+
+
+def _decode_array(typecode: str, data: str) -> array:
+    values = array(typecode)
+    values.frombytes(base64.b64decode(data))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class Word:
+    __slots__ = ("_doc", "index")
+
+    def __init__(self, doc: "ExtractedDocument", index: int):
+        self._doc = doc
+        self.index = index
+
+    @property
+    def value(self) -> str:
+        return self._doc.text[self._doc.word_start[self.index]:self._doc.word_end[self.index]]
+
+    @property
+    def offsets(self) -> tuple:
+        return self._doc.word_start[self.index], self._doc.word_end[self.index]
+
+    @property
+    def confidence(self) -> float:
+        return self._doc.word_conf[self.index]
+
+    @property
+    def box(self) -> tuple:
+        """(xmin, ymin, xmax, ymax) relative to the page size."""
+        i = self.index * 4
+        return tuple(self._doc.word_box[i:i + 4])
+
+
+class Line:
+    __slots__ = ("_doc", "index")
+
+    def __init__(self, doc: "ExtractedDocument", index: int):
+        self._doc = doc
+        self.index = index
+
+    def _word_range(self) -> range:
+        doc = self._doc
+        end = doc.line_first_word[self.index + 1] if self.index + 1 < len(doc.line_page) else len(doc.word_start)
+        return range(doc.line_first_word[self.index], end)
+
+    @property
+    def words(self) -> List[Word]:
+        return [Word(self._doc, i) for i in self._word_range()]
+
+    @property
+    def text(self) -> str:
+        words = self._word_range()
+        if not words:
+            return ""
+        return self._doc.text[self._doc.word_start[words[0]]:self._doc.word_end[words[-1]]]
+
+
+class Page:
+    __slots__ = ("_doc", "index")
+
+    def __init__(self, doc: "ExtractedDocument", index: int):
+        self._doc = doc
+        self.index = index
+
+    @property
+    def lines(self) -> List[Line]:
+        doc = self._doc
+        end = doc.page_first_line[self.index + 1] if self.index + 1 < doc.page_count else len(doc.line_page)
+        return [Line(doc, i) for i in range(doc.page_first_line[self.index], end)]
+
+    @property
+    def text(self) -> str:
+        return self._doc.text[self._doc.page_start[self.index]:self._doc.page_end[self.index]]
+
+    @property
+    def size(self) -> tuple:
+        """(height, width) in pixels of the rendered page."""
+        return self._doc.page_size[self.index * 2], self._doc.page_size[self.index * 2 + 1]
+
+    @property
+    def source(self) -> str:
+        """'text' if read from the PDF's text layer, 'ocr' if recognized from pixels."""
+        return PAGE_SOURCES[self._doc.page_source[self.index]]
+
+
+class ExtractedDocument:
+    """OCR output as one text string plus flat arrays describing its structure.
+
+    Words, lines and pages are index ranges into parallel arrays rather than
+    objects, so a document costs a few bytes per word and serializes compactly.
+    Word/Line/Page are thin views created on access.
+    """
+
+    __slots__ = ("text", "source") + tuple(_ARRAYS)
+
+    def __init__(self, text: str = "", source: str = "ocr", **arrays: array):
+        self.text = text
+        self.source = source
+        for name, typecode in _ARRAYS.items():
+            setattr(self, name, arrays.get(name, array(typecode)))
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_first_line)
+
+    @property
+    def word_count(self) -> int:
+        return len(self.word_start)
+
+    @property
+    def pages(self) -> List[Page]:
+        return [Page(self, i) for i in range(self.page_count)]
+
+    def page(self, index: int) -> Page:
+        return Page(self, index)
+
+    def iter_words(self) -> Iterator[Word]:
+        return (Word(self, i) for i in range(self.word_count))
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"version": DOCUMENT_FORMAT_VERSION, "source": self.source}
+        for name in _ARRAYS:
+            data[name] = _encode_array(getattr(self, name))
+        return data
+
+    @classmethod
+    def from_dict(cls, text: str, data: Dict[str, Any]) -> Optional["ExtractedDocument"]:
+        """Rebuild a stored document; None if it was stored in an unknown format."""
+        if not data or data.get("version") not in (1, DOCUMENT_FORMAT_VERSION):
+            return None
+        arrays = {name: _decode_array(typecode, data[name]) for name, typecode in _ARRAYS.items() if name in data}
+        if "page_source" not in arrays:
+            # Version 1 documents were always OCR'd
+            arrays["page_source"] = array("B", bytes(len(arrays["page_first_line"])))
+        return cls(text, data.get("source", "ocr"), **arrays)
+
+
+def _geometry_box(geometry) -> tuple:
+    """Bounding box of a DocTR straight box or rotated polygon."""
+    xs = [float(point[0]) for point in geometry]
+    ys = [float(point[1]) for point in geometry]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def page_record(page) -> tuple:
+    """Reduce a DocTR page to ((height, width), [[(value, confidence, box), ...], ...]).
+
+    Only non-empty lines are kept. The tuple form is small and picklable, so it
+    is also what the OCR server sends back to web workers.
+    """
+    lines = []
+    for block in page.blocks:
+        for line in block.lines:
+            if line.words:
+                lines.append([
+                    (word.value, float(word.confidence), _geometry_box(word.geometry))
+                    for word in line.words
+                ])
+    return tuple(getattr(page, "dimensions", (0, 0))), lines
+
+
+class DocumentBuilder:
+    """Accumulates page_record() tuples and joins the text once in build()."""
+
+    def __init__(self):
+        self._pieces: List[str] = []
+        self._cursor = 0
+        self._arrays = {name: array(typecode) for name, typecode in _ARRAYS.items()}
+
+    @property
+    def page_count(self) -> int:
+        return len(self._arrays["page_first_line"])
+
+    def _append(self, piece: str):
+        self._pieces.append(piece)
+        self._cursor += len(piece)
+
+    def add_record(self, record: tuple, source: str = "ocr") -> str:
+        """Add a page given as a page_record() tuple and return its text."""
+        dimensions, lines = record
+        a = self._arrays
+        if self.page_count:
+            self._append(PAGE_SEPARATOR)
+        page_pieces_start = len(self._pieces)
+        a["page_first_line"].append(len(a["line_page"]))
+        a["page_start"].append(self._cursor)
+        a["page_size"].extend((int(dimensions[0]), int(dimensions[1])))
+        a["page_source"].append(PAGE_SOURCES.index(source))
+
+        for line_number, words in enumerate(lines):
+            if line_number:
+                self._append(LINE_SEPARATOR)
+            line_index = len(a["line_page"])
+            a["line_first_word"].append(len(a["word_start"]))
+            a["line_page"].append(self.page_count - 1)
+            for i, (value, confidence, box) in enumerate(words):
+                if i:
+                    self._append(WORD_SEPARATOR)
+                a["word_start"].append(self._cursor)
+                self._append(value)
+                a["word_end"].append(self._cursor)
+                a["word_line"].append(line_index)
+                a["word_conf"].append(confidence)
+                a["word_box"].extend(box)
+
+        a["page_end"].append(self._cursor)
+        return "".join(self._pieces[page_pieces_start:])
+
+    def build(self, source: Optional[str] = None) -> ExtractedDocument:
+        """Join the pages into a document; source defaults to its pages' common source or 'mixed'."""
+        if source is None:
+            sources = set(self._arrays["page_source"])
+            source = PAGE_SOURCES[sources.pop()] if len(sources) == 1 else ("mixed" if sources else "ocr")
+        return ExtractedDocument("".join(self._pieces), source, **self._arrays)
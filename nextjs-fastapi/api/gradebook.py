@@ -0,0 +1,108 @@
+# gradebook.py
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+
+from . import models
+
+
+def gradebook_options():
+    """Loader options that fetch a class's roster, tests, questions, results and
+    answers with one SELECT ... IN query per relationship."""
+    return (
+        selectinload(models.Class.students),
+        selectinload(models.Class.tests).selectinload(models.Test.questions),
+        selectinload(models.Class.tests)
+        .selectinload(models.Test.test_results)
+        .selectinload(models.TestResult.answers),
+    )
+
+
+async def load_class_gradebook(db: AsyncSession, class_id: int) -> Optional[models.Class]:
+    """Load a class with everything its gradebook shows, in a fixed number of queries."""
+    return await db.get(models.Class, class_id, options=gradebook_options())
+
+
+async def load_student_results(db: AsyncSession, student_id: int):
+    """A student's results with their test joined in and answers loaded alongside."""
+    return (await db.execute(
+        select(models.TestResult)
+        .options(
+            # Many-to-one: one row per result, so a join doesn't multiply rows
+            joinedload(models.TestResult.test),
+            selectinload(models.TestResult.answers),
+        )
+        .where(models.TestResult.student_id == student_id)
+        .order_by(models.TestResult.submitted_at)
+    )).scalars().all()
+
+
+def student_results_to_dict(results) -> list:
+    return [
+        {
+            "result_id": result.id,
+            "test_id": result.test_id,
+            "test_title": result.test.title if result.test else None,
+            "score": result.score,
+            "submitted_at": result.submitted_at,
+            "answers": [_answer_dict(answer) for answer in result.answers]
+        }
+        for result in results
+    ]
+
+
+def _answer_dict(answer: models.Answer) -> Dict[str, Any]:
+    return {
+        "question_id": answer.question_id,
+        "points_earned": answer.points_earned,
+        "is_correct": answer.is_correct
+    }
+
+
+def gradebook_to_dict(class_: models.Class) -> Dict[str, Any]:
+    """Shape a class loaded by load_class_gradebook() as students x tests.
+
+    Only touches relationships the loader options already populated, so no
+    further queries are issued.
+    """
+    tests = sorted(class_.tests, key=lambda test: test.id)
+    results: Dict[int, list] = {student.id: [] for student in class_.students}
+    for test in tests:
+        for result in test.test_results:
+            if result.student_id not in results:
+                # Result from a student no longer on the roster
+                continue
+            results[result.student_id].append({
+                "result_id": result.id,
+                "test_id": test.id,
+                "score": result.score,
+                "submitted_at": result.submitted_at,
+                "answers": [_answer_dict(answer) for answer in result.answers]
+            })
+
+    return {
+        "class": {"id": class_.id, "name": class_.name},
+        "tests": [
+            {
+                "id": test.id,
+                "title": test.title,
+                "max_score": sum(question.points or 0 for question in test.questions),
+                "questions": [
+                    {"id": question.id, "points": question.points}
+                    for question in sorted(test.questions, key=lambda question: question.id)
+                ]
+            }
+            for test in tests
+        ],
+        "students": [
+            {
+                "id": student.id,
+                "full_name": student.full_name,
+                "email": student.email,
+                "results": results[student.id]
+            }
+            for student in sorted(class_.students, key=lambda student: student.id)
+        ]
+    }
@@ -0,0 +1,171 @@
+# grading_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from . import models
+
+# Number of grading responses kept in memory per process
+GRADING_CACHE_SIZE = int(os.getenv("GRADING_CACHE_SIZE", "2048"))
+# Seconds before a cached response is regraded; 0 keeps entries until invalidated
+GRADING_CACHE_TTL = int(os.getenv("GRADING_CACHE_TTL", "0"))
+
+
+def _normalize(text: Any) -> str:
+    """Collapse whitespace so formatting-only differences share a cache entry."""
+    return " ".join(str(text or "").split())
+
+
+def make_cache_key(question: str, max_score: Any, correct_answer: str,
+                   student_answer: str, settings: Dict[str, Any]) -> str:
+    """SHA-256 of the normalized grading inputs and model/rubric settings."""
+    payload = json.dumps({
+        "question": _normalize(question),
+        "max_score": max_score,
+        "correct_answer": _normalize(correct_answer),
+        "student_answer": _normalize(student_answer),
+        "settings": settings
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    if value is None:
+        return time.time()
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class GradingCache:
+    """LRU of grading responses in memory, backed by the grading_cache table."""
+
+    def __init__(self, session_factory: Callable, max_entries: int = GRADING_CACHE_SIZE,
+                 ttl: int = GRADING_CACHE_TTL):
+        self._session_factory = session_factory
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries: "OrderedDict[str, tuple[str, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _expired(self, stored_at: float) -> bool:
+        return self._ttl > 0 and time.time() - stored_at > self._ttl
+
+    def _remember(self, key: str, response: str, rubric_hash: str, stored_at: float):
+        with self._lock:
+            self._entries[key] = (response, rubric_hash, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not self._expired(entry[2]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+
+        db = self._session_factory()
+        try:
+            row = db.get(models.GradingCacheEntry, key)
+            if row is None:
+                return None
+            stored_at = _timestamp(row.created_at)
+            if self._expired(stored_at):
+                db.delete(row)
+                db.commit()
+                return None
+            self._remember(key, row.response, row.rubric_hash, stored_at)
+            with self._lock:
+                self.db_hits += 1
+            return row.response
+        finally:
+            db.close()
+
+    def put(self, key: str, response: str, rubric_hash: str):
+        now = datetime.now(timezone.utc)
+        self._remember(key, response, rubric_hash, now.timestamp())
+        db = self._session_factory()
+        try:
+            db.merge(models.GradingCacheEntry(
+                key=key,
+                rubric_hash=rubric_hash,
+                response=response,
+                created_at=now
+            ))
+            db.commit()
+        except IntegrityError:
+            # Another worker stored the same key first
+            db.rollback()
+        finally:
+            db.close()
+
+    def get_or_grade(self, key: str, rubric_hash: str, grade: Callable[[], str]) -> str:
+        """Return the cached response for key, or grade and store it.
+
+        Nothing is stored if grade() raises; grade_answer() raises for
+        evaluator output it can't parse, so a bad generation isn't kept.
+        """
+        response = self.get(key)
+        if response is not None:
+            return response
+        with self._lock:
+            self.misses += 1
+        response = grade()
+        self.put(key, response, rubric_hash)
+        return response
+
+    def invalidate(self, rubric_hash: Optional[str] = None, keep_rubric_hash: Optional[str] = None) -> int:
+        """Drop entries for one rubric, all but one rubric, or everything.
+
+        Returns the number of database rows removed.
+        """
+        def matches(entry_rubric: str) -> bool:
+            if rubric_hash is not None:
+                return entry_rubric == rubric_hash
+            if keep_rubric_hash is not None:
+                return entry_rubric != keep_rubric_hash
+            return True
+
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if matches(entry[1])]:
+                del self._entries[key]
+
+        db = self._session_factory()
+        try:
+            query = db.query(models.GradingCacheEntry)
+            if rubric_hash is not None:
+                query = query.filter(models.GradingCacheEntry.rubric_hash == rubric_hash)
+            elif keep_rubric_hash is not None:
+                query = query.filter(models.GradingCacheEntry.rubric_hash != keep_rubric_hash)
+            removed = query.delete(synchronize_session=False)
+            db.commit()
+            return removed
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.db_hits + self.misses
+            return {
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "ttl": self._ttl
+            }
@@ -1,29 +1,122 @@
 import os
-import shutil
+import sys
+import hmac
+import json
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import List
-from fastapi import FastAPI, File, UploadFile, Depends, HTTPException
+from typing import AsyncIterator, Dict, List, Optional
+from urllib.parse import quote
+from fastapi import FastAPI, Header, Request, Response, Depends, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from .database import engine, get_db
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from .database import async_engine, engine, get_async_db, lock_for_transaction, SessionLocal
 from . import models
+from .jobs import Job, JobQueue, QueueFullError
+from .ocr import (
+    API_WORKER_ROLE, OCR_SERVICE_TOKEN, extract_document, extract_region_answers, iter_page_text, ocr_model_loaded,
+    ocr_runs_locally, shutdown_ocr, warm_up_ocr
+)
+from .bulk_grading import BulkGrader, to_ndjson
+from .pregrade import PreGrader, is_blank_answer, min_answer_words
+from .grading_cache import GradingCache, make_cache_key
+from .analytics import get_class_analytics, get_test_analytics, refresh_test_stats
+from .question_prompts import question_prompt_prefix
+from .results import RESULTS_BATCH_SIZE, graded_answer, save_graded_answers
+from .gradebook import gradebook_to_dict, load_class_gradebook, load_student_results, student_results_to_dict
+from .uploads import UploadRejected, receive_pdf_upload
+from .metrics import MetricsMiddleware, add_collector, instrument_engine, render_metrics, span
+from .storage import BlobNotFound, InvalidRange, blob_key, get_blob_store, parse_range
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, decode_cursor, encode_cursor
 from pydantic import BaseModel
-from doctr.io import DocumentFile
-from doctr.models import ocr_predictor
 import uuid
-    
-# Create uploads directory if it doesn't exist
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
 
-# Initialize DocTR model
-model = ocr_predictor('db_resnet50', 'crnn_vgg16_bn', pretrained=True, assume_straight_pages=False)
+# Local directory or S3-compatible bucket holding the uploaded PDFs
+blob_store = get_blob_store()
+
+# prompt.py lives with the LLM experiments rather than in this package
+sys.path.append(str(Path(__file__).resolve().parent / "LLM-processing" / "data_processing"))
+
+# Load models at startup instead of on the first request
+WARM_UP_MODELS = os.getenv("WARM_UP_MODELS", "true").lower() == "true"
+warm_up_state = {"status": "pending" if WARM_UP_MODELS else "skipped", "error": None}
+
+def warm_up():
+    """Load the OCR model and LLM client so the first request doesn't pay for it."""
+    warm_up_state["status"] = "running"
+    try:
+        if ocr_runs_locally():
+            warm_up_ocr()
+        from prompt import get_llm
+        get_llm()
+        warm_up_state["status"] = "done"
+    except Exception as e:
+        warm_up_state["status"] = "failed"
+        warm_up_state["error"] = str(e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create database tables
+    await run_in_threadpool(models.Base.metadata.create_all, bind=engine)
+    # Warm up in the background so the worker starts serving immediately;
+    # /api/ready reports when it's done
+    warm_up_task = asyncio.create_task(run_in_threadpool(warm_up)) if WARM_UP_MODELS else None
+    yield
+    if warm_up_task:
+        warm_up_task.cancel()
+    job_queue.shutdown()
+    await bulk_grader.wait_for_runs()
+    bulk_grader.shutdown()
+    shutdown_ocr()
+    if "prompt" in sys.modules:
+        sys.modules["prompt"].shutdown_llm()
+    await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# Background workers for OCR and grading so requests don't block the event loop
+# Job status goes to the database, so any worker can report on any job
+job_queue = JobQueue(SessionLocal)
+bulk_grader = BulkGrader()
+grading_cache = GradingCache(SessionLocal)
 
-app = FastAPI()
+# Time every query on both engines as the "db" stage
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+def pipeline_metrics():
+    """Values owned by the queue, cache and pool, read at scrape time."""
+    queue = job_queue.stats()
+    cache = grading_cache.stats()
+    jobs = GaugeMetricFamily("grading_jobs", "Background jobs by state", labels=["state"])
+    jobs.add_metric(["queued"], queue["queued"])
+    jobs.add_metric(["running"], queue["running"])
+    lookups = CounterMetricFamily("grading_cache_lookups", "Grading cache lookups by outcome", labels=["result"])
+    for result, key in (("hit", "hits"), ("db_hit", "db_hits"), ("miss", "misses")):
+        lookups.add_metric([result], cache[key])
+    families = [
+        jobs,
+        GaugeMetricFamily("grading_job_workers", "Background job worker threads", value=queue["workers"]),
+        lookups,
+        GaugeMetricFamily("grading_cache_entries", "Grading responses held in memory", value=cache["entries"]),
+    ]
+    # Pools without checkout tracking (SQLite in-memory) are skipped
+    checked_out = getattr(async_engine.pool, "checkedout", None)
+    if checked_out:
+        families.append(GaugeMetricFamily("db_pool_checked_out", "Async engine connections in use", value=checked_out()))
+    return families
+
+add_collector(pipeline_metrics)
+
+# Request timing, and the Server-Timing breakdown for requests sending X-Profile
+app.add_middleware(MetricsMiddleware)
 
 # Add CORS middleware
 app.add_middleware(
@@ -32,162 +125,740 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Content-Range", "Accept-Ranges", "Server-Timing"],
 )
 
 class PDFResponse(BaseModel):
     id: str
     filename: str
     upload_date: datetime
-    file_path: str
+    storage_key: Optional[str] = None
+    file_path: Optional[str] = None
+    content_hash: Optional[str] = None
+    file_size: Optional[int] = None
+    page_count: Optional[int] = None
+    test_id: Optional[int] = None
+    student_id: Optional[int] = None
 
     class Config:
         from_attributes = True
 
+class UploadResponse(PDFResponse):
+    duplicate_of: Optional[str] = None  # Earlier upload with identical bytes
+
 class ProcessRequest(BaseModel):
     pdf_id: str
     question: str
     teacher_answer: str
 
-def save_upload_file(upload_file: UploadFile) -> tuple[str, str]:
-    """Save an uploaded file and return its ID and file path."""
-    # Generate unique ID and filename
-    file_id = str(uuid.uuid4())
-    file_extension = os.path.splitext(upload_file.filename)[1]
-    file_path = UPLOAD_DIR / f"{file_id}{file_extension}"
-    
-    # Save file
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(upload_file.file, buffer)
-    
-    return file_id, str(file_path)
+class BulkGradeRequest(BaseModel):
+    question_id: int
+    pdf_ids: List[str]
+
+class AnswerRegionRequest(BaseModel):
+    question_id: int
+    page: int = 0
+    # Box relative to the page size: 0,0 is the top left, 1,1 the bottom right
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    single_line: bool = False
 
-def extract_text_from_pdf(file_path: str) -> str:
-    """Extract text from PDF using DocTR."""
+    class Config:
+        from_attributes = True
+
+class AnswerRegionResponse(AnswerRegionRequest):
+    id: int
+
+@app.post(
+    "/api/upload-pdf",
+    response_model=UploadResponse,
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "file": {"type": "string", "format": "binary"},
+                            "test_id": {"type": "integer"},
+                            "student_id": {"type": "integer"}
+                        },
+                        "required": ["file"]
+                    }
+                },
+                "application/pdf": {"schema": {"type": "string", "format": "binary"}}
+            },
+            "required": True
+        }
+    }
+)
+async def upload_pdf(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Upload a PDF file and store its information.
+
+    The body is streamed to a staging file as it arrives, hashed and
+    size-checked on the way, then moved into the blob store under a key
+    derived from its hash. Send multipart/form-data with a `file` field, or a raw application/pdf
+    body with a `filename` query parameter. `test_id` and `student_id` link
+    the submission and may be sent as form fields or query parameters. Bytes
+    identical to an earlier upload reuse the stored blob and report it in
+    `duplicate_of`.
+    """
     try:
-        # Load and process the PDF
-        pdf_doc = DocumentFile.from_pdf(file_path)
-        result = model(pdf_doc)
-        
-        # Extract text from all pages
-        full_text = ""
-        for page in result.pages:
-            for block in page.blocks:
-                for line in block.lines:
-                    for word in line.words:
-                        full_text += word.value + " "
-        
-        return full_text.strip()
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error extracting text from PDF: {str(e)}"
-        )
+        upload = await receive_pdf_upload(request, blob_store.staging_dir)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-@app.post("/api/upload-pdf", response_model=PDFResponse)
-async def upload_pdf(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    """Upload a PDF file and store its information."""
-    if not file.filename.lower().endswith('.pdf'):
-        raise HTTPException(
-            status_code=400,
-            detail="Only PDF files are allowed"
-        )
-    
+    writer = upload.writer
+    links = {}
+    for name in ("test_id", "student_id"):
+        value = upload.fields.get(name) or request.query_params.get(name)
+        if value:
+            try:
+                links[name] = int(value)
+            except ValueError:
+                writer.abort()
+                raise HTTPException(status_code=422, detail=f"{name} must be an integer")
+    file_id = str(uuid.uuid4())
+    storage_key = blob_key(writer.content_hash)
+    stored = False
     try:
-        # Save file and get its ID and path
-        file_id, file_path = save_upload_file(file)
-        
+        # The row is written before the blob is checked, in a transaction that
+        # a delete of the same blob waits for, so the delete either sees this
+        # row and keeps the blob or finishes first and this upload rewrites it
+        await lock_for_transaction(db, storage_key)
+        duplicate = (await db.execute(
+            select(models.PDF.id).where(models.PDF.storage_key == storage_key).limit(1)
+        )).scalar()
+
         # Create database record
         new_pdf = models.PDF(
             id=file_id,
-            filename=file.filename,
-            file_path=file_path,
-            upload_date=datetime.utcnow()
+            filename=upload.filename,
+            storage_key=storage_key,
+            upload_date=datetime.utcnow(),
+            content_hash=writer.content_hash,
+            file_size=writer.size,
+            page_count=writer.page_count,
+            **links
         )
         db.add(new_pdf)
-        db.commit()
-        db.refresh(new_pdf)
-        
-        return new_pdf
-    
+        await db.flush()
+
+        if await blob_store.exists(storage_key):
+            # Same bytes are already stored; keep one copy
+            writer.abort()
+        else:
+            await blob_store.put_file(storage_key, writer.temp_path)
+            stored = True
+        await db.commit()
+        await db.refresh(new_pdf)
+
+        response = UploadResponse.model_validate(new_pdf)
+        response.duplicate_of = duplicate
+        return response
+
     except Exception as e:
-        # Clean up file if database operation fails
-        if 'file_path' in locals():
-            Path(file_path).unlink(missing_ok=True)
-        db.rollback()
+        # Clean up the blob if database operation fails
+        writer.abort()
+        await db.rollback()
+        if stored:
+            await delete_blob_if_unused(db, storage_key)
+            await db.commit()
         raise HTTPException(
             status_code=500,
             detail=f"Error uploading file: {str(e)}"
         )
 
-@app.post("/api/process-answer")
+def stored_pdf_path(storage_key: Optional[str], file_path: Optional[str]) -> str:
+    """A file on this node with a PDF's bytes; blocks while an S3 blob downloads.
+
+    Rows uploaded before the blob store point at a local file instead of a key.
+    """
+    if storage_key:
+        with span("storage.fetch"):
+            return blob_store.local_path(storage_key)
+    if not file_path or not os.path.exists(file_path):
+        raise BlobNotFound(file_path)
+    return file_path
+
+async def pdf_is_stored(pdf: models.PDF) -> bool:
+    if pdf.storage_key:
+        return await blob_store.exists(pdf.storage_key)
+    return bool(pdf.file_path) and os.path.exists(pdf.file_path)
+
+async def delete_blob_if_unused(db: AsyncSession, storage_key: str):
+    """Delete a blob unless another upload of the same bytes still references it.
+
+    Call it in the transaction that removed the reference, before committing:
+    the lock keeps an upload of the same bytes from adding a reference between
+    the check and the delete.
+    """
+    await lock_for_transaction(db, storage_key)
+    query = select(models.PDF.id).where(models.PDF.storage_key == storage_key)
+    if not (await db.execute(query.limit(1))).scalar():
+        await blob_store.delete(storage_key)
+
+def grade_with_cache(question: str, max_score: int, correct_answer: str, student_answer: str,
+                     prompt_prefix: Optional[str] = None) -> str:
+    """Grade an answer, reusing the stored response for identical inputs.
+
+    prompt_prefix is the question's stored prefix (question_prompt_prefix),
+    for questions saved in the database.
+    """
+    from prompt import grade_answer, grading_settings
+    settings = grading_settings()
+    key = make_cache_key(question, max_score, correct_answer, student_answer, settings)
+    with span("grading"):
+        return grading_cache.get_or_grade(
+            key,
+            settings["rubric"],
+            lambda: grade_answer(
+                question=question,
+                max_score=max_score,
+                correct_answer=correct_answer,
+                student_answer=student_answer,
+                prompt_prefix=prompt_prefix
+            )
+        )
+
+def grade_pdf_answer(job: Job, storage_key: Optional[str], file_path: Optional[str],
+                     content_hash: Optional[str], question: str, teacher_answer: str) -> str:
+    """Run OCR and grading for one submission. Executed on a job worker."""
+    job.stage = "ocr"
+    document = extract_document(stored_pdf_path(storage_key, file_path), content_hash)
+
+    job.stage = "grading"
+    # Free-form questions have no type, so only an answer with no words is blank
+    if is_blank_answer(document.text, question, min_answer_words(None)):
+        from prompt import blank_grading_response
+        return blank_grading_response(4)
+    return grade_with_cache(question, 4, teacher_answer, document.text)
+
+@app.post("/api/process-answer", status_code=202)
 async def process_answer(
     request: ProcessRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Process a student's PDF answer."""
+    """Queue a student's PDF answer for OCR and grading."""
+    # Get the PDF record from database
+    pdf = await db.get(models.PDF, request.pdf_id)
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+
+    # Check if file exists
+    if not await pdf_is_stored(pdf):
+        raise HTTPException(
+            status_code=404,
+            detail="PDF file not found on server"
+        )
+
     try:
-        # Get the PDF record from database
-        pdf = db.query(models.PDF).filter(models.PDF.id == request.pdf_id).first()
-        if not pdf:
-            raise HTTPException(status_code=404, detail="PDF not found")
+        job = await run_in_threadpool(
+            job_queue.submit,
+            "process-answer",
+            grade_pdf_answer,
+            pdf.storage_key,
+            pdf.file_path,
+            pdf.content_hash,
+            request.question,
+            request.teacher_answer
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {"job_id": job.id, "status": job.status}
+
+@app.post("/api/grade/bulk")
+async def bulk_grade(request: BulkGradeRequest, db: AsyncSession = Depends(get_async_db)):
+    """Grade many PDFs against one question, streaming NDJSON results as they finish.
+
+    Blank answers score zero without an LLM call and identical answers are
+    graded once. Graded answers from PDFs linked to a student are saved as
+    that student's Answer and TestResult rows, in batches; a {"status":
+    "saved"} line reports how many were written, and a final
+    {"status": "near_duplicates"} line lists groups of nearly identical answers.
+    """
+    question = await db.get(models.Question, request.question_id, options=[selectinload(models.Question.answer_regions)])
+    if not question:
+        raise HTTPException(status_code=404, detail="Question not found")
+
+    pdfs = (await db.execute(select(models.PDF).where(models.PDF.id.in_(request.pdf_ids)))).scalars().all()
+    missing = set(request.pdf_ids) - {pdf.id for pdf in pdfs}
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"PDFs not found: {', '.join(sorted(missing))}"
+        )
+
+    # On templated exams only this question's answer boxes are read
+    regions = [AnswerRegionRequest.model_validate(region) for region in question.answer_regions]
+
+    answer_texts: Dict[str, str] = {}
+    student_ids = {pdf.id: pdf.student_id for pdf in pdfs}
+    # Every answer is graded with the same leading prompt text
+    prompt_prefix = await run_in_threadpool(question_prompt_prefix, question)
+
+    # Blank answers score zero and identical answers are graded once
+    from prompt import blank_grading_response
+    pregrader = PreGrader(
+        question.question_text,
+        blank_grading_response(question.points or 4),
+        min_words=min_answer_words(question.question_type)
+    )
+
+    def load_answer(pdf: models.PDF) -> str:
+        file_path = stored_pdf_path(pdf.storage_key, pdf.file_path)
+        if regions and ocr_runs_locally():
+            text = extract_region_answers(file_path, regions)[question.id]
+        else:
+            text = extract_document(file_path, pdf.content_hash).text
+        answer_texts[pdf.id] = text
+        return text
+
+    def grade(answer_text: str) -> str:
+        return grade_with_cache(
+            question.question_text,
+            question.points or 4,
+            question.correct_answer,
+            answer_text,
+            prompt_prefix
+        )
+
+    async def graded_and_saved() -> AsyncIterator[dict]:
+        from prompt import parse_grading_response
+        pending, saved = [], 0
+
+        async def save():
+            nonlocal pending, saved
+            batch, pending = pending, []
+            try:
+                saved += await save_graded_answers(question.test_id, batch)
+                return None
+            except Exception as e:
+                return {"status": "save_failed", "test_id": question.test_id, "error": str(e)}
+
+        async for result in bulk_grader.grade(pdfs, load_answer, grade, pregrader):
+            yield result
+            answer_text = answer_texts.pop(result["pdf_id"], None)
+            student_id = student_ids[result["pdf_id"]]
+            if result["status"] != "graded" or question.test_id is None or student_id is None:
+                continue
+            row = graded_answer(student_id, question, answer_text, result["result"],
+                                parse_grading_response(result["result"]))
+            if row:
+                pending.append(row)
+            if len(pending) >= RESULTS_BATCH_SIZE:
+                failure = await save()
+                if failure:
+                    yield failure
+
+        if pending:
+            failure = await save()
+            if failure:
+                yield failure
+        if saved:
+            yield {"status": "saved", "test_id": question.test_id, "answers": saved}
+        # Possible copying: groups of nearly identical answers
+        clusters = pregrader.near_duplicates()
+        if clusters:
+            yield {"status": "near_duplicates", "clusters": [
+                {"pdf_ids": cluster["submission_ids"], "similarity": cluster["similarity"]} for cluster in clusters
+            ]}
 
-        # Check if file exists
-        if not os.path.exists(pdf.file_path):
+    # Grading and saving run on their own task, so a client disconnecting
+    # mid-stream doesn't throw away answers that were already graded
+    return StreamingResponse(
+        to_ndjson(bulk_grader.detach(graded_and_saved())),
+        media_type="application/x-ndjson"
+    )
+
+@app.put("/api/tests/{test_id}/answer-regions", response_model=List[AnswerRegionResponse])
+async def set_answer_regions(test_id: int, regions: List[AnswerRegionRequest], db: AsyncSession = Depends(get_async_db)):
+    """Replace a test template's answer regions."""
+    test = await db.get(models.Test, test_id, options=[selectinload(models.Test.questions)])
+    if not test:
+        raise HTTPException(status_code=404, detail="Test not found")
+
+    question_ids = {question.id for question in test.questions}
+    for region in regions:
+        if region.question_id not in question_ids:
             raise HTTPException(
-                status_code=404,
-                detail="PDF file not found on server"
+                status_code=422,
+                detail=f"Question {region.question_id} is not part of test {test_id}"
+            )
+        if not (0 <= region.x0 < region.x1 <= 1 and 0 <= region.y0 < region.y1 <= 1) or region.page < 0:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Invalid answer region for question {region.question_id}"
             )
 
-        # Extract text from PDF
-        student_answer = extract_text_from_pdf(pdf.file_path)
-
-        # Process the answer using prompt.py
-        from .prompt import mark_answer
-        result = mark_answer(
-            question=request.question,
-            max_score=4,
-            correct_answer=request.teacher_answer,
-            student_answer=student_answer
+    try:
+        await db.execute(
+            delete(models.AnswerRegion).where(models.AnswerRegion.question_id.in_(question_ids))
+        )
+        new_regions = [models.AnswerRegion(**region.model_dump()) for region in regions]
+        db.add_all(new_regions)
+        await db.commit()
+        return new_regions
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error saving answer regions: {str(e)}"
         )
 
-        return result
+@app.get("/api/tests/{test_id}/answer-regions", response_model=List[AnswerRegionResponse])
+async def get_answer_regions(test_id: int, db: AsyncSession = Depends(get_async_db)):
+    """List a test template's answer regions."""
+    return (await db.execute(
+        select(models.AnswerRegion).join(models.Question).where(
+            models.Question.test_id == test_id
+        ).order_by(models.AnswerRegion.page, models.AnswerRegion.y0)
+    )).scalars().all()
 
+@app.get("/api/tests/{test_id}/pdfs/{pdf_id}/answers")
+async def extract_test_answers(test_id: int, pdf_id: str, db: AsyncSession = Depends(get_async_db)):
+    """OCR a submission's answer regions and return the text for each question."""
+    pdf = await db.get(models.PDF, pdf_id)
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+    if not await pdf_is_stored(pdf):
+        raise HTTPException(status_code=404, detail="PDF file not found on server")
+    if not ocr_runs_locally():
+        raise HTTPException(status_code=503, detail="OCR is not available on this worker")
+
+    regions = [
+        AnswerRegionRequest.model_validate(region)
+        for region in (await db.execute(
+            select(models.AnswerRegion).join(models.Question).where(models.Question.test_id == test_id)
+        )).scalars()
+    ]
+    if not regions:
+        raise HTTPException(status_code=404, detail="Test has no answer regions")
+
+    try:
+        file_path = await run_in_threadpool(stored_pdf_path, pdf.storage_key, pdf.file_path)
+        answers = await run_in_threadpool(extract_region_answers, file_path, regions)
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Error processing answer: {str(e)}"
+            detail=f"Error extracting answers from PDF: {str(e)}"
         )
+    return {
+        "test_id": test_id,
+        "pdf_id": pdf_id,
+        "answers": [{"question_id": question_id, "text": text} for question_id, text in answers.items()]
+    }
+
+@app.get("/api/classes/{class_id}/gradebook")
+async def class_gradebook(class_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Return every student's results for every test in a class.
+
+    Relationships are loaded eagerly, so the query count doesn't grow with
+    the number of students, results or answers.
+    """
+    class_ = await load_class_gradebook(db, class_id)
+    if not class_:
+        raise HTTPException(status_code=404, detail="Class not found")
+    return gradebook_to_dict(class_)
+
+@app.get("/api/students/{student_id}/results")
+async def student_results(student_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Return a student's test results with their answers."""
+    student = await db.get(models.Student, student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return student_results_to_dict(await load_student_results(db, student_id))
+
+@app.get("/api/tests/{test_id}/analytics")
+async def test_analytics(test_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Score distribution, per-question difficulty and criterion averages for a test.
+
+    Served from rollups maintained as results are saved, so the cost doesn't
+    depend on how many answers exist.
+    """
+    analytics = await get_test_analytics(db, test_id)
+    if analytics is None:
+        raise HTTPException(status_code=404, detail="No analytics for this test yet")
+    return analytics
+
+@app.post("/api/tests/{test_id}/analytics/refresh")
+async def refresh_test_analytics(test_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Rebuild a test's rollups from its stored results (e.g. after manual edits)."""
+    if not await db.get(models.Test, test_id):
+        raise HTTPException(status_code=404, detail="Test not found")
+    await refresh_test_stats(db, test_id)
+    await db.commit()
+    return await get_test_analytics(db, test_id)
+
+@app.get("/api/classes/{class_id}/analytics")
+async def class_analytics(class_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Per-test rollups for a class."""
+    return await get_class_analytics(db, class_id)
+
+@app.get("/api/grading-cache/stats")
+async def grading_cache_stats():
+    """Report grading cache hit/miss counters."""
+    return grading_cache.stats()
+
+@app.delete("/api/grading-cache")
+async def invalidate_grading_cache(stale_only: bool = False, rubric_hash: Optional[str] = None):
+    """Drop cached grading responses.
+
+    stale_only removes entries graded under an older rubric; rubric_hash
+    removes a single rubric's entries; otherwise everything is cleared.
+    """
+    keep_rubric_hash = None
+    if stale_only:
+        from prompt import rubric_hash as current_rubric_hash
+        keep_rubric_hash = current_rubric_hash()
+    removed = await run_in_threadpool(
+        grading_cache.invalidate, rubric_hash=rubric_hash, keep_rubric_hash=keep_rubric_hash
+    )
+    return {"removed": removed}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report the progress of a background job."""
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Return the result of a finished job."""
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job.done:
+        raise HTTPException(status_code=409, detail=f"Job is still {job.status}")
+    if job.status == "failed":
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing answer: {job.error}"
+        )
+    return job.result
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage and request latency histograms, page, token
+    and cache counters, and job queue depth."""
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+def llm_loaded() -> bool:
+    # Present but partially initialized while the warm-up thread is importing it
+    loaded = getattr(sys.modules.get("prompt"), "llm_loaded", None)
+    return bool(loaded and loaded())
+
+@app.get("/api/ready")
+async def ready():
+    """Readiness probe: which models are loaded on this worker."""
+    is_ready = warm_up_state["status"] in ("done", "skipped")
+    body = {
+        "ready": is_ready,
+        "role": API_WORKER_ROLE,
+        "warm_up": warm_up_state,
+        "models": {
+            "ocr": ocr_model_loaded(),
+            "llm": llm_loaded()
+        }
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+class InternalOCRRequest(BaseModel):
+    content_hash: str
+
+def require_internal_token(authorization: Optional[str] = Header(None)):
+    """Only let through callers presenting OCR_SERVICE_TOKEN."""
+    if not OCR_SERVICE_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), OCR_SERVICE_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid internal token")
+
+@app.post("/api/internal/ocr", dependencies=[Depends(require_internal_token)])
+async def internal_ocr(request: InternalOCRRequest, db: AsyncSession = Depends(get_async_db)):
+    """OCR a stored upload on behalf of an API-only worker."""
+    if not ocr_runs_locally():
+        raise HTTPException(status_code=503, detail="OCR is not available on this worker")
+    pdf = (await db.execute(
+        select(models.PDF).where(models.PDF.content_hash == request.content_hash).limit(1)
+    )).scalar()
+    if not pdf or not await pdf_is_stored(pdf):
+        raise HTTPException(status_code=404, detail="PDF file not found on server")
+    file_path = await run_in_threadpool(stored_pdf_path, pdf.storage_key, pdf.file_path)
+    document = await run_in_threadpool(extract_document, file_path, pdf.content_hash)
+    return {"text": document.text, "document": document.to_dict()}
+
+@app.get("/api/pdfs/{pdf_id}/ocr/stream")
+async def stream_pdf_ocr(pdf_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Stream a PDF's text page by page as server-sent events.
+
+    Each page event says whether its text came from the text layer or OCR.
+    """
+    pdf = await db.get(models.PDF, pdf_id)
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+    if not await pdf_is_stored(pdf):
+        raise HTTPException(status_code=404, detail="PDF file not found on server")
+
+    storage_key, legacy_path, content_hash = pdf.storage_key, pdf.file_path, pdf.content_hash
+
+    def events():
+        # Sync generator: Starlette iterates it in a worker thread
+        pages = 0
+        try:
+            for page in iter_page_text(stored_pdf_path(storage_key, legacy_path), content_hash):
+                pages += 1
+                yield f"event: page\ndata: {json.dumps(page)}\n\n"
+            yield f"event: done\ndata: {json.dumps({'pages': pages})}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': f'Error extracting text from PDF: {str(e)}'})}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def serve_pdf(pdf_id: str, request: Request, db: AsyncSession, disposition: str):
+    """Stream a stored PDF, honouring single Range requests so viewers can
+    fetch just the pages they show."""
+    pdf = await db.get(models.PDF, pdf_id)
+    if not pdf:
+        raise HTTPException(status_code=404, detail="PDF not found")
+    content_disposition = f"{disposition}; filename*=UTF-8''{quote(pdf.filename or pdf.id)}"
+    if not pdf.storage_key:
+        if not pdf.file_path or not os.path.exists(pdf.file_path):
+            raise HTTPException(status_code=404, detail="PDF file not found on server")
+        return FileResponse(pdf.file_path, media_type="application/pdf",
+                            headers={"Content-Disposition": content_disposition})
+
+    # Keys are content addressed, so the hash is a strong validator
+    etag = f'"{pdf.content_hash}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    try:
+        size = await blob_store.size(pdf.storage_key)
+    except BlobNotFound:
+        raise HTTPException(status_code=404, detail="PDF file not found on server")
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except InvalidRange:
+        raise HTTPException(status_code=416, detail="Range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+
+    start, end = byte_range or (0, size - 1)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(end - start + 1),
+        "Content-Disposition": content_disposition,
+        "ETag": etag,
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        blob_store.iter_range(pdf.storage_key, start, end),
+        status_code=206 if byte_range else 200,
+        media_type="application/pdf",
+        headers=headers
+    )
+
+@app.get("/api/preview-pdf/{pdf_id}")
+async def preview_pdf(pdf_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Serve a PDF for display in the browser."""
+    return await serve_pdf(pdf_id, request, db, "inline")
+
+@app.get("/api/download-pdf/{pdf_id}")
+async def download_pdf(pdf_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Serve a PDF as a file download."""
+    return await serve_pdf(pdf_id, request, db, "attachment")
+
+# Only the columns PDFResponse returns
+PDF_LISTING_COLUMNS = [getattr(models.PDF, name) for name in PDFResponse.model_fields]
 
 @app.get("/api/pdfs", response_model=List[PDFResponse])
-async def list_pdfs(db: Session = Depends(get_db)):
-    """List all uploaded PDFs."""
+async def list_pdfs(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    test_id: Optional[int] = None,
+    class_id: Optional[int] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """List uploaded PDFs, newest first, one page at a time.
+
+    Pass the X-Next-Cursor response header back as `cursor` to get the next
+    page; it is absent on the last page. Pages are keyed on (upload_date, id)
+    rather than offsets, so each one costs the same however deep it is.
+    """
     try:
-        return db.query(models.PDF).all()
+        query = select(*PDF_LISTING_COLUMNS)
+        if test_id is not None:
+            query = query.where(models.PDF.test_id == test_id)
+        if class_id is not None:
+            query = query.join(models.Test, models.Test.id == models.PDF.test_id).where(
+                models.Test.class_id == class_id
+            )
+        if uploaded_after is not None:
+            query = query.where(models.PDF.upload_date >= uploaded_after)
+        if uploaded_before is not None:
+            query = query.where(models.PDF.upload_date < uploaded_before)
+        if cursor:
+            after_date, after_id = decode_cursor(cursor)
+            query = query.where(tuple_(models.PDF.upload_date, models.PDF.id) < (after_date, after_id))
+
+        # One extra row tells us whether another page follows
+        query = query.order_by(models.PDF.upload_date.desc(), models.PDF.id.desc()).limit(limit + 1)
+        rows = (await db.execute(query)).all()
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error retrieving PDFs: {str(e)}"
         )
 
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].upload_date, rows[-1].id)
+    return rows
+
 # Clean up endpoint for development/testing
 @app.delete("/api/pdfs/{pdf_id}")
-async def delete_pdf(pdf_id: str, db: Session = Depends(get_db)):
-    """Delete a PDF and its file."""
-    pdf = db.query(models.PDF).filter(models.PDF.id == pdf_id).first()
+async def delete_pdf(pdf_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Delete a PDF and its stored bytes."""
+    pdf = await db.get(models.PDF, pdf_id)
     if not pdf:
         raise HTTPException(status_code=404, detail="PDF not found")
     
     try:
-        # Delete file
-        if os.path.exists(pdf.file_path):
-            os.remove(pdf.file_path)
-        
-        # Delete database record
-        db.delete(pdf)
-        db.commit()
+        storage_key, legacy_path = pdf.storage_key, pdf.file_path
+
+        # Delete database record, and the blob unless a duplicate upload still
+        # shares it, in one transaction; a failed blob delete keeps the row
+        await db.delete(pdf)
+        await db.flush()
+        if storage_key:
+            await delete_blob_if_unused(db, storage_key)
+        await db.commit()
+
+        # Files from before the blob store go after the commit, so a failed
+        # delete never leaves a row without its file
+        if not storage_key and legacy_path and os.path.exists(legacy_path):
+            shared = (await db.execute(
+                select(models.PDF.id).where(models.PDF.file_path == legacy_path).limit(1)
+            )).scalar()
+            if not shared:
+                await run_in_threadpool(os.remove, legacy_path)
         return {"message": "PDF deleted successfully"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Error deleting PDF: {str(e)}"
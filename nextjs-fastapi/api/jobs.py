@@ -0,0 +1,254 @@
+# jobs.py
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import delete
+
+from . import models
+from .metrics import JOB_SECONDS, JOB_WAIT_SECONDS, Trace, use_trace
+
+# Number of OCR/grading jobs that run at the same time in this process
+GRADING_WORKERS = int(os.getenv("GRADING_WORKERS", "2"))
+# Maximum number of queued + running jobs before submissions are rejected
+GRADING_QUEUE_SIZE = int(os.getenv("GRADING_QUEUE_SIZE", "100"))
+# How long finished jobs are kept around for status/result lookups (seconds)
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+# Minimum seconds between deletes of expired job rows
+JOB_PRUNE_INTERVAL = 60
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no free slots."""
+
+
+class Job:
+    """A unit of background work and its progress."""
+
+    def __init__(self, kind: str, job_id: Optional[str] = None):
+        self.id = job_id or str(uuid.uuid4())
+        self.kind = kind
+        self.status = "queued"  # 'queued', 'running', 'completed' or 'failed'
+        self._stage: Optional[str] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.error_type: Optional[str] = None
+        # Stage timings recorded by spans while the job runs
+        self.trace = Trace()
+        # Timings of a job loaded from the database instead of run here
+        self.timings: Optional[Dict[str, Any]] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._finished_monotonic: Optional[float] = None
+        # Called when the stage changes, so other workers see the progress
+        self._on_stage: Optional[Callable[["Job"], None]] = None
+
+    @property
+    def stage(self) -> Optional[str]:
+        return self._stage
+
+    @stage.setter
+    def stage(self, stage: Optional[str]):
+        self._stage = stage
+        if self._on_stage:
+            self._on_stage(self)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "error": self.error,
+            "error_type": self.error_type,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timings": self.trace.summary() if self.timings is None else self.timings,
+        }
+
+    def to_record(self, worker: str) -> models.JobRecord:
+        return models.JobRecord(
+            id=self.id,
+            kind=self.kind,
+            status=self.status,
+            stage=self.stage,
+            result=json.dumps(self.result, default=str) if self.done else None,
+            error=self.error,
+            error_type=self.error_type,
+            timings=self.trace.summary() if self.done else None,
+            worker=worker,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+        )
+
+    @classmethod
+    def from_record(cls, record: models.JobRecord) -> "Job":
+        job = cls(record.kind, record.id)
+        job.status = record.status
+        job._stage = record.stage
+        job.result = json.loads(record.result) if record.result is not None else None
+        job.error = record.error
+        job.error_type = record.error_type
+        job.timings = record.timings or {}
+        job.created_at = record.created_at
+        job.started_at = record.started_at
+        job.finished_at = record.finished_at
+        return job
+
+
+class JobQueue:
+    """Bounded thread pool that runs jobs off the event loop.
+
+    With a session factory, every job's status is also written to the jobs
+    table, so a status lookup that lands on another API worker, or comes
+    after a restart, still finds it. Jobs run where they were submitted.
+    """
+
+    def __init__(self, session_factory: Optional[Callable] = None, max_workers: int = GRADING_WORKERS,
+                 max_pending: int = GRADING_QUEUE_SIZE, result_ttl: int = JOB_RESULT_TTL):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="grading")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # Jobs submitted to this process that haven't finished yet
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._session_factory = session_factory
+        self._result_ttl = result_ttl
+        self._last_prune = 0.0
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.max_workers = max_workers
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args, **kwargs) -> Job:
+        """Queue fn(job, *args, **kwargs) and return its job immediately.
+
+        Writes the job's row first, so this blocks on the database; call it
+        from a worker thread.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Too many jobs in progress, try again later")
+
+        job = Job(kind)
+        try:
+            self._prune()
+            self._save(job)
+            job._on_stage = self._save_quietly
+            with self._lock:
+                self._jobs[job.id] = job
+            self._executor.submit(self._run, job, fn, args, kwargs)
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A job from this process, or any worker's job from the database."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job or not self._session_factory:
+            return job
+        with self._session_factory() as db:
+            record = db.get(models.JobRecord, job_id)
+            return Job.from_record(record) if record else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            "workers": self.max_workers,
+            "queued": sum(1 for j in jobs if j.status == "queued"),
+            "running": sum(1 for j in jobs if j.status == "running"),
+        }
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        # Nothing will finish the jobs left behind, so don't leave them
+        # looking like they're still in progress
+        with self._lock:
+            interrupted = [job for job in self._jobs.values() if not job.done]
+        for job in interrupted:
+            job.status = "failed"
+            job.error = "The worker shut down before the job finished"
+            job.error_type = "Interrupted"
+            job.finished_at = datetime.utcnow()
+            self._save_quietly(job)
+
+    def _run(self, job: Job, fn: Callable[..., Any], args, kwargs):
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        JOB_WAIT_SECONDS.labels(kind=job.kind).observe((job.started_at - job.created_at).total_seconds())
+        self._save_quietly(job)
+        try:
+            with use_trace(job.trace):
+                job.result = fn(job, *args, **kwargs)
+            job.status = "completed"
+        except Exception as e:
+            # HTTPException carries its message in .detail
+            job.error = str(getattr(e, "detail", None) or e)
+            job.error_type = type(e).__name__
+            job.status = "failed"
+            logger.warning("Job %s (%s) failed in stage %s: %s: %s", job.id, job.kind, job.stage,
+                           job.error_type, job.error)
+        finally:
+            job.finished_at = datetime.utcnow()
+            JOB_SECONDS.labels(kind=job.kind, status=job.status).observe(
+                (job.finished_at - job.started_at).total_seconds()
+            )
+            job._finished_monotonic = time.monotonic()
+            self._save_quietly(job)
+            if self._session_factory:
+                # The row now holds everything a lookup needs
+                with self._lock:
+                    self._jobs.pop(job.id, None)
+            self._slots.release()
+
+    def _save(self, job: Job):
+        if not self._session_factory:
+            return
+        with self._session_factory() as db:
+            db.merge(job.to_record(self.worker))
+            db.commit()
+
+    def _save_quietly(self, job: Job):
+        """Save progress without failing the job if the database is unavailable."""
+        try:
+            self._save(job)
+        except Exception:
+            logger.exception("Could not save the status of job %s", job.id)
+
+    def _prune(self):
+        """Drop finished jobs older than the result TTL."""
+        now = time.monotonic()
+        if self._session_factory:
+            if now - self._last_prune < JOB_PRUNE_INTERVAL:
+                return
+            self._last_prune = now
+            cutoff = datetime.utcnow() - timedelta(seconds=self._result_ttl)
+            with self._session_factory() as db:
+                db.execute(delete(models.JobRecord).where(models.JobRecord.finished_at < cutoff))
+                db.commit()
+            return
+        cutoff = now - self._result_ttl
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job._finished_monotonic is not None and job._finished_monotonic < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
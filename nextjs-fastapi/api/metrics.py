@@ -0,0 +1,258 @@
+# metrics.py
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from prometheus_client import REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.metrics_core import Metric
+
+# Requests carrying this header get a Server-Timing header with their stage breakdown
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+# Set to false to ignore PROFILE_HEADER, e.g. on public deployments
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() == "true"
+
+# Histogram buckets (seconds): milliseconds for queries up to minutes for OCR jobs
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Rough characters per token for the LLM token counters; the endpoint doesn't report usage
+CHARS_PER_TOKEN = 4
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = Histogram(
+    "grading_stage_duration_seconds", "Time spent in each pipeline stage", ("stage",), buckets=DURATION_BUCKETS
+)
+STAGE_ERRORS = Counter(
+    "grading_stage_errors_total", "Exceptions raised out of a pipeline stage", ("stage", "error")
+)
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to the response's first byte", ("endpoint", "method", "status"),
+    buckets=DURATION_BUCKETS
+)
+JOB_SECONDS = Histogram(
+    "grading_job_duration_seconds", "Background job run time, excluding time queued", ("kind", "status"),
+    buckets=DURATION_BUCKETS
+)
+JOB_WAIT_SECONDS = Histogram(
+    "grading_job_queue_wait_seconds", "Time background jobs spend queued", ("kind",), buckets=DURATION_BUCKETS
+)
+OCR_PAGES = Counter(
+    "ocr_pages_total", "Pages extracted, by where their text came from", ("source",)
+)
+OCR_CACHE_REQUESTS = Counter(
+    "ocr_cache_requests_total", "OCR store lookups by content hash", ("result",)
+)
+PREGRADE_ANSWERS = Counter(
+    "pregrade_answers_total", "Bulk-graded answers by pre-grading outcome", ("outcome",)
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", f"Estimated LLM tokens (characters / {CHARS_PER_TOKEN})", ("stage", "direction")
+)
+
+
+class CallbackCollector:
+    """Reports values owned elsewhere (queue depth, cache counters) at scrape time.
+
+    collect() returns metric families; a failing callback is logged and
+    skipped so the rest of the scrape still succeeds.
+    """
+
+    def __init__(self, collect: Callable[[], Iterable[Metric]]):
+        self._collect = collect
+
+    def collect(self) -> Iterator[Metric]:
+        try:
+            families = list(self._collect())
+        except Exception:
+            logger.exception("Metrics collector failed")
+            return iter(())
+        return iter(families)
+
+    def describe(self) -> List[Metric]:
+        # No fixed families; stops registration from calling collect() early
+        return []
+
+
+def add_collector(collect: Callable[[], Iterable[Metric]]):
+    REGISTRY.register(CallbackCollector(collect))
+
+
+class Trace:
+    """Stage timings collected for one request or job."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # stage -> [seconds, calls]
+        self.stages: Dict[str, List[float]] = {}
+        self.errors: List[Dict[str, str]] = []
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def add_error(self, stage: str, error: BaseException):
+        with self._lock:
+            self.errors.append({"stage": stage, "error": type(error).__name__, "detail": str(error)})
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """{stage: {"ms", "calls"}}; nested stages are included in their parents' time."""
+        with self._lock:
+            return {
+                stage: {"ms": round(seconds * 1000, 2), "calls": int(calls)}
+                for stage, (seconds, calls) in self.stages.items()
+            }
+
+    def server_timing(self, total_seconds: Optional[float] = None) -> str:
+        """Server-Timing header value, shown in the browser's network panel."""
+        parts = [
+            f'{stage.replace(".", "-")};dur={timing["ms"]};desc="{timing["calls"]}x"'
+            for stage, timing in self.summary().items()
+        ]
+        if total_seconds is not None:
+            parts.append(f"total;dur={round(total_seconds * 1000, 2)}")
+        return ", ".join(parts)
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+@contextmanager
+def use_trace(trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+    """Record spans in this context into `trace` (for work on another thread)."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage=stage).observe(seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a pipeline stage into the stage histogram and the current trace.
+
+    Exceptions are counted and logged with their type before propagating, so
+    failures that callers turn into a generic 500 still say where they came from.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        STAGE_ERRORS.labels(stage=stage, error=type(e).__name__).inc()
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_error(stage, e)
+        logger.warning("Stage %s failed after %.3fs: %s: %s", stage, time.perf_counter() - start,
+                       type(e).__name__, e)
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def count_tokens(stage: str, prompt: str, completion: str):
+    LLM_TOKENS.labels(stage=stage, direction="prompt").inc(len(prompt) / CHARS_PER_TOKEN)
+    LLM_TOKENS.labels(stage=stage, direction="completion").inc(len(completion) / CHARS_PER_TOKEN)
+
+
+def instrument_engine(engine, stage: str = "db"):
+    """Time every statement a (sync) SQLAlchemy engine executes as `stage`."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        record_stage(stage, time.perf_counter() - conn.info["query_start"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def on_error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+        STAGE_ERRORS.labels(stage=stage, error=type(context.original_exception).__name__).inc()
+
+
+def instrument_module(module, stage: str) -> bool:
+    """Time a torch module's forward passes (DocTR's detection and recognition
+    predictors) via hooks. Returns False for modules without hook support."""
+    if not hasattr(module, "register_forward_pre_hook"):
+        return False
+    local = threading.local()
+
+    def pre_hook(*_):
+        local.__dict__.setdefault("starts", []).append(time.perf_counter())
+
+    def post_hook(*_):
+        record_stage(stage, time.perf_counter() - local.starts.pop())
+
+    module.register_forward_pre_hook(pre_hook)
+    module.register_forward_hook(post_hook)
+    return True
+
+
+class MetricsMiddleware:
+    """Times each HTTP request and, when the profiling header is sent, collects
+    the request's spans and returns them in a Server-Timing header.
+
+    Plain ASGI rather than BaseHTTPMiddleware so streaming responses pass
+    through untouched; the header covers work done before the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile_header = PROFILE_HEADER.lower().encode()
+        trace = Trace() if PROFILING_ENABLED and any(
+            name == profile_header for name, _ in scope.get("headers", [])
+        ) else None
+        token = _current_trace.set(trace)
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                elapsed = time.perf_counter() - start
+                # Endpoint name rather than the raw path, so ids don't explode the label set
+                endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+                HTTP_SECONDS.labels(endpoint=endpoint, method=scope["method"], status=message["status"]).observe(elapsed)
+                if trace is not None:
+                    message = {
+                        **message,
+                        "headers": list(message.get("headers", [])) + [
+                            (b"server-timing", trace.server_timing(elapsed).encode())
+                        ]
+                    }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+
+
+def render_metrics() -> bytes:
+    """Every registered metric, process metrics included, in the Prometheus text format."""
+    return generate_latest(REGISTRY)
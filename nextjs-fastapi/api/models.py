@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Table
+from sqlalchemy import Boolean, Column, Float, Integer, String, Text, DateTime, ForeignKey, Index, Table, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -6,7 +6,9 @@ from .database import Base
 # Association table for many-to-many relationship between students and classes
 student_class_association = Table('student_class_association', Base.metadata,
     Column('student_id', Integer, ForeignKey('students.id')),
-    Column('class_id', Integer, ForeignKey('classes.id'))
+    Column('class_id', Integer, ForeignKey('classes.id')),
+    # Roster lookups go class -> students
+    Index('ix_student_class_association_class_student', 'class_id', 'student_id')
 )
 
 class User(Base):
@@ -29,12 +31,12 @@ class Class(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     description = Column(String)
-    teacher_id = Column(Integer, ForeignKey("users.id"))
+    teacher_id = Column(Integer, ForeignKey("users.id"), index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     teacher = relationship("User", back_populates="classes")
-    tests = relationship("Test", back_populates="class")
+    tests = relationship("Test", back_populates="class_")
     students = relationship("Student", secondary=student_class_association, back_populates="classes")
 
 class Student(Base):
@@ -55,7 +57,7 @@ class Test(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
     description = Column(String)
-    class_id = Column(Integer, ForeignKey("classes.id"))
+    class_id = Column(Integer, ForeignKey("classes.id"), index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -67,43 +69,170 @@ class Question(Base):
     __tablename__ = "questions"
 
     id = Column(Integer, primary_key=True, index=True)
-    test_id = Column(Integer, ForeignKey("tests.id"))
+    test_id = Column(Integer, ForeignKey("tests.id"), index=True)
     question_text = Column(String)
     question_type = Column(String)  # e.g., 'multiple_choice', 'short_answer', 'essay'
     correct_answer = Column(String)  # For multiple choice or short answer
     points = Column(Integer)
+    # Grading prompt parts computed when the question is saved (question_prompts.py)
+    prompt_prefix = Column(Text)  # Evaluation prompt up to the student's answer
+    key_points = Column(JSON)  # Reference answer split into its points, with REFERENCE_KEY_POINTS
+    prefix_tokens = Column(Integer)  # Estimated tokens in prompt_prefix
+    reference_tokens = Column(Integer)  # Estimated tokens in correct_answer
+    prompt_fingerprint = Column(String(64))  # prompt.prompt_fingerprint() the prefix was built with
 
     test = relationship("Test", back_populates="questions")
+    answer_regions = relationship("AnswerRegion", back_populates="question", cascade="all, delete-orphan")
+
+class AnswerRegion(Base):
+    __tablename__ = "answer_regions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), index=True)
+    page = Column(Integer)  # 0-based page of the exam template
+    # Box relative to the page size (0-1), so it holds at any render scale
+    x0 = Column(Float)
+    y0 = Column(Float)
+    x1 = Column(Float)
+    y1 = Column(Float)
+    single_line = Column(Boolean, default=False)  # Recognize without text detection
+
+    question = relationship("Question", back_populates="answer_regions")
 
 class TestResult(Base):
     __tablename__ = "test_results"
 
     id = Column(Integer, primary_key=True, index=True)
-    test_id = Column(Integer, ForeignKey("tests.id"))
-    student_id = Column(Integer, ForeignKey("students.id"))
-    score = Column(Integer)
+    test_id = Column(Integer, ForeignKey("tests.id"), index=True)
+    student_id = Column(Integer, ForeignKey("students.id"), index=True)
+    score = Column(Float)  # Sum of the answers' points_earned
     submitted_at = Column(DateTime(timezone=True), server_default=func.now())
 
     test = relationship("Test", back_populates="test_results")
     student = relationship("Student", back_populates="test_results")
     answers = relationship("Answer", back_populates="test_result")
 
+    __table_args__ = (
+        # One result per student and test; the upsert target for graded answers
+        Index('ix_test_results_test_student', 'test_id', 'student_id', unique=True),
+        # Lowest and highest score of a test, when a rollup loses its extreme
+        Index('ix_test_results_test_score', 'test_id', 'score'),
+    )
+
 class Answer(Base):
     __tablename__ = "answers"
 
     id = Column(Integer, primary_key=True, index=True)
-    test_result_id = Column(Integer, ForeignKey("test_results.id"))
-    question_id = Column(Integer, ForeignKey("questions.id"))
+    test_result_id = Column(Integer, ForeignKey("test_results.id"), index=True)
+    question_id = Column(Integer, ForeignKey("questions.id"), index=True)
     answer_text = Column(String)
     is_correct = Column(Boolean)
-    points_earned = Column(Integer)
+    points_earned = Column(Float)
+    feedback = Column(Text)  # Grading response the points were read from
+    # Rubric criterion scores (0-4) from the grading response
+    accuracy_score = Column(Float)
+    clarity_score = Column(Float)
+    concepts_score = Column(Float)
 
     test_result = relationship("TestResult", back_populates="answers")
     question = relationship("Question")
+
+    __table_args__ = (
+        # One answer per result and question; the upsert target for graded answers
+        Index('ix_answers_test_result_question', 'test_result_id', 'question_id', unique=True),
+    )
+
+class TestStats(Base):
+    """Score distribution for a test, updated from running sums as its results change."""
+    __tablename__ = "test_stats"
+
+    test_id = Column(Integer, ForeignKey("tests.id"), primary_key=True)
+    result_count = Column(Integer)
+    max_possible = Column(Float)  # Sum of the test's question points
+    score_sum = Column(Float)
+    score_sum_squares = Column(Float)
+    mean_score = Column(Float)
+    min_score = Column(Float)
+    max_score = Column(Float)
+    stddev_score = Column(Float)
+    score_histogram = Column(JSON)  # Result counts per tenth of max_possible
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class QuestionStats(Base):
+    """Per-question difficulty and criterion averages, maintained with TestStats."""
+    __tablename__ = "question_stats"
+
+    question_id = Column(Integer, ForeignKey("questions.id"), primary_key=True)
+    test_id = Column(Integer, ForeignKey("tests.id"), index=True)
+    answer_count = Column(Integer)
+    mean_points = Column(Float)
+    max_points = Column(Float)
+    # Running sums the averages are derived from; see analytics.QUESTION_SUMS
+    points_sum = Column(Float)
+    correct_count = Column(Integer)
+    accuracy_sum = Column(Float)
+    accuracy_count = Column(Integer)
+    clarity_sum = Column(Float)
+    clarity_count = Column(Integer)
+    concepts_sum = Column(Float)
+    concepts_count = Column(Integer)
+    difficulty = Column(Float)  # 1 - mean_points / max_points: 0 is easy, 1 is hard
+    correct_rate = Column(Float)
+    mean_accuracy = Column(Float)
+    mean_clarity = Column(Float)
+    mean_concepts = Column(Float)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class PDF(Base):
     __tablename__ = "pdfs"
 
     id = Column(String, primary_key=True)
     filename = Column(String)
-    file_path = Column(String)  # Path to the stored file
-    upload_date = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    storage_key = Column(String, index=True)  # Blob store key (storage.blob_key); shared by identical uploads
+    file_path = Column(String)  # Local path, for uploads stored before the blob store
+    upload_date = Column(DateTime(timezone=True), server_default=func.now())
+    content_hash = Column(String(64), index=True)  # SHA-256 of the uploaded bytes
+    file_size = Column(Integer)  # Bytes
+    page_count = Column(Integer)  # From the upload scan; may be unknown
+    test_id = Column(Integer, ForeignKey("tests.id"), index=True)  # Test the submission answers, if known
+    student_id = Column(Integer, ForeignKey("students.id"), index=True)
+
+    __table_args__ = (
+        # Keyset pagination of the upload listing, overall and per test
+        Index('ix_pdfs_upload_date_id', 'upload_date', 'id'),
+        Index('ix_pdfs_test_upload_date_id', 'test_id', 'upload_date', 'id'),
+    )
+
+class OCRResult(Base):
+    __tablename__ = "ocr_results"
+
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 of the PDF bytes
+    text = Column(Text)
+    document = Column(JSON)  # ExtractedDocument.to_dict(): word/line/page arrays
+    page_count = Column(Integer)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class JobRecord(Base):
+    """A background job's status, so any API worker can answer for it."""
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True)
+    kind = Column(String)
+    status = Column(String)  # 'queued', 'running', 'completed' or 'failed'
+    stage = Column(String)
+    result = Column(Text)  # JSON-encoded return value
+    error = Column(Text)
+    error_type = Column(String)
+    timings = Column(JSON)  # Trace.summary() once the job finishes
+    worker = Column(String)  # host:pid of the process running the job
+    created_at = Column(DateTime(timezone=True))
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True), index=True)  # Pruned after JOB_RESULT_TTL
+
+class GradingCacheEntry(Base):
+    __tablename__ = "grading_cache"
+
+    key = Column(String(64), primary_key=True)  # SHA-256 of normalized grading inputs
+    rubric_hash = Column(String(64), index=True)
+    response = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,389 @@
+# ocr.py
+import json
+import math
+import os
+import threading
+import urllib.request
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pypdfium2 as pdfium
+from fastapi import HTTPException
+
+from .database import SessionLocal
+from .ocr_batching import BatchingOCREngine, OCR_BATCH_PAGES
+from .document import DocumentBuilder, ExtractedDocument, page_record
+from .ocr_server import OCR_SERVER_SOCKET, OCRServerClient
+from .ocr_cache import hash_file, get_cached_document, store_ocr_result
+from .metrics import OCR_CACHE_REQUESTS, OCR_PAGES, instrument_module, span
+from .preprocessing import OCR_PREPROCESS, preprocess_pages
+from .text_layer import open_text_layer, text_layer_record, text_layer_region
+
+# Pages rasterized and recognized at a time; bounds memory regardless of page count
+OCR_PAGE_WINDOW = int(os.getenv("OCR_PAGE_WINDOW", "2"))
+# Render scale relative to 72 DPI; 2 matches DocumentFile.from_pdf
+OCR_RENDER_SCALE = float(os.getenv("OCR_RENDER_SCALE", "2"))
+
+# 'all' runs OCR in this process; 'api' never loads models and sends OCR to
+# the dedicated workers at OCR_SERVICE_URL, which share the database and blob store
+API_WORKER_ROLE = os.getenv("API_WORKER_ROLE", "all")
+OCR_SERVICE_URL = os.getenv("OCR_SERVICE_URL")
+OCR_SERVICE_TIMEOUT = float(os.getenv("OCR_SERVICE_TIMEOUT", "600"))
+# Shared secret API-only workers send to /api/internal/ocr; the endpoint is
+# disabled on workers without one
+OCR_SERVICE_TOKEN = os.getenv("OCR_SERVICE_TOKEN")
+
+_engine: Optional[BatchingOCREngine] = None
+_engine_lock = threading.Lock()
+
+# With OCR_SERVER_SOCKET set, pages go to the host's OCR server (api/ocr_server.py)
+# instead of a model loaded in this process
+_server_client = OCRServerClient(OCR_SERVER_SOCKET) if OCR_SERVER_SOCKET else None
+_server_reachable = False
+
+
+def ocr_runs_locally() -> bool:
+    return API_WORKER_ROLE != "api"
+
+
+def get_ocr_engine() -> BatchingOCREngine:
+    """Load the DocTR model on first use and wrap it in the batching engine."""
+    global _engine
+    if _engine is not None:
+        return _engine
+    if not ocr_runs_locally():
+        raise RuntimeError("OCR models are disabled on API-only workers")
+    with _engine_lock:
+        if _engine is None:
+            from doctr.models import ocr_predictor
+
+            # The detector batch matches the engine batch so a batch of pages
+            # goes through in one forward pass
+            model = ocr_predictor('db_resnet50', 'crnn_vgg16_bn', pretrained=True,
+                                  assume_straight_pages=False, det_bs=OCR_BATCH_PAGES)
+            # Batches mix pages from several requests, so these only feed the histograms
+            instrument_module(getattr(model, "det_predictor", None), "ocr.detection")
+            instrument_module(getattr(model, "reco_predictor", None), "ocr.recognition")
+            # Pools pages from concurrent submissions into shared model calls
+            _engine = BatchingOCREngine(model)
+    return _engine
+
+
+def ocr_model_loaded() -> bool:
+    if _server_client:
+        return _server_reachable
+    return _engine is not None
+
+
+def warm_up_ocr():
+    """Load the model and push a blank page through it to initialize kernels."""
+    global _server_reachable
+    if _server_client:
+        _server_reachable = _server_client.ping()
+        return
+    get_ocr_engine()([np.full((512, 512, 3), 255, dtype=np.uint8)])
+
+
+def recognize_pages(images: List[Any]) -> List[tuple]:
+    """OCR page images into page_record() tuples, locally or on the OCR server."""
+    with span("ocr.model"):
+        if _server_client:
+            return _server_client.recognize(images)
+        return [page_record(page) for page in get_ocr_engine()(images)]
+
+
+def recognize_lines(images: List[Any]) -> List[Tuple[str, float]]:
+    """Recognize single-line crops without text detection, locally or on the OCR server."""
+    with span("ocr.model"):
+        if _server_client:
+            return _server_client.recognize_lines(images)
+        return [(value, float(confidence)) for value, confidence in get_ocr_engine().model.reco_predictor(images)]
+
+
+def shutdown_ocr():
+    if _engine is not None:
+        _engine.shutdown()
+
+
+def _render(page: pdfium.PdfPage, scale: float) -> np.ndarray:
+    with span("ocr.render"):
+        return page.render(scale=scale, rev_byteorder=True).to_numpy()
+
+
+def render_page(pdf: pdfium.PdfDocument, index: int, scale: float = OCR_RENDER_SCALE) -> np.ndarray:
+    """Rasterize one PDF page to an RGB array, as DocumentFile.from_pdf would."""
+    page = pdf[index]
+    try:
+        return _render(page, scale)
+    finally:
+        page.close()
+
+
+def iter_page_windows(file_path: str, window: int = OCR_PAGE_WINDOW,
+                      scale: float = OCR_RENDER_SCALE) -> Iterator[List[Any]]:
+    """Rasterize a PDF a few pages at a time."""
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        images = []
+        for index in range(len(pdf)):
+            images.append(render_page(pdf, index, scale))
+            if len(images) >= window:
+                yield images
+                images = []
+        if images:
+            yield images
+    finally:
+        pdf.close()
+
+
+def _ocr_window(images: List[Any], builder: DocumentBuilder) -> Iterator[Dict[str, Any]]:
+    if not images:
+        return
+    with span("ocr.preprocess"):
+        preprocess_pages(images)
+    records = recognize_pages(images)
+    # Release the page bitmaps before rendering the next window
+    images.clear()
+    OCR_PAGES.labels(source="ocr").inc(len(records))
+    for record in records:
+        page_index = builder.page_count
+        text = builder.add_record(record, "ocr")
+        yield {"page": page_index, "text": text, "source": "ocr"}
+
+
+def iter_ocr_pages(file_path: str, builder: DocumentBuilder) -> Iterator[Dict[str, Any]]:
+    """Extract a PDF page by page into builder, yielding {"page", "text", "source"}.
+
+    Pages with a usable text layer are read directly (source 'text'); the
+    rest are rendered and OCR'd a window at a time (source 'ocr').
+    """
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        images: List[Any] = []
+        for index in range(len(pdf)):
+            page = pdf[index]
+            try:
+                with span("ocr.text_layer"):
+                    record = text_layer_record(page, OCR_RENDER_SCALE)
+                if record is None:
+                    images.append(_render(page, OCR_RENDER_SCALE))
+            finally:
+                page.close()
+
+            if record is not None:
+                # Pages go into the builder in order, so finish any pending OCR first
+                yield from _ocr_window(images, builder)
+                OCR_PAGES.labels(source="text").inc()
+                page_index = builder.page_count
+                text = builder.add_record(record, "text")
+                yield {"page": page_index, "text": text, "source": "text"}
+            elif len(images) >= OCR_PAGE_WINDOW:
+                yield from _ocr_window(images, builder)
+        yield from _ocr_window(images, builder)
+    finally:
+        pdf.close()
+
+
+def run_ocr(file_path: str) -> ExtractedDocument:
+    """Extract a PDF's document from its text layer and DocTR."""
+    builder = DocumentBuilder()
+    for _ in iter_ocr_pages(file_path, builder):
+        pass
+    return builder.build()
+
+
+def text_layer_document(file_path: str) -> Optional[ExtractedDocument]:
+    """The document read from the PDF's text layer alone; None if any page needs OCR."""
+    builder = DocumentBuilder()
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        for index in range(len(pdf)):
+            page = pdf[index]
+            try:
+                with span("ocr.text_layer"):
+                    record = text_layer_record(page, OCR_RENDER_SCALE)
+            finally:
+                page.close()
+            if record is None:
+                return None
+            builder.add_record(record, "text")
+    finally:
+        pdf.close()
+    OCR_PAGES.labels(source="text").inc(builder.page_count)
+    return builder.build()
+
+
+def _record_text(record: tuple) -> str:
+    _, lines = record
+    return "\n".join(" ".join(word[0] for word in words) for words in lines)
+
+
+def extract_region_answers(file_path: str, regions: Iterable[Any],
+                           scale: float = OCR_RENDER_SCALE) -> Dict[int, str]:
+    """Read only the answer regions of a templated exam and return text per question id.
+
+    regions carry question_id, page, a relative box (x0, y0, x1, y1) and
+    single_line, like models.AnswerRegion. Only pages with regions are
+    opened, and those with a text layer are read without OCR. On scanned
+    pages, single-line regions go straight to the recognition model; the
+    others get text detection on the crop alone. A question with several
+    regions gets their text joined in page and reading order.
+    """
+    regions = sorted(regions, key=lambda region: (region.page, region.y0, region.x0))
+    answers: Dict[int, List[str]] = {region.question_id: [] for region in regions}
+
+    texts: Dict[int, str] = {}
+    crops = []
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        for page_index in sorted({region.page for region in regions}):
+            if not 0 <= page_index < len(pdf):
+                continue
+            page_regions = [(i, region) for i, region in enumerate(regions) if region.page == page_index]
+            page = pdf[page_index]
+            try:
+                textpage = open_text_layer(page)
+                if textpage is not None:
+                    width, height = page.get_size()
+                    try:
+                        for i, region in page_regions:
+                            texts[i] = text_layer_region(textpage, width, height, region)
+                    finally:
+                        textpage.close()
+                    continue
+                image = _render(page, scale)
+            finally:
+                page.close()
+
+            h, w = image.shape[:2]
+            for i, region in page_regions:
+                crop = image[int(region.y0 * h):math.ceil(region.y1 * h), int(region.x0 * w):math.ceil(region.x1 * w)]
+                if crop.size:
+                    # Copy so the full page bitmap can be released
+                    crops.append((i, region, np.ascontiguousarray(crop)))
+            del image
+    finally:
+        pdf.close()
+
+    # Crops are too small for a reliable skew estimate
+    steps = [step for step in OCR_PREPROCESS if step != "deskew"]
+    images = preprocess_pages([crop for _, _, crop in crops], steps)
+
+    single = [(i, image) for (i, region, _), image in zip(crops, images) if region.single_line]
+    multi = [(i, image) for (i, region, _), image in zip(crops, images) if not region.single_line]
+    if single:
+        for (i, _), (value, _) in zip(single, recognize_lines([image for _, image in single])):
+            texts[i] = value
+    if multi:
+        for (i, _), record in zip(multi, recognize_pages([image for _, image in multi])):
+            texts[i] = _record_text(record)
+
+    for i, region in enumerate(regions):
+        if i in texts:
+            answers[region.question_id].append(texts[i])
+    return {question_id: "\n".join(text for text in parts if text) for question_id, parts in answers.items()}
+
+
+def extract_document(file_path: str, content_hash: Optional[str] = None) -> ExtractedDocument:
+    """Extract a PDF's document, reusing stored results for known content."""
+    try:
+        with span("ocr"):
+            return _extract_document(file_path, content_hash)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error extracting text from PDF: {type(e).__name__}: {str(e)}"
+        )
+
+
+def _extract_document(file_path: str, content_hash: Optional[str]) -> ExtractedDocument:
+    if content_hash is None:
+        content_hash = hash_file(file_path)
+
+    cached = _cached_document(content_hash)
+    if cached:
+        return cached
+
+    if not ocr_runs_locally():
+        # Typed PDFs need no models; anything scanned goes to an OCR
+        # worker, which stores the result in the shared OCR store
+        document = text_layer_document(file_path)
+        if document is None:
+            with span("ocr.remote"):
+                return remote_extract_document(content_hash)
+    else:
+        document = run_ocr(file_path)
+    _store_document(content_hash, document)
+    return document
+
+
+def _cached_document(content_hash: str) -> Optional[ExtractedDocument]:
+    """Look up the OCR store in a session of its own, closed before any OCR runs.
+
+    Extraction can take minutes, or wait on a slow SSE client, and must not
+    hold a pooled connection while it does.
+    """
+    db = SessionLocal()
+    try:
+        cached = get_cached_document(db, content_hash)
+    finally:
+        db.close()
+    OCR_CACHE_REQUESTS.labels(result="hit" if cached else "miss").inc()
+    return cached
+
+
+def _store_document(content_hash: str, document: ExtractedDocument):
+    db = SessionLocal()
+    try:
+        store_ocr_result(db, content_hash, document)
+    finally:
+        db.close()
+
+
+def remote_extract_document(content_hash: str) -> ExtractedDocument:
+    """Ask a dedicated OCR worker to extract a document."""
+    if not OCR_SERVICE_URL:
+        raise RuntimeError("OCR_SERVICE_URL must be set on API-only workers")
+    if not OCR_SERVICE_TOKEN:
+        raise RuntimeError("OCR_SERVICE_TOKEN must be set on API-only workers")
+    request = urllib.request.Request(
+        f"{OCR_SERVICE_URL.rstrip('/')}/api/internal/ocr",
+        data=json.dumps({"content_hash": content_hash}).encode(),
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {OCR_SERVICE_TOKEN}"},
+        method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=OCR_SERVICE_TIMEOUT) as response:
+        payload = json.loads(response.read())
+    return ExtractedDocument.from_dict(payload["text"], payload["document"])
+
+
+def iter_page_text(file_path: str, content_hash: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Yield {"page", "text", "source", "cached"} per page, from the OCR store or live extraction.
+
+    A live run stores the complete result once the last page is done, so the
+    next request for the same content is served from the store.
+    """
+    if content_hash is None:
+        content_hash = hash_file(file_path)
+
+    cached = _cached_document(content_hash)
+    if cached:
+        for page in cached.pages:
+            yield {"page": page.index, "text": page.text, "source": page.source, "cached": True}
+        return
+
+    if not ocr_runs_locally():
+        document = text_layer_document(file_path)
+        if document is not None:
+            _store_document(content_hash, document)
+        else:
+            document = remote_extract_document(content_hash)
+        for page in document.pages:
+            yield {"page": page.index, "text": page.text, "source": page.source, "cached": False}
+        return
+
+    builder = DocumentBuilder()
+    for page in iter_ocr_pages(file_path, builder):
+        yield {**page, "cached": False}
+
+    _store_document(content_hash, builder.build())
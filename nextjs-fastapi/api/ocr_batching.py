@@ -0,0 +1,138 @@
+# ocr_batching.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List, Optional
+
+# Maximum number of pages sent to the model in one call
+OCR_BATCH_PAGES = int(os.getenv("OCR_BATCH_PAGES", "8"))
+# How long the first request in a batch waits for others to join (milliseconds)
+OCR_BATCH_WAIT_MS = int(os.getenv("OCR_BATCH_WAIT_MS", "50"))
+
+
+class _Request:
+    __slots__ = ("pages", "future")
+
+    def __init__(self, pages: List[Any]):
+        self.pages = pages
+        self.future: Future = Future()
+
+
+class BatchingOCREngine:
+    """Runs a DocTR predictor over pages pooled from several documents.
+
+    Callers submit the pages of one PDF and get back a future for that PDF's
+    result pages. A single dispatcher thread gathers pending submissions until
+    the batch holds max_batch_pages pages or max_wait_ms has passed since the
+    first one arrived, runs the model once, and splits the pages back out.
+    """
+
+    def __init__(self, model, max_batch_pages: int = OCR_BATCH_PAGES,
+                 max_wait_ms: int = OCR_BATCH_WAIT_MS):
+        self._model = model
+        self._max_batch_pages = max(1, max_batch_pages)
+        self._max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._carry: Optional[_Request] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.pages = 0
+
+    @property
+    def model(self):
+        """The wrapped predictor, for calls that bypass batching (e.g. its reco_predictor)."""
+        return self._model
+
+    def submit(self, pages: List[Any]) -> Future:
+        """Queue the pages of one document; the future resolves to its result pages."""
+        self._ensure_started()
+        request = _Request(list(pages))
+        if not request.pages:
+            request.future.set_result([])
+            return request.future
+        self._queue.put(request)
+        return request.future
+
+    def __call__(self, pages: List[Any]) -> List[Any]:
+        return self.submit(pages).result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            thread, self._thread = self._thread, None
+        thread.join()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name="ocr-batcher", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self) -> Optional[List[_Request]]:
+        first = self._carry or self._queue.get()
+        self._carry = None
+        if first is None:
+            return None
+
+        batch = [first]
+        batch_pages = len(first.pages)
+        deadline = time.monotonic() + self._max_wait
+        while batch_pages < self._max_batch_pages:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            if batch_pages + len(request.pages) > self._max_batch_pages:
+                # Keep batches within the limit; this one starts the next batch
+                self._carry = request
+                break
+            batch.append(request)
+            batch_pages += len(request.pages)
+        return batch
+
+    def _dispatch(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            pages = [page for request in batch for page in request.pages]
+            try:
+                result = self._model(pages)
+            except Exception as e:
+                outcomes = [(request.future, None, e) for request in batch]
+            else:
+                self.batches += 1
+                self.pages += len(pages)
+                outcomes = []
+                offset = 0
+                for request in batch:
+                    count = len(request.pages)
+                    outcomes.append((request.future, result.pages[offset:offset + count], None))
+                    offset += count
+                del result
+
+            # Drop our references to the input images before waking callers,
+            # which may free them (e.g. shared memory buffers) straight away
+            for request in batch:
+                request.pages = None
+            del pages, batch
+
+            for future, result_pages, error in outcomes:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result_pages)
+            del outcomes
@@ -0,0 +1,217 @@
+# ocr_server.py
+"""Host-wide OCR inference server.
+
+Loads the DocTR model once, then forks OCR_SERVER_PROCESSES inference
+processes that share the weights copy-on-write and accept connections on a
+Unix socket. Web workers render pages into shared memory and send only the
+segment names; the server reads the pixels in place and replies with small
+page_record() tuples.
+
+Run it with `python -m api.ocr_server` and set OCR_SERVER_SOCKET on the API
+workers to the same path.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+from .document import page_record
+from .ocr_batching import BatchingOCREngine, OCR_BATCH_PAGES
+
+# Unix socket shared by the server and the web workers
+OCR_SERVER_SOCKET = os.getenv("OCR_SERVER_SOCKET")
+# Shared secret both sides must present; required, so no other local
+# process that can reach the socket can drive the server
+OCR_SERVER_AUTHKEY = os.getenv("OCR_SERVER_AUTHKEY")
+# Inference processes; throughput scales with this up to the core count
+OCR_SERVER_PROCESSES = int(os.getenv("OCR_SERVER_PROCESSES", "2"))
+# Torch intra-op threads per inference process; 0 splits the cores evenly
+# between the processes
+OCR_SERVER_THREADS = int(os.getenv("OCR_SERVER_THREADS", "0"))
+
+# (segment name, shape, dtype) for one page image
+PageDescriptor = Tuple[str, Tuple[int, ...], str]
+
+logger = logging.getLogger(__name__)
+
+
+def _authkey(authkey: Optional[str] = OCR_SERVER_AUTHKEY) -> bytes:
+    if not authkey:
+        raise RuntimeError("Set OCR_SERVER_AUTHKEY on the OCR server and on every worker using it")
+    return authkey.encode()
+
+
+def _attach(name: str) -> SharedMemory:
+    """Attach to a client's segment without letting our resource tracker unlink it."""
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always registers attached segments with the tracker
+        segment = SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+def _close(segment: SharedMemory):
+    try:
+        segment.close()
+    except BufferError:
+        # A lingering view (e.g. in an exception traceback) still holds the
+        # buffer; the mapping is released when that view is collected
+        pass
+
+
+class OCRServerClient:
+    """Sends page images to the OCR server through shared memory."""
+
+    def __init__(self, address: str = OCR_SERVER_SOCKET, authkey: Optional[str] = OCR_SERVER_AUTHKEY):
+        self.address = address
+        self.authkey = _authkey(authkey)
+
+    def _request(self, message: Tuple[str, Any]) -> Any:
+        with Client(self.address, family="AF_UNIX", authkey=self.authkey) as conn:
+            conn.send(message)
+            status, payload = conn.recv()
+        if status == "error":
+            raise RuntimeError(f"OCR server error: {payload}")
+        return payload
+
+    def ping(self) -> bool:
+        return self._request(("ping", None)) == "pong"
+
+    def _send_images(self, command: str, images: List[np.ndarray]) -> Any:
+        segments = []
+        try:
+            descriptors: List[PageDescriptor] = []
+            for image in images:
+                segment = SharedMemory(create=True, size=max(image.nbytes, 1))
+                segments.append(segment)
+                np.ndarray(image.shape, dtype=image.dtype, buffer=segment.buf)[...] = image
+                descriptors.append((segment.name, image.shape, image.dtype.str))
+            return self._request((command, descriptors))
+        finally:
+            for segment in segments:
+                _close(segment)
+                segment.unlink()
+
+    def recognize(self, images: List[np.ndarray]) -> List[tuple]:
+        """OCR page images and return one page_record() per image."""
+        return self._send_images("ocr", images)
+
+    def recognize_lines(self, images: List[np.ndarray]) -> List[Tuple[str, float]]:
+        """Recognize single text lines without detection; one (value, confidence) per image."""
+        return self._send_images("reco", images)
+
+
+def _handle(conn, engine: BatchingOCREngine):
+    try:
+        command, payload = conn.recv()
+        if command == "ping":
+            conn.send(("ok", "pong"))
+            return
+        if command not in ("ocr", "reco"):
+            conn.send(("error", f"Unknown command: {command}"))
+            return
+
+        segments = [_attach(name) for name, _, _ in payload]
+        try:
+            pages = [
+                np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+                for segment, (_, shape, dtype) in zip(segments, payload)
+            ]
+            if command == "reco":
+                results = [(value, float(confidence)) for value, confidence in engine.model.reco_predictor(pages)]
+            else:
+                results = [page_record(page) for page in engine(pages)]
+            del pages
+            conn.send(("ok", results))
+        finally:
+            for segment in segments:
+                _close(segment)
+    except EOFError:
+        pass
+    except Exception as e:
+        try:
+            conn.send(("error", str(e)))
+        except OSError:
+            pass
+    finally:
+        conn.close()
+
+
+def _serve(listener: Listener, model, threads: int):
+    """Inference process: accept connections and feed them to one batching engine."""
+    import torch
+    torch.set_num_threads(threads)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    engine = BatchingOCREngine(model)
+    while True:
+        try:
+            conn = listener.accept()
+        except (OSError, EOFError):
+            # Failed handshake or a connection reset mid-accept
+            continue
+        threading.Thread(target=_handle, args=(conn, engine), daemon=True).start()
+
+
+def serve(address: Optional[str] = OCR_SERVER_SOCKET, processes: int = OCR_SERVER_PROCESSES,
+          threads: int = OCR_SERVER_THREADS):
+    """Load the model, fork inference processes and keep them running."""
+    if not address:
+        raise SystemExit("Set OCR_SERVER_SOCKET to the Unix socket path to listen on")
+    if not OCR_SERVER_AUTHKEY:
+        raise SystemExit("Set OCR_SERVER_AUTHKEY to the secret the API workers will send")
+
+    from doctr.models import ocr_predictor
+
+    model = ocr_predictor('db_resnet50', 'crnn_vgg16_bn', pretrained=True,
+                          assume_straight_pages=False, det_bs=OCR_BATCH_PAGES)
+
+    if os.path.exists(address):
+        os.unlink(address)
+    listener = Listener(address, family="AF_UNIX", authkey=_authkey())
+
+    # fork shares the loaded weights with every inference process. Each one
+    # gets its share of the cores; torch's default would give every process
+    # all of them and they would fight over the CPU.
+    context = multiprocessing.get_context("fork")
+    processes = max(1, processes)
+    threads = threads or max(1, (os.cpu_count() or 1) // processes)
+    workers = []
+
+    def start_worker():
+        worker = context.Process(target=_serve, args=(listener, model, threads), daemon=True)
+        worker.start()
+        return worker
+
+    def stop(signum, frame):
+        for worker in workers:
+            worker.terminate()
+        listener.close()
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    workers.extend(start_worker() for _ in range(processes))
+    logger.info("OCR server listening on %s with %d inference processes of %d threads",
+                address, len(workers), threads)
+    while True:
+        time.sleep(1)
+        for i, worker in enumerate(workers):
+            if not worker.is_alive():
+                workers[i] = start_worker()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    serve()
@@ -0,0 +1,27 @@
+# pagination.py
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(upload_date: datetime, row_id: str) -> str:
+    """Opaque cursor for the (upload_date, id) position after a page's last row."""
+    raw = json.dumps([upload_date.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        upload_date, row_id = json.loads(raw)
+        return datetime.fromisoformat(upload_date), str(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
@@ -0,0 +1,162 @@
+# pregrade.py
+import os
+import re
+import threading
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Answers to questions of the PREGRADE_MIN_WORDS_TYPES types (comma-separated,
+# e.g. "essay") with fewer words than this, once any printed question text is
+# removed, are blank and score zero without an LLM call. Other questions are
+# only blank when no words are left, so a terse correct answer is still graded.
+PREGRADE_MIN_WORDS = int(os.getenv("PREGRADE_MIN_WORDS", "3"))
+PREGRADE_MIN_WORDS_TYPES = {
+    question_type.strip() for question_type in os.getenv("PREGRADE_MIN_WORDS_TYPES", "").split(",")
+    if question_type.strip()
+}
+# Estimated Jaccard similarity of word shingles above which two answers are
+# reported as near-duplicates
+NEAR_DUPLICATE_SIMILARITY = float(os.getenv("NEAR_DUPLICATE_SIMILARITY", "0.8"))
+# Shorter answers are too likely to coincide to be a copying signal
+NEAR_DUPLICATE_MIN_WORDS = int(os.getenv("NEAR_DUPLICATE_MIN_WORDS", "20"))
+# Words per shingle
+SHINGLE_WORDS = 3
+# MinHash signature length, split into LSH bands of MINHASH_BAND_ROWS values.
+# 16 bands of 8 make pairs above ~0.7 similarity likely to share a bucket.
+MINHASH_PERMUTATIONS = 128
+MINHASH_BAND_ROWS = 8
+
+# Hash permutations h(x) = (a * x + b) mod p; a fixed seed keeps signatures
+# comparable between runs
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(1)
+_PERM_A = _rng.integers(1, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+_word = re.compile(r"\w+")
+
+
+def normalize_answer(text: Optional[str]) -> str:
+    """Lowercased words only, so case, punctuation and layout don't make answers differ."""
+    return " ".join(_word.findall((text or "").lower()))
+
+
+def min_answer_words(question_type: Optional[str]) -> int:
+    """Fewest words an answer to this type of question needs to not count as blank."""
+    return PREGRADE_MIN_WORDS if question_type in PREGRADE_MIN_WORDS_TYPES else 1
+
+
+# "Q", "Q1", "Question 2" or "3" in front of a printed question
+_question_label = re.compile(r"^(?:(?:q|question) ?\d*|\d+) ")
+
+
+def _strip_label(text: str) -> str:
+    return _question_label.sub("", text, count=1)
+
+
+def strip_question_text(text: Optional[str], question_text: Optional[str]) -> str:
+    """The normalized answer without the printed question OCR picked up with it.
+
+    The question is only removed as a whole line or from the start of the
+    answer, where it's printed, never from inside the student's own words.
+    Normalizing first makes the match hold however OCR wrapped the lines.
+    """
+    question = normalize_answer(question_text)
+    if not question:
+        return normalize_answer(text)
+    lines = [normalize_answer(line) for line in (text or "").splitlines()]
+    answer = " ".join(line for line in lines if line and question not in (line, _strip_label(line)))
+    for candidate in (answer, _strip_label(answer)):
+        if candidate == question or candidate.startswith(question + " "):
+            return candidate[len(question):].strip()
+    return answer
+
+
+def is_blank_answer(text: Optional[str], question_text: Optional[str] = None, min_words: int = 1) -> bool:
+    """Whether OCR found no real answer: nothing, noise, or only the printed question."""
+    return len(strip_question_text(text, question_text).split()) < max(min_words, 1)
+
+
+def minhash_signature(words: List[str]) -> np.ndarray:
+    """MinHash of an answer's word shingles."""
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(len(words) - SHINGLE_WORDS + 1, 1))}
+    hashes = np.array([zlib.crc32(shingle.encode()) for shingle in shingles], dtype=np.uint64) % _PRIME
+    return ((np.outer(hashes, _PERM_A) + _PERM_B) % _PRIME).min(axis=0)
+
+
+class PreGrader:
+    """Screens one bulk run's answers before they reach the LLM.
+
+    check() marks blank answers and gives every other answer a dedupe key:
+    answers that are identical once normalized share a key and need grading
+    only once. Answers are also indexed by MinHash/LSH, and
+    near_duplicates() groups the ones that are nearly identical. Those are
+    still graded separately, but the grouping flags possible copying.
+    """
+
+    def __init__(self, question_text: Optional[str] = None, blank_result: str = "",
+                 min_words: int = 1, similarity: float = NEAR_DUPLICATE_SIMILARITY):
+        self.question_text = question_text
+        self.blank_result = blank_result  # Grading response for blank answers
+        self.min_words = min_words
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._signatures: Dict[Any, np.ndarray] = {}
+        self._buckets: Dict[Tuple[int, bytes], List[Any]] = defaultdict(list)
+        self._pairs: Dict[Tuple[Any, Any], float] = {}
+
+    def check(self, submission_id: Any, text: Optional[str]) -> Optional[str]:
+        """The answer's dedupe key, or None if it's blank."""
+        if is_blank_answer(text, self.question_text, self.min_words):
+            return None
+        key = normalize_answer(text)
+        words = key.split()
+        if len(words) >= NEAR_DUPLICATE_MIN_WORDS:
+            self._index(submission_id, minhash_signature(words))
+        return key
+
+    def _index(self, submission_id: Any, signature: np.ndarray):
+        with self._lock:
+            candidates = set()
+            for band, start in enumerate(range(0, MINHASH_PERMUTATIONS, MINHASH_BAND_ROWS)):
+                bucket = self._buckets[(band, signature[start:start + MINHASH_BAND_ROWS].tobytes())]
+                candidates.update(bucket)
+                bucket.append(submission_id)
+            # Bucket collisions are only candidates; keep pairs whose signatures agree enough
+            for other in candidates:
+                similarity = float(np.mean(self._signatures[other] == signature))
+                if similarity >= self.similarity:
+                    self._pairs[(other, submission_id)] = similarity
+            self._signatures[submission_id] = signature
+
+    def near_duplicates(self) -> List[Dict[str, Any]]:
+        """Groups of submissions whose answers are nearly identical, most similar first.
+
+        similarity is the lowest estimated similarity among the pairs linking
+        a group together.
+        """
+        with self._lock:
+            pairs = dict(self._pairs)
+        parent: Dict[Any, Any] = {}
+
+        def root(item):
+            while parent.setdefault(item, item) != item:
+                parent[item] = parent[parent[item]]
+                item = parent[item]
+            return item
+
+        for a, b in pairs:
+            parent[root(a)] = root(b)
+        groups: Dict[Any, Dict[str, Any]] = {}
+        for (a, b), similarity in pairs.items():
+            group = groups.setdefault(root(a), {"submission_ids": set(), "similarity": 1.0})
+            group["submission_ids"].update((a, b))
+            group["similarity"] = min(group["similarity"], similarity)
+        clusters = [
+            {"submission_ids": sorted(group["submission_ids"], key=str), "similarity": round(group["similarity"], 3)}
+            for group in groups.values()
+        ]
+        return sorted(clusters, key=lambda cluster: (-cluster["similarity"], -len(cluster["submission_ids"])))
@@ -0,0 +1,146 @@
+# preprocessing.py
+import os
+from typing import List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+# Steps applied to rendered pages before OCR, in this order; empty disables preprocessing
+OCR_PREPROCESS = [
+    step.strip() for step in os.getenv("OCR_PREPROCESS", "grayscale,contrast,deskew").split(",")
+    if step.strip()
+]
+# Largest skew (degrees) searched for, and the search step
+OCR_DESKEW_MAX_ANGLE = float(os.getenv("OCR_DESKEW_MAX_ANGLE", "5"))
+OCR_DESKEW_STEP = float(os.getenv("OCR_DESKEW_STEP", "0.25"))
+
+# There is no downscale step: pages are rendered at OCR_RENDER_SCALE (ocr.py),
+# and rendering at the resolution OCR should see is cheaper than shrinking
+PREPROCESS_STEPS = ("grayscale", "contrast", "deskew")
+_unknown_steps = set(OCR_PREPROCESS) - set(PREPROCESS_STEPS)
+if _unknown_steps:
+    raise ValueError(f"Unknown OCR_PREPROCESS steps: {', '.join(sorted(_unknown_steps))}")
+
+# Contrast is stretched between these percentiles of the page's intensities
+_CONTRAST_PERCENTILES = (1, 99)
+# Pages whose intensities span less than this are left alone (blank or nearly so)
+_MIN_CONTRAST_RANGE = 32
+# Skew is estimated on a copy of the page scaled to this width
+_DESKEW_SAMPLE_WIDTH = 600
+# Corrections smaller than this aren't worth resampling the page for
+_MIN_DESKEW_ANGLE = 0.2
+
+
+def _contrast_lut(gray: np.ndarray) -> Optional[np.ndarray]:
+    """Lookup table stretching the page's 1st-99th percentile to the full range."""
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    cdf = np.cumsum(hist)
+    lo = int(np.searchsorted(cdf, cdf[-1] * _CONTRAST_PERCENTILES[0] / 100))
+    hi = int(np.searchsorted(cdf, cdf[-1] * _CONTRAST_PERCENTILES[1] / 100))
+    if hi - lo < _MIN_CONTRAST_RANGE:
+        return None
+    levels = (np.arange(256, dtype=np.float32) - lo) * (255 / (hi - lo))
+    return np.clip(levels, 0, 255).astype(np.uint8)
+
+
+def estimate_skew(gray: np.ndarray, max_angle: float = OCR_DESKEW_MAX_ANGLE,
+                  step: float = OCR_DESKEW_STEP) -> float:
+    """Angle (degrees) that makes text rows horizontal, by projection profile.
+
+    Rotating the page so text lines are level maximizes the variance of the
+    row sums of its ink; this is searched on a small binarized copy.
+    """
+    scale = min(1.0, _DESKEW_SAMPLE_WIDTH / gray.shape[1])
+    sample = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    _, ink = cv2.threshold(sample, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    if not ink.any():
+        return 0.0
+
+    h, w = ink.shape
+    center = (w / 2, h / 2)
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        matrix = cv2.getRotationMatrix2D(center, float(angle), 1.0)
+        rotated = cv2.warpAffine(ink, matrix, (w, h), flags=cv2.INTER_NEAREST)
+        score = float(np.var(rotated.sum(axis=1, dtype=np.int32)))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def _rotate(image: np.ndarray, angle: float) -> np.ndarray:
+    h, w = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(image, matrix, (w, h), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=(255, 255, 255))
+
+
+def preprocess_page(page: np.ndarray, steps: Sequence[str] = OCR_PREPROCESS) -> np.ndarray:
+    """Clean up one rendered RGB page for OCR.
+
+    Grayscale and contrast work on a single-channel copy and are written back
+    into `page` itself, so a page that keeps its size costs no new buffer.
+    Deskewing has to resample, so it returns a new, same-size array instead.
+    """
+    if not steps:
+        return page
+
+    gray = cv2.cvtColor(page, cv2.COLOR_RGB2GRAY) if "grayscale" in steps else None
+    work = gray if gray is not None else page
+
+    if "contrast" in steps:
+        lut = _contrast_lut(gray if gray is not None else cv2.cvtColor(page, cv2.COLOR_RGB2GRAY))
+        if lut is not None:
+            cv2.LUT(work, lut, dst=work)
+
+    resampled = False
+    if "deskew" in steps:
+        angle = estimate_skew(work if work.ndim == 2 else cv2.cvtColor(work, cv2.COLOR_RGB2GRAY))
+        if abs(angle) >= _MIN_DESKEW_ANGLE:
+            work = _rotate(work, angle)
+            resampled = True
+
+    if work.ndim == 3:
+        return work
+    # DocTR expects three channels; reuse the page's buffer when the size is unchanged
+    if not resampled:
+        return cv2.cvtColor(work, cv2.COLOR_GRAY2RGB, dst=page)
+    return cv2.cvtColor(work, cv2.COLOR_GRAY2RGB)
+
+
+def preprocess_pages(pages: List[np.ndarray], steps: Sequence[str] = OCR_PREPROCESS) -> List[np.ndarray]:
+    """Preprocess a window of rendered pages, replacing the list's entries in place."""
+    for i, page in enumerate(pages):
+        pages[i] = preprocess_page(page, steps)
+    return pages
+
+
+if __name__ == "__main__":
+    # Compare OCR time per page with and without preprocessing:
+    #   python -m api.preprocessing answers.pdf [runs]
+    import sys
+    import time
+
+    from .ocr import iter_page_windows, recognize_pages, warm_up_ocr
+
+    file_path = sys.argv[1]
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    warm_up_ocr()
+
+    for label, steps in (("none", []), (",".join(OCR_PREPROCESS) or "none", OCR_PREPROCESS)):
+        prep_time = ocr_time = 0.0
+        pages = pixels = 0
+        for _ in range(runs):
+            for images in iter_page_windows(file_path):
+                start = time.perf_counter()
+                preprocess_pages(images, steps)
+                prep_time += time.perf_counter() - start
+
+                start = time.perf_counter()
+                recognize_pages(images)
+                ocr_time += time.perf_counter() - start
+                pages += len(images)
+                pixels += sum(image.shape[0] * image.shape[1] for image in images)
+        print(f"{label}: {pages // runs} pages, {pixels / pages / 1e6:.2f} MP/page, "
+              f"preprocess {prep_time / pages * 1000:.1f} ms/page, "
+              f"OCR {ocr_time / pages * 1000:.1f} ms/page")
@@ -0,0 +1,47 @@
+# question_prompts.py
+from typing import Any, Dict
+
+from sqlalchemy import event, inspect
+
+from . import models
+
+# Question columns the stored prompt is built from
+PROMPT_SOURCES = ("question_text", "correct_answer")
+
+
+def build_question_prompt(question: models.Question) -> Dict[str, Any]:
+    # prompt.py is importable once index.py has put its directory on sys.path
+    from prompt import question_prompt
+    return question_prompt(question.question_text, question.correct_answer)
+
+
+def refresh_question_prompt(question: models.Question):
+    """Recompute the stored prompt prefix, key points and token counts."""
+    for column, value in build_question_prompt(question).items():
+        setattr(question, column, value)
+
+
+def question_prompt_prefix(question: models.Question) -> str:
+    """The question's stored prompt prefix, rebuilt if it's missing or out of date.
+
+    Stored prefixes go stale when the rubric or grading mode changes, or when
+    the question is edited outside the ORM; grading then uses a fresh prefix
+    until the question is saved again.
+    """
+    from prompt import prompt_fingerprint
+    if question.prompt_prefix and question.prompt_fingerprint == prompt_fingerprint(
+            question.question_text, question.correct_answer):
+        return question.prompt_prefix
+    return build_question_prompt(question)["prompt_prefix"]
+
+
+@event.listens_for(models.Question, "before_insert")
+def _question_inserted(mapper, connection, question: models.Question):
+    refresh_question_prompt(question)
+
+
+@event.listens_for(models.Question, "before_update")
+def _question_updated(mapper, connection, question: models.Question):
+    state = inspect(question)
+    if not question.prompt_prefix or any(state.attrs[name].history.has_changes() for name in PROMPT_SOURCES):
+        refresh_question_prompt(question)
@@ -0,0 +1,158 @@
+# results.py
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .analytics import Change, lock_test_stats, update_test_stats
+from .database import AsyncSessionLocal, upsert_insert
+
+# Graded answers written per transaction
+RESULTS_BATCH_SIZE = int(os.getenv("RESULTS_BATCH_SIZE", "500"))
+
+def graded_answer(student_id: int, question: models.Question, answer_text: str,
+                  response: str, parsed: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Row for persist_graded_answers(), or None if the response carried no score."""
+    if parsed.get("score") is None:
+        return None
+    max_score = parsed.get("max_score") or question.points
+    criteria = parsed.get("criteria") or {}
+    return {
+        "student_id": student_id,
+        "question_id": question.id,
+        "answer_text": answer_text,
+        "points_earned": parsed["score"],
+        "is_correct": max_score is not None and parsed["score"] >= max_score,
+        "feedback": response,
+        "accuracy_score": criteria.get("accuracy"),
+        "clarity_score": criteria.get("clarity"),
+        "concepts_score": criteria.get("concepts"),
+    }
+
+
+async def persist_graded_answers(db: AsyncSession, test_id: int, rows: Iterable[Dict[str, Any]],
+                                 batch_size: int = RESULTS_BATCH_SIZE) -> int:
+    """Write graded answers and their students' test results; return rows written.
+
+    Each batch is one transaction of set-based statements: insert any
+    missing TestResults, upsert the Answers on (test_result_id, question_id),
+    recompute the affected results' scores and apply the changed scores and
+    answers to the test's analytics rollups. Re-running a batch (a retry, or
+    regrading) updates the same rows rather than adding new ones.
+    """
+    rows = list(rows)
+    written = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        try:
+            # Before any old values are read, so concurrent saves to the
+            # test apply their rollup changes in turn
+            await lock_test_stats(db, test_id)
+            score_changes, answer_changes = await _persist_batch(db, test_id, batch)
+            await update_test_stats(db, test_id, score_changes, answer_changes)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        written += len(batch)
+    return written
+
+
+# Answer columns the analytics rollups are built from
+_ROLLUP_COLUMNS = ("question_id", "points_earned", "is_correct", "accuracy_score", "clarity_score", "concepts_score")
+
+
+async def _persist_batch(db: AsyncSession, test_id: int,
+                         batch: List[Dict[str, Any]]) -> Tuple[List[Change], List[Change]]:
+    """Write one batch; return its (old, new) result scores and answer rollup columns."""
+    student_ids = sorted({row["student_id"] for row in batch})
+
+    results_table = models.TestResult.__table__
+    await db.execute(
+        upsert_insert(db, results_table)
+        .values([{"test_id": test_id, "student_id": student_id} for student_id in student_ids])
+        .on_conflict_do_nothing(index_elements=["test_id", "student_id"])
+    )
+    result_ids = dict((await db.execute(
+        select(models.TestResult.student_id, models.TestResult.id).where(
+            models.TestResult.test_id == test_id,
+            models.TestResult.student_id.in_(student_ids)
+        )
+    )).all())
+
+    # Last write wins if a batch grades the same answer twice
+    answers = {
+        (result_ids[row["student_id"]], row["question_id"]): {
+            "test_result_id": result_ids[row["student_id"]],
+            "question_id": row["question_id"],
+            "answer_text": row["answer_text"],
+            "points_earned": row["points_earned"],
+            "is_correct": row["is_correct"],
+            "feedback": row["feedback"],
+            "accuracy_score": row["accuracy_score"],
+            "clarity_score": row["clarity_score"],
+            "concepts_score": row["concepts_score"],
+        }
+        for row in batch
+    }
+    answer = models.Answer
+    previous = {
+        (row.test_result_id, row.question_id): {name: getattr(row, name) for name in _ROLLUP_COLUMNS}
+        for row in (await db.execute(
+            select(answer.test_result_id, *(getattr(answer, name) for name in _ROLLUP_COLUMNS)).where(
+                answer.test_result_id.in_(set(result_ids.values())),
+                answer.question_id.in_({question_id for _, question_id in answers})
+            )
+        )).all()
+        if (row.test_result_id, row.question_id) in answers
+    }
+    previous_scores = await _result_scores(db, result_ids.values())
+
+    answers_table = models.Answer.__table__
+    insert = upsert_insert(db, answers_table).values(list(answers.values()))
+    await db.execute(insert.on_conflict_do_update(
+        index_elements=["test_result_id", "question_id"],
+        set_={
+            "answer_text": insert.excluded.answer_text,
+            "points_earned": insert.excluded.points_earned,
+            "is_correct": insert.excluded.is_correct,
+            "feedback": insert.excluded.feedback,
+            "accuracy_score": insert.excluded.accuracy_score,
+            "clarity_score": insert.excluded.clarity_score,
+            "concepts_score": insert.excluded.concepts_score,
+        }
+    ))
+
+    total = (
+        select(func.coalesce(func.sum(models.Answer.points_earned), 0))
+        .where(models.Answer.test_result_id == models.TestResult.id)
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(models.TestResult)
+        .where(models.TestResult.id.in_(set(result_ids.values())))
+        .values(score=total)
+        .execution_options(synchronize_session=False)
+    )
+
+    scores = await _result_scores(db, result_ids.values())
+    score_changes = [(previous_scores[result_id], scores[result_id]) for result_id in scores]
+    answer_changes = [
+        (previous.get(key), {name: values[name] for name in _ROLLUP_COLUMNS})
+        for key, values in answers.items()
+    ]
+    return score_changes, answer_changes
+
+
+async def _result_scores(db: AsyncSession, result_ids: Iterable[int]) -> Dict[int, Optional[float]]:
+    return dict((await db.execute(
+        select(models.TestResult.id, models.TestResult.score).where(models.TestResult.id.in_(set(result_ids)))
+    )).all())
+
+
+async def save_graded_answers(test_id: int, rows: List[Dict[str, Any]]) -> int:
+    """persist_graded_answers() in a session of its own, for use outside a request."""
+    async with AsyncSessionLocal() as db:
+        return await persist_graded_answers(db, test_id, rows)
@@ -0,0 +1,294 @@
+# storage.py
+import os
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+# 'local' keeps blobs under STORAGE_LOCAL_DIR; 's3' uses an S3-compatible
+# bucket (AWS, MinIO, R2...) so every API node sees the same files
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", "uploads")
+S3_BUCKET = os.getenv("S3_BUCKET")
+# Custom endpoint for MinIO and other S3-compatible stores; unset for AWS
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+S3_REGION = os.getenv("S3_REGION")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+# Local copies of S3 blobs for OCR, which needs a file on disk. Keys are
+# content addressed, so a cached copy never goes stale.
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "a-plus-i-blobs"))
+STORAGE_CACHE_MAX_BYTES = int(os.getenv("STORAGE_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Bytes per read when streaming a blob to a client
+STORAGE_CHUNK_BYTES = int(os.getenv("STORAGE_CHUNK_BYTES", str(256 * 1024)))
+
+
+class BlobNotFound(FileNotFoundError):
+    pass
+
+
+class InvalidRange(ValueError):
+    """A Range header that can't be satisfied for a blob of the given size."""
+
+    def __init__(self, size: int):
+        super().__init__(f"Range not satisfiable for {size} bytes")
+        self.size = size
+
+
+def blob_key(content_hash: str) -> str:
+    """Content-addressed key for a PDF: identical uploads share one blob."""
+    return f"pdfs/{content_hash[:2]}/{content_hash}.pdf"
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range `bytes=` header into an inclusive (start, end).
+
+    Returns None when the whole blob should be sent (no header, or one we
+    don't handle such as multiple ranges) and raises InvalidRange when the
+    range lies outside the blob.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        first = int(start) if start else None
+        last = int(end) if end else None
+    except ValueError:
+        return None
+    if first is None and last is None:
+        return None
+    if first is None:
+        # Suffix range: the last `last` bytes
+        if last <= 0 or size == 0:
+            raise InvalidRange(size)
+        return max(size - last, 0), size - 1
+    if last is None:
+        last = size - 1
+    if first >= size or last < first:
+        raise InvalidRange(size)
+    return first, min(last, size - 1)
+
+
+class BlobStore:
+    """Where uploaded PDFs live. Async methods are for route handlers; local_path()
+    blocks and is meant for the OCR and grading worker threads."""
+
+    # Uploads are streamed here before put_file() moves them into the store
+    staging_dir: Path
+
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    async def size(self, key: str) -> int:
+        raise NotImplementedError
+
+    async def put_file(self, key: str, path: Path):
+        """Store a staged file under `key`; the staged file is consumed."""
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    def iter_range(self, key: str, start: int = 0, end: Optional[int] = None,
+                   chunk_size: int = STORAGE_CHUNK_BYTES) -> AsyncIterator[bytes]:
+        """Stream bytes start..end (inclusive; None means to the end)."""
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> str:
+        """A readable file on this node holding the blob."""
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str = STORAGE_LOCAL_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Same filesystem as the blobs, so put_file() is an atomic rename
+        self.staging_dir = self.root
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    async def exists(self, key: str) -> bool:
+        return await run_in_threadpool(self._path(key).is_file)
+
+    async def size(self, key: str) -> int:
+        try:
+            return (await run_in_threadpool(self._path(key).stat)).st_size
+        except FileNotFoundError as e:
+            raise BlobNotFound(key) from e
+
+    async def put_file(self, key: str, path: Path):
+        def move():
+            target = self._path(key)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, target)
+        await run_in_threadpool(move)
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self._path(key).unlink, missing_ok=True)
+
+    async def iter_range(self, key: str, start: int = 0, end: Optional[int] = None,
+                         chunk_size: int = STORAGE_CHUNK_BYTES) -> AsyncIterator[bytes]:
+        try:
+            f = await run_in_threadpool(self._path(key).open, "rb")
+        except FileNotFoundError as e:
+            raise BlobNotFound(key) from e
+        try:
+            await run_in_threadpool(f.seek, start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = await run_in_threadpool(f.read, chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+
+    def local_path(self, key: str) -> str:
+        path = self._path(key)
+        if not path.is_file():
+            raise BlobNotFound(key)
+        return str(path)
+
+
+class S3BlobStore(BlobStore):
+    """S3-compatible bucket via boto3. boto3 is blocking, so calls run in the
+    thread pool; it is only imported when this backend is configured."""
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+                 region: Optional[str] = S3_REGION, prefix: str = S3_PREFIX,
+                 cache_dir: str = STORAGE_CACHE_DIR, cache_max_bytes: int = STORAGE_CACHE_MAX_BYTES):
+        try:
+            import boto3
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)") from e
+        from botocore.exceptions import ClientError
+
+        self._client_error = ClientError
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_max_bytes = cache_max_bytes
+        self._cache_lock = threading.Lock()
+        self.staging_dir = Path(tempfile.gettempdir())
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _is_missing(self, error: Exception) -> bool:
+        return isinstance(error, self._client_error) and \
+            error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def _head(self, key: str) -> dict:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            if self._is_missing(e):
+                raise BlobNotFound(key) from e
+            raise
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await run_in_threadpool(self._head, key)
+            return True
+        except BlobNotFound:
+            return False
+
+    async def size(self, key: str) -> int:
+        return (await run_in_threadpool(self._head, key))["ContentLength"]
+
+    async def put_file(self, key: str, path: Path):
+        def upload():
+            try:
+                self.client.upload_file(str(path), self.bucket, self._key(key),
+                                        ExtraArgs={"ContentType": "application/pdf"})
+            finally:
+                Path(path).unlink(missing_ok=True)
+        await run_in_threadpool(upload)
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=self._key(key))
+        (self.cache_dir / key).unlink(missing_ok=True)
+
+    async def iter_range(self, key: str, start: int = 0, end: Optional[int] = None,
+                         chunk_size: int = STORAGE_CHUNK_BYTES) -> AsyncIterator[bytes]:
+        # The bucket serves the range; only the requested bytes leave S3
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        try:
+            response = await run_in_threadpool(
+                self.client.get_object, Bucket=self.bucket, Key=self._key(key), Range=byte_range
+            )
+        except Exception as e:
+            if self._is_missing(e):
+                raise BlobNotFound(key) from e
+            raise
+        body = response["Body"]
+        try:
+            while True:
+                chunk = await run_in_threadpool(body.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    def local_path(self, key: str) -> str:
+        path = self.cache_dir / key
+        if path.is_file():
+            # Touch so the pruning below treats it as recently used
+            os.utime(path)
+            return str(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f".{uuid.uuid4()}.part")
+        try:
+            self.client.download_file(self.bucket, self._key(key), str(partial))
+            os.replace(partial, path)
+        except Exception as e:
+            partial.unlink(missing_ok=True)
+            if self._is_missing(e):
+                raise BlobNotFound(key) from e
+            raise
+        self._prune_cache(keep=path)
+        return str(path)
+
+    def _prune_cache(self, keep: Path):
+        """Drop least recently used copies once the cache exceeds its budget."""
+        with self._cache_lock:
+            # Hidden files are downloads still in progress
+            files = [(p.stat(), p) for p in self.cache_dir.rglob("*") if p.is_file() and not p.name.startswith(".")]
+            total = sum(stat.st_size for stat, _ in files)
+            for stat, p in sorted(files, key=lambda item: item[0].st_mtime):
+                if total <= self.cache_max_bytes:
+                    break
+                if p != keep:
+                    p.unlink(missing_ok=True)
+                    total -= stat.st_size
+
+
+_store: Optional[BlobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """The configured store, created on first use."""
+    global _store
+    if _store is not None:
+        return _store
+    with _store_lock:
+        if _store is None:
+            if STORAGE_BACKEND == "local":
+                _store = LocalBlobStore()
+            elif STORAGE_BACKEND == "s3":
+                if not S3_BUCKET:
+                    raise ValueError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+                _store = S3BlobStore(S3_BUCKET)
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _store
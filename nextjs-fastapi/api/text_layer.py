@@ -0,0 +1,146 @@
+# text_layer.py
+import os
+import re
+from typing import List, Optional, Tuple
+
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
+
+# Read typed pages from the PDF's own text layer instead of running OCR
+PDF_TEXT_LAYER = os.getenv("PDF_TEXT_LAYER", "true").lower() == "true"
+# Fewer non-blank characters than this and the page is treated as scanned
+PDF_TEXT_LAYER_MIN_CHARS = int(os.getenv("PDF_TEXT_LAYER_MIN_CHARS", "16"))
+# Pages this much covered by images are OCR'd even with some text (e.g. a
+# typed header on a scanned answer sheet)
+PDF_TEXT_LAYER_MAX_IMAGE_COVERAGE = float(os.getenv("PDF_TEXT_LAYER_MAX_IMAGE_COVERAGE", "0.5"))
+
+# Share of unreadable characters (broken font encodings) above which the layer is ignored
+_MAX_GARBLED_RATIO = 0.05
+# Text rects whose vertical extents overlap by this share of the shorter one
+# are on the same baseline...
+_SAME_LINE_OVERLAP = 0.5
+# ...and on the same line if the gap between them is at most this many line
+# heights. Wider gaps separate columns, which OCR also reads as separate lines.
+_MAX_LINE_GAP = 3.0
+# Rects this close (in line heights) with no space between them split a word,
+# e.g. where its font changes part way through
+_WORD_JOIN_GAP = 0.2
+_WORD = re.compile(r"\S+")
+
+# (left, bottom, right, top, text) of one text rect, in PDF points
+_Rect = Tuple[float, float, float, float, str]
+
+
+def _image_coverage(page: pdfium.PdfPage, width: float, height: float) -> float:
+    covered = 0.0
+    for obj in page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_IMAGE,)):
+        # get_bounds() in pypdfium2 5, get_pos() before
+        left, bottom, right, top = (obj.get_bounds if hasattr(obj, "get_bounds") else obj.get_pos)()
+        covered += max(0.0, min(right, width) - max(left, 0.0)) * max(0.0, min(top, height) - max(bottom, 0.0))
+    return min(1.0, covered / (width * height)) if width and height else 1.0
+
+
+def _is_usable(text: str) -> bool:
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < PDF_TEXT_LAYER_MIN_CHARS:
+        return False
+    garbled = sum(1 for c in chars if c == "�" or not c.isprintable())
+    return garbled / len(chars) <= _MAX_GARBLED_RATIO
+
+
+def open_text_layer(page: pdfium.PdfPage) -> Optional[pdfium.PdfTextPage]:
+    """The page's text page if it has a usable text layer, else None. The caller closes it."""
+    if not PDF_TEXT_LAYER:
+        return None
+    width, height = page.get_size()
+    if _image_coverage(page, width, height) > PDF_TEXT_LAYER_MAX_IMAGE_COVERAGE:
+        return None
+    textpage = page.get_textpage()
+    # Bounded with no box is the whole page; get_text_range() without an
+    # index and count warns on every call in pypdfium2 4
+    if _is_usable(textpage.get_text_bounded()):
+        return textpage
+    textpage.close()
+    return None
+
+
+def _same_line(previous: _Rect, rect: _Rect) -> bool:
+    overlap = min(previous[3], rect[3]) - max(previous[1], rect[1])
+    line_height = min(previous[3] - previous[1], rect[3] - rect[1])
+    gap = rect[0] - previous[2]
+    return overlap >= _SAME_LINE_OVERLAP * line_height and -line_height <= gap <= _MAX_LINE_GAP * line_height
+
+
+def _text_lines(textpage: pdfium.PdfTextPage) -> List[List[_Rect]]:
+    """The page's text rects grouped into visual lines, in reading order.
+
+    PDFium reports a rect per run of text in one font and direction, so a
+    line with bold words or a change of font size comes as several rects.
+    """
+    lines: List[List[_Rect]] = []
+    for i in range(textpage.count_rects()):
+        left, bottom, right, top = textpage.get_rect(i)
+        text = textpage.get_text_bounded(left, bottom, right, top)
+        if not text.strip():
+            continue
+        rect = (left, bottom, right, top, text)
+        if lines and _same_line(lines[-1][-1], rect):
+            lines[-1].append(rect)
+        else:
+            lines.append([rect])
+    return lines
+
+
+def text_layer_record(page: pdfium.PdfPage, scale: float) -> Optional[tuple]:
+    """Read a page's text layer as a page_record() tuple, or None if it needs OCR.
+
+    Text rects on the same baseline are merged into one line, as OCR would
+    read it. Word boxes are split out of each rect's box in proportion to
+    character offsets, which is close enough for layout and costs no
+    per-character calls.
+    """
+    textpage = open_text_layer(page)
+    if textpage is None:
+        return None
+    try:
+        width, height = page.get_size()
+        lines = []
+        for rects in _text_lines(textpage):
+            words = []
+            previous = None
+            for left, bottom, right, top, text in sorted(rects):
+                step = (right - left) / len(text)
+                rect_words = [
+                    (match.group(), 1.0, (
+                        (left + match.start() * step) / width,
+                        1 - top / height,
+                        (left + match.end() * step) / width,
+                        1 - bottom / height
+                    ))
+                    for match in _WORD.finditer(text)
+                ]
+                if (
+                    words and rect_words and previous is not None
+                    and not previous[4][-1].isspace() and not text[0].isspace()
+                    and left - previous[2] <= _WORD_JOIN_GAP * (top - bottom)
+                ):
+                    # The first word continues the previous rect's last one
+                    value, confidence, box = words.pop()
+                    first_value, _, first_box = rect_words[0]
+                    rect_words[0] = (value + first_value, confidence, (
+                        box[0], min(box[1], first_box[1]), first_box[2], max(box[3], first_box[3])
+                    ))
+                words.extend(rect_words)
+                previous = (left, bottom, right, top, text)
+            lines.append(words)
+        return (round(height * scale), round(width * scale)), lines
+    finally:
+        textpage.close()
+
+
+def text_layer_region(textpage: pdfium.PdfTextPage, width: float, height: float, region) -> str:
+    """Text inside a region's relative box, one line per text line."""
+    text = textpage.get_text_bounded(
+        region.x0 * width, (1 - region.y1) * height, region.x1 * width, (1 - region.y0) * height
+    )
+    return "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
@@ -0,0 +1,229 @@
+# uploads.py
+import hashlib
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+# Largest PDF accepted by the upload endpoints
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+# Non-file form fields are small; cap them so they can't be used to buffer a body
+MAX_FORM_FIELD_BYTES = 64 * 1024
+# Allowance for multipart boundaries and headers when checking Content-Length
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+PDF_MAGIC = b"%PDF-"
+# The PDF header may be preceded by a little junk; readers search the first 1KB
+MAGIC_SEARCH_BYTES = 1024
+# Page objects; "/Type /Pages" (the page tree) is excluded by the lookahead
+PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?![A-Za-z0-9_])")
+PAGE_SCAN_OVERLAP = 64
+
+
+class UploadRejected(Exception):
+    """An upload that fails validation, with the HTTP status to report."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class PDFStreamWriter:
+    """Writes an upload to a temp file while hashing, size-checking and counting pages.
+
+    Bytes are written once, to a hidden file in the blob store's staging
+    directory, and BlobStore.put_file() moves it into place so readers never
+    see a partial upload.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.temp_path = directory / f".{uuid.uuid4()}.part"
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._file = self.temp_path.open("wb")
+        self._digest = hashlib.sha256()
+        self._head = b""
+        self._is_pdf = False
+        self._scan_tail = b""
+        self._pages = 0
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadRejected(413, f"File exceeds the {self.max_bytes} byte upload limit")
+        if not self._is_pdf:
+            self._check_magic(data)
+
+        self._digest.update(data)
+        self._count_pages(data)
+        self._file.write(data)
+
+    def _check_magic(self, data: bytes):
+        self._head += data[:MAGIC_SEARCH_BYTES - len(self._head)]
+        if PDF_MAGIC in self._head:
+            self._is_pdf = True
+        elif len(self._head) >= MAGIC_SEARCH_BYTES:
+            raise UploadRejected(400, "Only PDF files are allowed")
+
+    def _count_pages(self, data: bytes):
+        # Matches ending in the previous tail were counted last time, and a match
+        # touching the end of the buffer can't be judged until more data arrives
+        buffer = self._scan_tail + data
+        for match in PAGE_PATTERN.finditer(buffer):
+            if len(self._scan_tail) <= match.end() < len(buffer):
+                self._pages += 1
+        self._scan_tail = buffer[-PAGE_SCAN_OVERLAP:]
+
+    def finish(self):
+        """Validate the complete upload and flush it to disk."""
+        if not self._is_pdf:
+            raise UploadRejected(400, "Only PDF files are allowed")
+        # A page object right at the end of the file was deferred by _count_pages
+        for match in PAGE_PATTERN.finditer(self._scan_tail):
+            if match.end() == len(self._scan_tail):
+                self._pages += 1
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    @property
+    def content_hash(self) -> str:
+        return self._digest.hexdigest()
+
+    @property
+    def page_count(self) -> Optional[int]:
+        """Page objects seen in the stream; None when they're hidden in compressed object streams."""
+        return self._pages or None
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        self.temp_path.unlink(missing_ok=True)
+
+
+class StreamedUpload:
+    """Result of receiving an upload: the pending file plus any form fields."""
+
+    def __init__(self, writer: PDFStreamWriter, filename: str, fields: Dict[str, str]):
+        self.writer = writer
+        self.filename = filename
+        self.fields = fields
+
+
+def _check_filename(filename: Optional[str]) -> str:
+    if not filename or not filename.lower().endswith(".pdf"):
+        raise UploadRejected(400, "Only PDF files are allowed")
+    return os.path.basename(filename)
+
+
+async def receive_pdf_upload(request: Request, directory: Path, field_name: str = "file",
+                             max_bytes: int = MAX_UPLOAD_BYTES) -> StreamedUpload:
+    """Stream a PDF from the request body straight into `directory`.
+
+    Accepts multipart/form-data (the PDF in `field_name`, other small fields
+    returned as strings) or a raw application/pdf body with the filename in
+    the `filename` query parameter. The returned writer is finished: its
+    temp_path holds the complete PDF. The caller moves that file into the
+    blob store with BlobStore.put_file(), or calls abort() to delete it.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise UploadRejected(413, f"File exceeds the {max_bytes} byte upload limit")
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type == b"application/pdf":
+        filename = _check_filename(request.query_params.get("filename"))
+        writer = PDFStreamWriter(directory, max_bytes)
+        try:
+            async for chunk in request.stream():
+                await run_in_threadpool(writer.write, chunk)
+            await run_in_threadpool(writer.finish)
+        except BaseException:
+            writer.abort()
+            raise
+        return StreamedUpload(writer, filename, {})
+
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadRejected(415, "Expected multipart/form-data or application/pdf")
+
+    state = {"headers": {}, "header_field": b"", "header_value": b"", "name": None}
+    fields: Dict[str, bytearray] = {}
+    pending: List[bytes] = []
+    upload: Dict[str, object] = {}
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["name"] = None
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        state["name"] = name
+        if name == field_name:
+            if "writer" in upload:
+                raise UploadRejected(400, "Only one file may be uploaded per request")
+            upload["filename"] = _check_filename(options.get(b"filename", b"").decode("utf-8", "replace"))
+            upload["writer"] = PDFStreamWriter(directory, max_bytes)
+        else:
+            fields[name] = bytearray()
+
+    def on_part_data(data, start, end):
+        if state["name"] == field_name:
+            pending.append(bytes(data[start:end]))
+        else:
+            value = fields[state["name"]]
+            value += data[start:end]
+            if len(value) > MAX_FORM_FIELD_BYTES:
+                raise UploadRejected(413, f"Form field '{state['name']}' is too large")
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if pending:
+                # File I/O and hashing happen off the event loop
+                data = b"".join(pending)
+                pending.clear()
+                await run_in_threadpool(upload["writer"].write, data)
+        parser.finalize()
+
+        if "writer" not in upload:
+            raise UploadRejected(400, f"Missing '{field_name}' file field")
+        await run_in_threadpool(upload["writer"].finish)
+    except BaseException:
+        if "writer" in upload:
+            upload["writer"].abort()
+        raise
+
+    return StreamedUpload(
+        upload["writer"],
+        upload["filename"],
+        {name: bytes(value).decode("utf-8", "replace") for name, value in fields.items()}
+    )
@@ -9,29 +9,41 @@ interface PDF {
 export default function PDFList() {
   const [pdfs, setPdfs] = useState<PDF[]>([]);
   const [isLoading, setIsLoading] = useState<boolean>(true);
+  const [isLoadingMore, setIsLoadingMore] = useState<boolean>(false);
   const [error, setError] = useState<string | null>(null);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [previewUrl, setPreviewUrl] = useState<string | null>(null);
 
   useEffect(() => {
     fetchPDFs();
   }, []);
 
-  const fetchPDFs = async () => {
+  // /api/pdfs returns one page at a time; X-Next-Cursor is set while more follow
+  const fetchPDFs = async (cursor?: string) => {
     try {
-      const response = await fetch('/api/pdfs');
+      const url = cursor ? `/api/pdfs?cursor=${encodeURIComponent(cursor)}` : '/api/pdfs';
+      const response = await fetch(url);
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
       const data: PDF[] = await response.json();
-      setPdfs(data);
+      setPdfs((previous) => (cursor ? [...previous, ...data] : data));
+      setNextCursor(response.headers.get('X-Next-Cursor'));
     } catch (error) {
       console.error('Error fetching PDFs:', error);
       setError('Failed to load PDFs');
     } finally {
       setIsLoading(false);
+      setIsLoadingMore(false);
     }
   };
 
+  const handleLoadMore = () => {
+    if (!nextCursor) return;
+    setIsLoadingMore(true);
+    fetchPDFs(nextCursor);
+  };
+
   const handlePreview = (pdfId: string) => {
     setPreviewUrl(`/api/preview-pdf/${pdfId}`);
   };
@@ -69,6 +81,17 @@ export default function PDFList() {
               </div>
             </div>
           ))}
+          {nextCursor && (
+            <button
+              onClick={handleLoadMore}
+              disabled={isLoadingMore}
+              className={`w-full px-3 py-2 rounded border ${
+                isLoadingMore ? 'text-gray-400 cursor-not-allowed' : 'hover:bg-gray-100'
+              }`}
+            >
+              {isLoadingMore ? 'Loading...' : 'Load more'}
+            </button>
+          )}
         </div>
       )}
       {previewUrl && (
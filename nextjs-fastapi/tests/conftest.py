@@ -0,0 +1,16 @@
+# conftest.py
+# Unit tests for the API's pure helpers. Run from nextjs-fastapi/:
+#   pip install -r requirements.txt pytest
+#   pytest tests
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The api package is imported as `api.<module>`, and prompt.py as a top-level
+# module the way index.py puts it on sys.path
+sys.path[:0] = [str(ROOT), str(ROOT / "api" / "LLM-processing" / "data_processing")]
+
+# api.database builds its engines at import time; the tests don't touch them
+os.environ.setdefault("DATABASE_URL", "sqlite://")
@@ -0,0 +1,120 @@
+# test_grading_cache.py
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from api import models
+from api.grading_cache import GradingCache, make_cache_key
+
+SETTINGS = {"mode": "single", "model": {"temperature": 0.1}, "rubric": "r1", "answer_token_budget": 512}
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.GradingCacheEntry.__table__.create(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def key(student_answer="Water moves across a membrane.", **overrides):
+    inputs = dict(question="What is osmosis?", max_score=10, correct_answer="Diffusion of water.",
+                  student_answer=student_answer, settings=SETTINGS)
+    inputs.update(overrides)
+    return make_cache_key(**inputs)
+
+
+def test_cache_key_ignores_whitespace_only_differences():
+    assert key("Water moves across a membrane.") == key("  Water   moves\nacross a membrane. ")
+    assert key() == key(question="What  is\tosmosis?")
+
+
+def test_cache_key_ignores_settings_order():
+    assert key() == key(settings=dict(reversed(list(SETTINGS.items()))))
+
+
+@pytest.mark.parametrize("overrides", [
+    {"student_answer": "water moves across a membrane."},
+    {"question": "What is diffusion?"},
+    {"correct_answer": "Diffusion of solvent."},
+    {"max_score": 5},
+    {"settings": {**SETTINGS, "rubric": "r2"}},
+    {"settings": {**SETTINGS, "mode": "two_stage"}},
+    {"settings": {**SETTINGS, "model": {"temperature": 0.2}}},
+])
+def test_cache_key_changes_with_grading_inputs(overrides):
+    assert key(**overrides) != key()
+
+
+def test_put_and_get(session_factory):
+    cache = GradingCache(session_factory)
+    assert cache.get(key()) is None
+    cache.put(key(), "Score: 8/10", "r1")
+    assert cache.get(key()) == "Score: 8/10"
+    assert cache.hits == 1
+
+
+def test_evicted_entries_are_read_back_from_the_database(session_factory):
+    cache = GradingCache(session_factory, max_entries=1)
+    cache.put("first", "A", "r1")
+    cache.put("second", "B", "r1")
+    assert cache.stats()["entries"] == 1
+    assert cache.get("first") == "A"
+    assert cache.db_hits == 1
+    # A fresh process only has the table
+    assert GradingCache(session_factory).get("second") == "B"
+
+
+def test_expired_entries_are_regraded(session_factory, monkeypatch):
+    cache = GradingCache(session_factory, ttl=60)
+    cache.put(key(), "old", "r1")
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+    assert cache.get_or_grade(key(), "r1", lambda: "new") == "new"
+    assert cache.misses == 1
+
+
+def test_failed_grading_is_not_cached(session_factory):
+    cache = GradingCache(session_factory)
+
+    def fail():
+        raise ValueError("Evaluator response has no valid score for: accuracy")
+
+    with pytest.raises(ValueError):
+        cache.get_or_grade(key(), "r1", fail)
+    assert cache.get(key()) is None
+    assert cache.get_or_grade(key(), "r1", lambda: "Score: 5/10") == "Score: 5/10"
+    assert cache.get_or_grade(key(), "r1", fail) == "Score: 5/10"
+
+
+def fill(cache):
+    cache.put("a", "A", "r1")
+    cache.put("b", "B", "r2")
+    cache.put("c", "C", "r3")
+
+
+def test_invalidate_one_rubric(session_factory):
+    cache = GradingCache(session_factory)
+    fill(cache)
+    assert cache.invalidate(rubric_hash="r2") == 1
+    assert [cache.get(k) for k in "abc"] == ["A", None, "C"]
+
+
+def test_invalidate_all_but_current_rubric(session_factory):
+    cache = GradingCache(session_factory)
+    fill(cache)
+    assert cache.invalidate(keep_rubric_hash="r3") == 2
+    assert [cache.get(k) for k in "abc"] == [None, None, "C"]
+    # Other processes' memory doesn't matter once the rows are gone
+    assert [GradingCache(session_factory).get(k) for k in "abc"] == [None, None, "C"]
+
+
+def test_invalidate_everything(session_factory):
+    cache = GradingCache(session_factory)
+    fill(cache)
+    assert cache.invalidate() == 3
+    assert cache.stats()["entries"] == 0
+    assert [cache.get(k) for k in "abc"] == [None, None, None]
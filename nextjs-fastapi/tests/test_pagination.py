@@ -0,0 +1,33 @@
+# test_pagination.py
+from datetime import datetime, timezone
+
+import pytest
+
+from api.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("upload_date", [
+    datetime(2024, 5, 1, 12, 30, 15, 123456),
+    datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc),
+])
+def test_cursor_round_trip(upload_date):
+    cursor = encode_cursor(upload_date, "3f2a-row")
+    assert decode_cursor(cursor) == (upload_date, "3f2a-row")
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(datetime(2024, 1, 1), "id/with+chars?")
+    assert "=" not in cursor
+    assert all(c.isalnum() or c in "-_" for c in cursor)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not a cursor",
+    "e30",  # {}
+    "WzFd",  # [1]
+    "WyJub3QtYS1kYXRlIiwiaWQiXQ",  # ["not-a-date","id"]
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
@@ -0,0 +1,134 @@
+# test_pregrade.py
+import pytest
+
+from api import pregrade
+from api.pregrade import (PreGrader, is_blank_answer, min_answer_words, minhash_signature,
+                          normalize_answer, strip_question_text)
+
+
+def words(count, start=0, prefix="word"):
+    return [f"{prefix}{i}" for i in range(start, start + count)]
+
+
+def answer(count=60, replace=None, prefix="word"):
+    """A long answer of distinct words, optionally with some of them swapped out."""
+    text = words(count, prefix=prefix)
+    for index, word in (replace or {}).items():
+        text[index] = word
+    return " ".join(text)
+
+
+def test_normalize_answer_ignores_case_punctuation_and_layout():
+    assert normalize_answer("  Photosynthesis,\nmakes  SUGAR! ") == "photosynthesis makes sugar"
+    assert normalize_answer(None) == ""
+    assert normalize_answer("--- ... ???") == ""
+
+
+def test_min_answer_words_only_applies_to_configured_types(monkeypatch):
+    monkeypatch.setattr(pregrade, "PREGRADE_MIN_WORDS", 5)
+    monkeypatch.setattr(pregrade, "PREGRADE_MIN_WORDS_TYPES", {"essay"})
+    assert min_answer_words("essay") == 5
+    assert min_answer_words("short_answer") == 1
+    assert min_answer_words(None) == 1
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Question printed on its own line, with or without a label
+    ("What is osmosis?\nWater moving across a membrane", "water moving across a membrane"),
+    ("Q1 What is osmosis?\nWater moving across a membrane", "water moving across a membrane"),
+    ("Question 2: What is osmosis?\nWater moving", "water moving"),
+    # OCR joined the question and answer into one line
+    ("What is osmosis? Water moving", "water moving"),
+    ("3. what is OSMOSIS water moving", "water moving"),
+    # Line wrapped differently from the stored question text
+    ("What is\nosmosis?\nWater moving", "water moving"),
+])
+def test_strip_question_text_removes_printed_question(text, expected):
+    assert strip_question_text(text, "What is osmosis?") == expected
+
+
+def test_strip_question_text_keeps_question_inside_answer():
+    text = "I was asked what is osmosis and it is water moving"
+    assert strip_question_text(text, "What is osmosis?") == normalize_answer(text)
+
+
+def test_strip_question_text_without_question():
+    assert strip_question_text("Water, moving.", None) == "water moving"
+    assert strip_question_text("Water moving", "") == "water moving"
+
+
+def test_is_blank_answer():
+    question = "Name the powerhouse of the cell."
+    assert is_blank_answer(None)
+    assert is_blank_answer("  \n .,;")
+    assert is_blank_answer("Q4 Name the powerhouse of the cell.", question)
+    assert not is_blank_answer("Mitochondria", question)
+    # A terse answer is only blank when a minimum is set for its question type
+    assert is_blank_answer("Mitochondria", question, min_words=3)
+    assert not is_blank_answer("The mitochondria, obviously", question, min_words=3)
+    assert not is_blank_answer("Mitochondria", question, min_words=0)
+
+
+def test_minhash_signature_is_deterministic():
+    text = words(30)
+    signature = minhash_signature(text)
+    assert signature.shape == (pregrade.MINHASH_PERMUTATIONS,)
+    assert (signature == minhash_signature(list(text))).all()
+    assert not (signature == minhash_signature(words(30, start=100))).all()
+
+
+def test_check_returns_shared_key_for_equivalent_answers():
+    grader = PreGrader(question_text="Explain diffusion.")
+    assert grader.check(1, "Particles SPREAD out.") == grader.check(2, "particles spread  out")
+    assert grader.check(3, "Explain diffusion.") is None
+    assert grader.check(4, "") is None
+
+
+def test_check_honours_min_words():
+    grader = PreGrader(min_words=3)
+    assert grader.check(1, "Yes") is None
+    assert grader.check(2, "Yes it does") == "yes it does"
+
+
+def test_near_duplicates_groups_similar_answers():
+    grader = PreGrader()
+    grader.check("a", answer())
+    grader.check("b", answer(replace={59: "changed"}))
+    grader.check("c", answer(replace={0: "changed"}))
+    grader.check("d", answer(prefix="unrelated"))
+    groups = grader.near_duplicates()
+    assert len(groups) == 1
+    assert groups[0]["submission_ids"] == ["a", "b", "c"]
+    assert 0.9 <= groups[0]["similarity"] < 1.0
+
+
+def test_near_duplicates_skips_short_answers():
+    grader = PreGrader()
+    short = answer(pregrade.NEAR_DUPLICATE_MIN_WORDS - 1)
+    grader.check("a", short)
+    grader.check("b", short)
+    assert grader.near_duplicates() == []
+
+
+def test_near_duplicates_orders_groups_by_similarity():
+    grader = PreGrader(similarity=0.5)
+    # One exact pair and one looser pair of unrelated answers
+    grader.check("x1", answer(prefix="x"))
+    grader.check("x2", answer(prefix="x"))
+    grader.check("y1", answer(prefix="y"))
+    grader.check("y2", answer(prefix="y", replace={10: "p", 30: "q", 50: "r"}))
+    groups = grader.near_duplicates()
+    assert [group["submission_ids"] for group in groups] == [["x1", "x2"], ["y1", "y2"]]
+    assert groups[0]["similarity"] == 1.0
+    assert groups[1]["similarity"] < 1.0
+
+
+def test_near_duplicates_joins_chains_into_one_group():
+    grader = PreGrader()
+    # a~b and b~c were similar enough but a~c wasn't; they still form one group,
+    # reported at its weakest link
+    grader._pairs = {("a", "b"): 0.95, ("b", "c"): 0.85, ("x", "y"): 0.9}
+    assert grader.near_duplicates() == [
+        {"submission_ids": ["x", "y"], "similarity": 0.9},
+        {"submission_ids": ["a", "b", "c"], "similarity": 0.85},
+    ]
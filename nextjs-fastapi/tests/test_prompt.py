@@ -0,0 +1,69 @@
+# test_prompt.py
+import math
+
+import pytest
+
+pytest.importorskip("langchain")
+pytest.importorskip("langchain_huggingface")
+
+import prompt  # noqa: E402
+from prompt import criterion_score, prompt_fingerprint, question_prompt, rubric_hash, score_evaluation  # noqa: E402
+
+
+@pytest.mark.parametrize("value, expected", [
+    (0, 0), (4, 4), (3.0, 3), ("2", 2), ("3.5", 3.5), (2.25, 2.25),
+])
+def test_criterion_score_accepts_numbers_in_range(value, expected):
+    assert criterion_score(value) == expected
+
+
+@pytest.mark.parametrize("value", [None, True, "", "three", [3], -1, 4.01, 9, "9", math.nan, math.inf])
+def test_criterion_score_rejects_other_values(value):
+    assert criterion_score(value) is None
+
+
+def test_score_evaluation_scales_without_truncating():
+    evaluation = score_evaluation({"accuracy": "3.5", "clarity": 4, "concepts": 2.5}, 12)
+    assert (evaluation["accuracy_score"], evaluation["clarity_score"], evaluation["concepts_score"]) == (3.5, 4, 2.5)
+    assert evaluation["scaled_total_score"] == 10.0
+
+
+def test_score_evaluation_counts_invalid_scores_as_zero():
+    assert score_evaluation({"accuracy": 9, "clarity": 9, "concepts": 9}, 10)["scaled_total_score"] == 0
+
+
+def test_grade_answer_rejects_out_of_range_scores(monkeypatch):
+    reply = '{"accuracy": 9, "clarity": 3, "concepts": 3, "comments": {}, "overall": ""}'
+    monkeypatch.setattr(prompt, "invoke_llm", lambda stage, text: reply)
+    with pytest.raises(ValueError, match="accuracy"):
+        prompt.grade_answer("Q?", 10, "A.", "B.", mode="single")
+
+
+def test_prompt_fingerprint_changes_with_prompt_inputs():
+    fingerprint = prompt_fingerprint("What is osmosis?", "Diffusion of water.", "single")
+    assert fingerprint == prompt_fingerprint("What is osmosis?", "Diffusion of water.", "single")
+    assert fingerprint == question_prompt("What is osmosis?", "Diffusion of water.", "single")["prompt_fingerprint"]
+    assert fingerprint != prompt_fingerprint("What is diffusion?", "Diffusion of water.", "single")
+    assert fingerprint != prompt_fingerprint("What is osmosis?", "Diffusion of solvent.", "single")
+    assert fingerprint != prompt_fingerprint("What is osmosis?", "Diffusion of water.", "two_stage")
+
+
+def test_rubric_changes_invalidate_fingerprints(monkeypatch):
+    fingerprint = prompt_fingerprint("What is osmosis?", "Diffusion of water.")
+    rubric = rubric_hash()
+    monkeypatch.setattr(prompt, "REFERENCE_KEY_POINTS", not prompt.REFERENCE_KEY_POINTS)
+    assert rubric_hash() != rubric
+    assert prompt_fingerprint("What is osmosis?", "Diffusion of water.") != fingerprint
+    monkeypatch.setitem(prompt.criteria, "clarity", "Score clarity from 0 to 4.")
+    monkeypatch.setattr(prompt, "REFERENCE_KEY_POINTS", not prompt.REFERENCE_KEY_POINTS)
+    assert rubric_hash() != rubric
+
+
+def test_question_prompt_sends_full_reference_by_default(monkeypatch):
+    monkeypatch.setattr(prompt, "REFERENCE_KEY_POINTS", False)
+    result = question_prompt("Q?", "First point. Second point.", "single")
+    assert "Reference Answer: First point. Second point." in result["prompt_prefix"]
+    assert result["key_points"] is None
+    monkeypatch.setattr(prompt, "REFERENCE_KEY_POINTS", True)
+    result = question_prompt("Q?", "First point. Second point.", "single")
+    assert result["key_points"] == ["First point.", "Second point."]
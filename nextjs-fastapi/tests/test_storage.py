@@ -0,0 +1,38 @@
+# test_storage.py
+import pytest
+
+from api.storage import InvalidRange, blob_key, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=900-2000", (900, 999)),  # End past the blob is cut to its size
+    ("bytes=-100", (900, 999)),  # Suffix range
+    ("bytes=-5000", (0, 999)),
+    ("bytes=999-999", (999, 999)),
+    (" bytes=0-1", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [None, "", "items=0-10", "bytes=0-10,20-30", "bytes=a-b", "bytes=-"])
+def test_parse_range_sends_whole_blob(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1000-1200", "bytes=50-10", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(InvalidRange) as e:
+        parse_range(header, 1000)
+    assert e.value.size == 1000
+
+
+def test_parse_range_empty_blob():
+    with pytest.raises(InvalidRange):
+        parse_range("bytes=0-", 0)
+
+
+def test_blob_key_is_sharded_by_hash_prefix():
+    assert blob_key("abcdef") == "pdfs/ab/abcdef.pdf"